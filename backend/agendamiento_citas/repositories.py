@@ -2,6 +2,7 @@
 from abc import ABC, abstractmethod
 from typing import List, Optional, Dict, Any
 from datetime import date, datetime, time
+from django.db.models import Q
 from .models import Cita, Recordatorio, Discapacidad
 from usuarios.models import Usuario
 
@@ -72,7 +73,9 @@ class AbstractRecordatorioRepository(ABC):
         pass
 
     @abstractmethod
-    def get_recordatorios_por_enviar(self) -> List['Recordatorio']:
+    def get_recordatorios_por_enviar(self, hasta: Optional[datetime] = None,
+                                     limite: Optional[int] = None) -> List['Recordatorio']:
+        """Recordatorios no enviados; si se indica `hasta`, solo los programados hasta ese momento."""
         pass
 
     @abstractmethod
@@ -148,8 +151,15 @@ class RecordatorioRepository(AbstractRecordatorioRepository):
     def get_recordatorios_by_paciente(self, paciente_id: int) -> List[Recordatorio]:
         return list(Recordatorio.objects.filter(paciente_id=paciente_id))
 
-    def get_recordatorios_por_enviar(self) -> List[Recordatorio]:
-        return list(Recordatorio.objects.filter(enviado=False))
+    def get_recordatorios_por_enviar(self, hasta: Optional[datetime] = None,
+                                     limite: Optional[int] = None) -> List[Recordatorio]:
+        recordatorios = Recordatorio.objects.filter(enviado=False)
+        if hasta is not None:
+            # Comparación por (fecha, hora) para aprovechar el índice de esas columnas
+            recordatorios = recordatorios.filter(
+                Q(fecha__lt=hasta.date()) | Q(fecha=hasta.date(), hora__lte=hasta.time())
+            ).order_by('fecha', 'hora')
+        return list(recordatorios[:limite] if limite else recordatorios)
 
     def marcar_recordatorio_enviado(self, recordatorio_id: int) -> bool:
         try:
@@ -296,8 +306,15 @@ class FakeRecordatorioRepository(AbstractRecordatorioRepository):
     def get_recordatorios_by_paciente(self, paciente_id: int) -> List[FakeRecordatorio]:
         return [r for r in self.recordatorios if r.paciente.id == paciente_id]
 
-    def get_recordatorios_por_enviar(self) -> List[FakeRecordatorio]:
-        return [r for r in self.recordatorios if not r.enviado]
+    def get_recordatorios_por_enviar(self, hasta: Optional[datetime] = None,
+                                     limite: Optional[int] = None) -> List[FakeRecordatorio]:
+        recordatorios = [r for r in self.recordatorios if not r.enviado]
+        if hasta is not None:
+            recordatorios = sorted(
+                (r for r in recordatorios if datetime.combine(r.fecha, r.hora) <= hasta),
+                key=lambda r: (r.fecha, r.hora)
+            )
+        return recordatorios[:limite] if limite else recordatorios
 
     def marcar_recordatorio_enviado(self, recordatorio_id: int) -> bool:
         recordatorio = self.get_recordatorio_by_id(recordatorio_id)
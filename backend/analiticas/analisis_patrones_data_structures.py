@@ -1,13 +1,51 @@
 # analiticas/analisis_patrones_data_structures.py
 
+from collections import Counter
 from dataclasses import dataclass, field
-from datetime import datetime
-from typing import Optional
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from django.utils import timezone as dj_timezone
+
+# Peso numérico de cada severidad para calcular la intensidad promedio
+VALORES_SEVERIDAD = {'Leve': 1, 'Moderada': 2, 'Severa': 3}
+
+# Columnas de EpisodioCefalea que necesita EpisodioData, en el orden que espera desde_fila
+CAMPOS_EPISODIO = (
+    'localizacion', 'caracter_dolor', 'empeora_actividad', 'severidad', 'nauseas_vomitos',
+    'fotofobia', 'fonofobia', 'presencia_aura', 'sintomas_aura', 'duracion_aura_minutos',
+    'duracion_cefalea_horas', 'en_menstruacion', 'anticonceptivos', 'categoria_diagnostica',
+    'creado_en', 'paciente_id', 'dia_semana',
+)
+
+# Columnas de LoteEpisodios: el ID del episodio seguido de las de EpisodioData
+CAMPOS_LOTE = ('id',) + CAMPOS_EPISODIO
+
+CAMPOS_BOOLEANOS = ('empeora_actividad', 'nauseas_vomitos', 'fotofobia', 'fonofobia',
+                    'presencia_aura', 'en_menstruacion', 'anticonceptivos')
+CAMPOS_CATEGORICOS = ('localizacion', 'caracter_dolor', 'severidad', 'sintomas_aura', 'categoria_diagnostica')
+
+# Columnas que lee MatrizSintomas: los síntomas y factores binarios seguidos de la severidad
+CAMPOS_SINTOMAS = ('nauseas_vomitos', 'fotofobia', 'fonofobia', 'presencia_aura', 'empeora_actividad',
+                   'en_menstruacion', 'anticonceptivos')
+CAMPOS_MATRIZ_SINTOMAS = CAMPOS_SINTOMAS + ('severidad',)
+
+# Días de la semana ISO (1 = lunes ... 7 = domingo). Los nombres solo se usan al presentar resultados
+DIAS_ISO = range(1, 8)
+NOMBRES_DIAS = {1: 'Lunes', 2: 'Martes', 3: 'Miércoles', 4: 'Jueves', 5: 'Viernes', 6: 'Sábado', 7: 'Domingo'}
+_DIAS_POR_NOMBRE = {nombre.lower(): dia for dia, nombre in NOMBRES_DIAS.items()}
 
 def _to_bool(value: str) -> bool:
     return str(value).lower() in ['sí', 'si', 'true']
 
-@dataclass
+def _dia_iso(valor) -> Optional[int]:
+    """Día ISO a partir de un número o de su nombre en español ('Lunes' -> 1)."""
+    if isinstance(valor, str):
+        return _DIAS_POR_NOMBRE.get(valor.strip().lower())
+    return valor
+
+@dataclass(slots=True)
 class EpisodioData:
     """
     Una clase de datos para representar la información de un episodio de cefalea.
@@ -26,14 +64,458 @@ class EpisodioData:
     en_menstruacion: bool = False
     anticonceptivos: bool = False
     categoria_diagnostica: str = 'No especificada'
-    dia: Optional[str] = None
+    dia: Optional[int] = None  # Día ISO de la semana (1 = lunes)
     fecha_creacion: datetime = field(default_factory=datetime.now)
     paciente_id: int = 0
 
-    # Convierte los valores de texto 'Sí'/'No' a booleanos al inicializar
+    # Convierte los valores de texto 'Sí'/'No' a booleanos y el nombre del día a su número ISO al inicializar
     def __post_init__(self):
-        for attr_name in ['empeora_actividad', 'nauseas_vomitos', 'fotofobia',
-                          'fonofobia', 'presencia_aura', 'en_menstruacion', 'anticonceptivos']:
+        for attr_name in CAMPOS_BOOLEANOS:
             valor_actual = getattr(self, attr_name)
             if isinstance(valor_actual, str):
                 setattr(self, attr_name, _to_bool(valor_actual))
+        if isinstance(self.dia, str):
+            self.dia = _dia_iso(self.dia)
+
+    @classmethod
+    def desde_modelo(cls, orm_obj) -> 'EpisodioData':
+        """Construye el EpisodioData a partir de un EpisodioCefalea del ORM."""
+        return cls(
+            localizacion=orm_obj.localizacion,
+            caracter_dolor=orm_obj.caracter_dolor,
+            empeora_actividad=bool(orm_obj.empeora_actividad),  # Aseguramos que sea un booleano
+            severidad=orm_obj.severidad,
+            nauseas_vomitos=bool(orm_obj.nauseas_vomitos),  # Aseguramos que sea un booleano
+            fotofobia=bool(orm_obj.fotofobia),  # Aseguramos que sea un booleano
+            fonofobia=bool(orm_obj.fonofobia),  # Aseguramos que sea un booleano
+            presencia_aura=bool(orm_obj.presencia_aura),  # Aseguramos que sea un booleano
+            sintomas_aura=orm_obj.sintomas_aura,
+            duracion_aura_minutos=orm_obj.duracion_aura_minutos,
+            duracion_cefalea_horas=float(orm_obj.duracion_cefalea_horas),
+            en_menstruacion=bool(orm_obj.en_menstruacion),  # Aseguramos que sea un booleano
+            anticonceptivos=bool(orm_obj.anticonceptivos),
+            categoria_diagnostica=orm_obj.categoria_diagnostica,
+            dia=dj_timezone.localtime(orm_obj.creado_en).isoweekday(),
+            fecha_creacion=orm_obj.creado_en,
+            paciente_id=orm_obj.paciente_id
+        )
+
+    @classmethod
+    def desde_fila(cls, fila) -> 'EpisodioData':
+        """
+        Construye el EpisodioData a partir de una fila de
+        values_list(*CAMPOS_EPISODIO), sin instanciar el modelo del ORM.
+        El día de la semana lo calcula la base de datos (anotación dia_semana).
+        """
+        (localizacion, caracter_dolor, empeora_actividad, severidad, nauseas_vomitos,
+         fotofobia, fonofobia, presencia_aura, sintomas_aura, duracion_aura_minutos,
+         duracion_cefalea_horas, en_menstruacion, anticonceptivos, categoria_diagnostica,
+         creado_en, paciente_id, dia_semana) = fila
+        return cls(
+            localizacion=localizacion,
+            caracter_dolor=caracter_dolor,
+            empeora_actividad=bool(empeora_actividad),
+            severidad=severidad,
+            nauseas_vomitos=bool(nauseas_vomitos),
+            fotofobia=bool(fotofobia),
+            fonofobia=bool(fonofobia),
+            presencia_aura=bool(presencia_aura),
+            sintomas_aura=sintomas_aura,
+            duracion_aura_minutos=duracion_aura_minutos,
+            duracion_cefalea_horas=float(duracion_cefalea_horas),
+            en_menstruacion=bool(en_menstruacion),
+            anticonceptivos=bool(anticonceptivos),
+            categoria_diagnostica=categoria_diagnostica,
+            dia=dia_semana,
+            fecha_creacion=creado_en,
+            paciente_id=paciente_id
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class VentanaEpisodios:
+    """
+    Episodios que considera un análisis: los `ultimos` N, los registrados entre
+    `desde` y `hasta` (ambas inclusive, cualquiera puede omitirse) o, sin
+    parámetros, el historial completo. Si se combinan, son los últimos N del rango.
+    """
+    ultimos: Optional[int] = None
+    desde: Optional[date] = None
+    hasta: Optional[date] = None
+
+    @property
+    def completa(self) -> bool:
+        return self.ultimos is None and self.desde is None and self.hasta is None
+
+    def como_parametros(self) -> Dict[str, str]:
+        """Parámetros definidos, para la clave de la caché."""
+        parametros = {'ultimos': self.ultimos, 'desde': self.desde, 'hasta': self.hasta}
+        return {nombre: str(valor) for nombre, valor in parametros.items() if valor is not None}
+
+    def aplicar(self, episodios: Iterable[EpisodioData]) -> List[EpisodioData]:
+        """Aplica la ventana en memoria; devuelve los episodios del más reciente al más antiguo."""
+        seleccion = sorted(episodios, key=lambda e: e.fecha_creacion, reverse=True)
+        if self.desde is not None:
+            seleccion = [e for e in seleccion if e.fecha_creacion.date() >= self.desde]
+        if self.hasta is not None:
+            seleccion = [e for e in seleccion if e.fecha_creacion.date() <= self.hasta]
+        if self.ultimos is not None:
+            seleccion = seleccion[:self.ultimos]
+        return seleccion
+
+
+def _contar(codigos: np.ndarray, etiquetas: Sequence, mascara: Optional[np.ndarray] = None) -> Counter:
+    """
+    Counter de las etiquetas de `codigos` (opcionalmente filtrados por `mascara`),
+    con las claves en orden de primera aparición, igual que al contar episodio
+    por episodio; most_common desempata por ese orden.
+    """
+    if mascara is not None:
+        codigos = codigos[mascara]
+    if not len(codigos):
+        return Counter()
+    conteos = np.bincount(codigos, minlength=len(etiquetas))
+    _, primeros = np.unique(codigos, return_index=True)
+    return Counter({etiquetas[codigo]: int(conteos[codigo]) for codigo in codigos[np.sort(primeros)]})
+
+
+class LoteEpisodios:
+    """
+    Episodios de un paciente en formato columnar, del más reciente al más
+    antiguo. Los booleanos son arreglos bool (1 byte por episodio) y los campos
+    de texto se guardan como códigos enteros pequeños sobre su vocabulario
+    (en orden de primera aparición). Permite resumir historiales completos sin
+    crear un objeto por episodio.
+    """
+    __slots__ = ('ids', 'paciente_id', 'booleanos', 'codigos', 'vocabularios',
+                 'duracion_aura_minutos', 'duracion_cefalea_horas', 'fechas', 'dias')
+
+    def __init__(self, filas: Iterable[Sequence]):
+        """Recibe filas de values_list(*CAMPOS_LOTE)."""
+        columnas = dict(zip(CAMPOS_LOTE, zip(*filas)))
+        total = len(columnas.get('id', ()))
+        self.ids = np.array(columnas.get('id', ()), dtype=np.int64)
+        self.paciente_id = columnas['paciente_id'][0] if total else 0
+        self.booleanos = {campo: np.array(columnas.get(campo, ()), dtype=bool) for campo in CAMPOS_BOOLEANOS}
+
+        self.codigos = {}
+        self.vocabularios = {}
+        for campo in CAMPOS_CATEGORICOS:
+            valores = columnas.get(campo, ())
+            indices = {}
+            for valor in valores:
+                indices.setdefault(valor, len(indices))
+            self.vocabularios[campo] = tuple(indices)
+            self.codigos[campo] = np.fromiter((indices[v] for v in valores),
+                                              dtype=np.min_scalar_type(max(len(indices) - 1, 0)), count=total)
+
+        self.duracion_aura_minutos = np.array(columnas.get('duracion_aura_minutos', ()), dtype=np.int16)
+        self.duracion_cefalea_horas = np.array(columnas.get('duracion_cefalea_horas', ()), dtype=np.float32)
+        # Fechas en UTC sin zona, con resolución de microsegundos
+        self.fechas = np.array([f.astimezone(timezone.utc).replace(tzinfo=None) for f in columnas.get('creado_en', ())],
+                               dtype='datetime64[us]')
+        # Día ISO de la semana calculado por la base de datos (1 = lunes)
+        self.dias = np.array(columnas.get('dia_semana', ()), dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria ocupada por las columnas."""
+        columnas = [self.ids, self.duracion_aura_minutos, self.duracion_cefalea_horas, self.fechas, self.dias,
+                    *self.booleanos.values(), *self.codigos.values()]
+        return sum(columna.nbytes for columna in columnas)
+
+    def _valor(self, campo: str, indice: int):
+        return self.vocabularios[campo][self.codigos[campo][indice]]
+
+    def _es(self, campo: str, valor) -> np.ndarray:
+        """Máscara de los episodios cuyo campo categórico vale `valor`."""
+        vocabulario = self.vocabularios[campo]
+        if valor not in vocabulario:
+            return np.zeros(len(self), dtype=bool)
+        return self.codigos[campo] == vocabulario.index(valor)
+
+    def _fecha(self, valor: np.datetime64) -> datetime:
+        return valor.astype(datetime).replace(tzinfo=timezone.utc)
+
+    def episodio(self, indice: int) -> EpisodioData:
+        """Materializa un episodio del lote."""
+        fecha = self._fecha(self.fechas[indice])
+        return EpisodioData(
+            localizacion=self._valor('localizacion', indice),
+            caracter_dolor=self._valor('caracter_dolor', indice),
+            empeora_actividad=bool(self.booleanos['empeora_actividad'][indice]),
+            severidad=self._valor('severidad', indice),
+            nauseas_vomitos=bool(self.booleanos['nauseas_vomitos'][indice]),
+            fotofobia=bool(self.booleanos['fotofobia'][indice]),
+            fonofobia=bool(self.booleanos['fonofobia'][indice]),
+            presencia_aura=bool(self.booleanos['presencia_aura'][indice]),
+            sintomas_aura=self._valor('sintomas_aura', indice),
+            duracion_aura_minutos=int(self.duracion_aura_minutos[indice]),
+            duracion_cefalea_horas=float(self.duracion_cefalea_horas[indice]),
+            en_menstruacion=bool(self.booleanos['en_menstruacion'][indice]),
+            anticonceptivos=bool(self.booleanos['anticonceptivos'][indice]),
+            categoria_diagnostica=self._valor('categoria_diagnostica', indice),
+            dia=int(self.dias[indice]),
+            fecha_creacion=fecha,
+            paciente_id=self.paciente_id
+        )
+
+    def mascara_tipos_aura(self) -> np.ndarray:
+        """Episodios con aura y síntomas de aura especificados."""
+        sintomas_validos = np.array([bool(s) and s != "Ninguno" for s in self.vocabularios['sintomas_aura']],
+                                    dtype=bool)
+        return self.booleanos['presencia_aura'] & sintomas_validos[self.codigos['sintomas_aura']]
+
+    def conteo_tipos_aura(self) -> Counter:
+        """Episodios por tipo de aura (síntomas en minúsculas), como ResumenAnaliticoPaciente._tipo_aura."""
+        conteo = Counter()
+        etiquetas = self.vocabularios['sintomas_aura']
+        for sintomas, episodios in _contar(self.codigos['sintomas_aura'], etiquetas, self.mascara_tipos_aura()).items():
+            conteo[sintomas.lower()] += episodios
+        return conteo
+
+    def resumen(self) -> 'ResumenEpisodios':
+        """Calcula el ResumenEpisodios del lote con operaciones sobre columnas."""
+        resumen = ResumenEpisodios(total=len(self))
+        if not len(self):
+            return resumen
+        b = self.booleanos
+
+        resumen.ultimo = self.episodio(0)
+        resumen.localizaciones = _contar(self.codigos['localizacion'], self.vocabularios['localizacion'])
+        resumen.caracteres = _contar(self.codigos['caracter_dolor'], self.vocabularios['caracter_dolor'])
+        resumen.empeora_actividad = int(b['empeora_actividad'].sum())
+
+        # Síntomas en orden de primera aparición; dentro de un episodio, en el orden de agregar
+        nombres = ("náuseas y/o vómitos", "fotofobia (sensibilidad a la luz)", "fonofobia (sensibilidad al sonido)")
+        mascaras = (b['nauseas_vomitos'], b['fotofobia'], b['fonofobia'])
+        presentes = [(int(m.argmax()), orden) for orden, m in enumerate(mascaras) if m.any()]
+        resumen.sintomas = Counter({nombres[orden]: int(mascaras[orden].sum()) for _, orden in sorted(presentes)})
+
+        severos = self._es('severidad', "Severa")
+        resumen.severos = int(severos.sum())
+        resumen.nauseas_en_severos = int((severos & b['nauseas_vomitos']).sum())
+
+        con_aura = b['presencia_aura']
+        resumen.con_aura = int(con_aura.sum())
+        if resumen.con_aura:
+            resumen.ultimo_con_aura = self.episodio(int(con_aura.argmax()))
+            resumen.tipos_aura = set(self.conteo_tipos_aura())
+            duraciones = self.duracion_aura_minutos[con_aura]
+            resumen.duracion_aura_min = int(duraciones.min())
+            resumen.duracion_aura_max = int(duraciones.max())
+
+        resumen.dias = _contar(self.dias, range(8))
+
+        migranas = np.array(["Migraña" in c for c in self.vocabularios['categoria_diagnostica']], dtype=bool)
+        resumen.menstruales = int(b['en_menstruacion'].sum())
+        resumen.migranas_menstruales = int((b['en_menstruacion'] & migranas[self.codigos['categoria_diagnostica']]).sum())
+        resumen.anticonceptivos = int(b['anticonceptivos'].sum())
+
+        resumen.severidades = _contar(self.codigos['severidad'], self.vocabularios['severidad'])
+        resumen.duracion_total = float(self.duracion_cefalea_horas.sum(dtype=np.float64))
+        resumen.fecha_primer_episodio = self._fecha(self.fechas.min())
+        resumen.fecha_ultimo_episodio = self._fecha(self.fechas.max())
+        return resumen
+
+
+class MatrizSintomas:
+    """
+    Matriz binaria episodios × características (síntomas, factores hormonales y
+    un indicador por nivel de severidad) de uno o varios pacientes. Cada fila
+    puede representar varios episodios idénticos (`pesos`), así que basta con
+    una fila por combinación distinta. Las coocurrencias y la correlación phi
+    de todos los pares se calculan con productos de matrices.
+    """
+    __slots__ = ('matriz', 'pesos')
+
+    CARACTERISTICAS = CAMPOS_SINTOMAS + tuple(f'severidad_{s.lower()}' for s in VALORES_SEVERIDAD)
+
+    def __init__(self, filas: Iterable[Sequence], pesos: Optional[Sequence[int]] = None):
+        """Recibe filas de values_list(*CAMPOS_MATRIZ_SINTOMAS) y, opcionalmente, los episodios de cada una."""
+        columnas = list(zip(*filas)) or [()] * len(CAMPOS_MATRIZ_SINTOMAS)
+        severidades = np.array(columnas[-1], dtype=object)
+        self.matriz = np.column_stack(
+            [np.array(columna, dtype=bool) for columna in columnas[:-1]]
+            + [severidades == severidad for severidad in VALORES_SEVERIDAD]
+        ).reshape(len(severidades), len(self.CARACTERISTICAS))
+        self.pesos = (np.ones(len(severidades), dtype=np.int64) if pesos is None
+                      else np.array(pesos, dtype=np.int64))
+
+    @classmethod
+    def desde_conteos(cls, filas: Iterable[Sequence]) -> 'MatrizSintomas':
+        """Filas de una consulta agrupada por CAMPOS_MATRIZ_SINTOMAS, con el número de episodios al final."""
+        filas = list(filas)
+        return cls([fila[:-1] for fila in filas], [fila[-1] for fila in filas])
+
+    @classmethod
+    def desde_episodios(cls, episodios: Iterable[EpisodioData]) -> 'MatrizSintomas':
+        return cls([getattr(e, campo) for campo in CAMPOS_MATRIZ_SINTOMAS] for e in episodios)
+
+    def __len__(self) -> int:
+        """Número de episodios (no de filas)."""
+        return int(self.pesos.sum())
+
+    def coocurrencias(self) -> np.ndarray:
+        """Episodios en que aparecen juntas cada par de características; la diagonal es la frecuencia."""
+        x = self.matriz.astype(np.float64)
+        return ((x.T * self.pesos) @ x).astype(np.int64)
+
+    def correlaciones_phi(self) -> np.ndarray:
+        """
+        Coeficiente phi de cada par (la correlación de Pearson entre dos
+        variables binarias). Es NaN si alguna de las dos no varía.
+        """
+        total = len(self)
+        conjuntas = self.coocurrencias().astype(np.float64)
+        frecuencias = np.diag(conjuntas)
+        numerador = total * conjuntas - np.outer(frecuencias, frecuencias)
+        varianzas = frecuencias * (total - frecuencias)
+        denominador = np.sqrt(np.outer(varianzas, varianzas))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(denominador > 0, numerador / denominador, np.nan)
+
+    def como_dict(self, decimales: int = 3) -> Dict[str, Any]:
+        """Matrices como listas en el orden de CARACTERISTICAS; phi indefinido es None."""
+        coocurrencias = self.coocurrencias()
+        phi = np.round(self.correlaciones_phi(), decimales)
+        return {
+            'total_episodios': len(self),
+            'caracteristicas': list(self.CARACTERISTICAS),
+            'frecuencias': dict(zip(self.CARACTERISTICAS, np.diag(coocurrencias).tolist())),
+            'coocurrencias': coocurrencias.tolist(),
+            'correlaciones_phi': [[None if np.isnan(v) else float(v) for v in fila] for fila in phi],
+        }
+
+
+@dataclass
+class ResumenEpisodios:
+    """
+    Acumulador con todos los contadores que necesita el análisis de patrones.
+    Se construye en una sola pasada sobre los episodios de un paciente
+    (ordenados del más reciente al más antiguo).
+    """
+    total: int = 0
+    ultimo: Optional[EpisodioData] = None
+
+    # Características diagnósticas
+    localizaciones: Counter = field(default_factory=Counter)
+    caracteres: Counter = field(default_factory=Counter)
+    empeora_actividad: int = 0
+
+    # Síntomas asociados
+    sintomas: Counter = field(default_factory=Counter)
+    severos: int = 0
+    nauseas_en_severos: int = 0
+
+    # Aura
+    con_aura: int = 0
+    ultimo_con_aura: Optional[EpisodioData] = None
+    tipos_aura: set = field(default_factory=set)
+    duracion_aura_min: Optional[int] = None
+    duracion_aura_max: Optional[int] = None
+
+    # Recurrencia semanal: {día ISO: episodios}
+    dias: Counter = field(default_factory=Counter)
+
+    # Patrón hormonal
+    menstruales: int = 0
+    migranas_menstruales: int = 0
+    anticonceptivos: int = 0
+
+    # Estadísticas del historial
+    severidades: Counter = field(default_factory=Counter)
+    duracion_total: float = 0.0
+    fecha_primer_episodio: Optional[datetime] = None
+    fecha_ultimo_episodio: Optional[datetime] = None
+
+    @classmethod
+    def desde_episodios(cls, episodios: Iterable[EpisodioData]) -> 'ResumenEpisodios':
+        resumen = cls()
+        for episodio in episodios:
+            resumen.agregar(episodio)
+        return resumen
+
+    def agregar(self, e: EpisodioData):
+        """Incorpora un episodio a todos los contadores."""
+        if self.ultimo is None:
+            self.ultimo = e
+        self.total += 1
+
+        self.localizaciones[e.localizacion] += 1
+        self.caracteres[e.caracter_dolor] += 1
+        if e.empeora_actividad:
+            self.empeora_actividad += 1
+
+        # Mismo orden de inserción que el análisis por listas para desempatar igual
+        if e.nauseas_vomitos:
+            self.sintomas["náuseas y/o vómitos"] += 1
+        if e.fotofobia:
+            self.sintomas["fotofobia (sensibilidad a la luz)"] += 1
+        if e.fonofobia:
+            self.sintomas["fonofobia (sensibilidad al sonido)"] += 1
+
+        if e.severidad == "Severa":
+            self.severos += 1
+            if e.nauseas_vomitos:
+                self.nauseas_en_severos += 1
+
+        if e.presencia_aura:
+            self.con_aura += 1
+            if self.ultimo_con_aura is None:
+                self.ultimo_con_aura = e
+            if e.sintomas_aura and e.sintomas_aura != "Ninguno":
+                self.tipos_aura.add(e.sintomas_aura.lower())
+            duracion = int(e.duracion_aura_minutos)
+            if self.duracion_aura_min is None or duracion < self.duracion_aura_min:
+                self.duracion_aura_min = duracion
+            if self.duracion_aura_max is None or duracion > self.duracion_aura_max:
+                self.duracion_aura_max = duracion
+
+        if e.dia:
+            self.dias[e.dia] += 1
+
+        if e.en_menstruacion:
+            self.menstruales += 1
+            if "Migraña" in e.categoria_diagnostica:
+                self.migranas_menstruales += 1
+        if e.anticonceptivos:
+            self.anticonceptivos += 1
+
+        self.severidades[e.severidad] += 1
+        self.duracion_total += e.duracion_cefalea_horas
+        if self.fecha_primer_episodio is None or e.fecha_creacion < self.fecha_primer_episodio:
+            self.fecha_primer_episodio = e.fecha_creacion
+        if self.fecha_ultimo_episodio is None or e.fecha_creacion > self.fecha_ultimo_episodio:
+            self.fecha_ultimo_episodio = e.fecha_creacion
+
+    def agregar_mas_reciente(self, e: EpisodioData):
+        """Incorpora un episodio recién registrado, que pasa a ser el último."""
+        self.agregar(e)
+        self.ultimo = e
+        if e.presencia_aura:
+            self.ultimo_con_aura = e
+
+    def histograma_dias(self) -> Dict[int, int]:
+        """Episodios por día ISO de la semana, con los 7 días aunque no tengan episodios."""
+        return {dia: self.dias.get(dia, 0) for dia in DIAS_ISO}
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """
+        Agregados para las estadísticas del historial, con el mismo formato
+        que DjangoAnalisisPatronesRepository.obtener_estadisticas_agregadas.
+        """
+        suma_severidad = sum(VALORES_SEVERIDAD[s] * n for s, n in self.severidades.items() if s in VALORES_SEVERIDAD)
+        episodios_validos = sum(n for s, n in self.severidades.items() if s in VALORES_SEVERIDAD)
+        return {
+            "total": self.total,
+            "duracion_promedio": self.duracion_total / self.total if self.total else None,
+            "severidad_promedio": suma_severidad / episodios_validos if episodios_validos else None,
+            "episodios_menstruacion": self.menstruales,
+            "episodios_anticonceptivos": self.anticonceptivos,
+            "primer_episodio": self.fecha_primer_episodio,
+            "ultimo_episodio": self.fecha_ultimo_episodio,
+        }
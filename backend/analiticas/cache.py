@@ -0,0 +1,178 @@
+# analiticas/cache.py
+"""
+Caché de resultados de los endpoints de analíticas.
+
+Los resultados de un paciente solo cambian cuando registra un nuevo episodio,
+así que cada entrada se guarda con la clave (paciente, endpoint, parámetros,
+versión). La versión vive en ResumenAnaliticoPaciente y aumenta en
+`registrar_nuevo_episodio`, por lo que las entradas anteriores dejan de
+consultarse sin necesidad de borrarlas explícitamente.
+
+El backend se elige con el setting ANALITICAS_CACHE:
+- 'local': LRU en memoria de cada worker de gunicorn.
+- 'django': caché compartida de Django (CACHES), común a todos los workers.
+"""
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import ResumenAnaliticoPaciente
+
+
+class BackendCacheAnaliticas(ABC):
+    """Almacenamiento de las entradas y de los contadores de aciertos/fallos."""
+    nombre = ''
+
+    @abstractmethod
+    def obtener(self, clave: str) -> Optional[Any]:
+        pass
+
+    @abstractmethod
+    def guardar(self, clave: str, valor: Any):
+        pass
+
+    @abstractmethod
+    def registrar(self, acierto: bool):
+        pass
+
+    @abstractmethod
+    def contadores(self) -> Dict[str, int]:
+        pass
+
+
+class CacheLocalLRU(BackendCacheAnaliticas):
+    """LRU acotado en memoria del proceso. Los contadores son por worker."""
+    nombre = 'local'
+
+    def __init__(self, max_entradas: int = 1024):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._aciertos = 0
+        self._fallos = 0
+
+    def obtener(self, clave):
+        with self._lock:
+            if clave not in self._entradas:
+                return None
+            self._entradas.move_to_end(clave)
+            return self._entradas[clave]
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._entradas[clave] = valor
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def registrar(self, acierto):
+        with self._lock:
+            if acierto:
+                self._aciertos += 1
+            else:
+                self._fallos += 1
+
+    def contadores(self):
+        with self._lock:
+            return {'aciertos': self._aciertos, 'fallos': self._fallos, 'entradas': len(self._entradas)}
+
+
+class CacheCompartidaDjango(BackendCacheAnaliticas):
+    """
+    Usa una caché de Django. Con un backend compartido (Redis, Memcached,
+    base de datos) las entradas y los contadores son comunes a todos los workers.
+    """
+    nombre = 'django'
+    CLAVE_ACIERTOS = 'analiticas:cache:aciertos'
+    CLAVE_FALLOS = 'analiticas:cache:fallos'
+
+    def __init__(self, alias: str = 'default', timeout: Optional[int] = 3600):
+        self._cache = caches[alias]
+        self.timeout = timeout
+
+    def obtener(self, clave):
+        return self._cache.get(clave)
+
+    def guardar(self, clave, valor):
+        self._cache.set(clave, valor, self.timeout)
+
+    def registrar(self, acierto):
+        clave = self.CLAVE_ACIERTOS if acierto else self.CLAVE_FALLOS
+        # add no hace nada si el contador ya existe; incr es atómico en backends compartidos
+        self._cache.add(clave, 0, timeout=None)
+        self._cache.incr(clave)
+
+    def contadores(self):
+        valores = self._cache.get_many([self.CLAVE_ACIERTOS, self.CLAVE_FALLOS])
+        return {
+            'aciertos': valores.get(self.CLAVE_ACIERTOS, 0),
+            'fallos': valores.get(self.CLAVE_FALLOS, 0),
+        }
+
+
+class CacheAnaliticas:
+    """Resuelve la versión del paciente y consulta el backend configurado."""
+
+    def __init__(self, backend: BackendCacheAnaliticas):
+        self.backend = backend
+
+    @staticmethod
+    def version(paciente_id: int) -> int:
+        """Versión de los episodios del paciente (0 si aún no tiene resumen)."""
+        version = (ResumenAnaliticoPaciente.objects
+                   .filter(paciente_id=paciente_id)
+                   .values_list('version', flat=True)
+                   .first())
+        return version or 0
+
+    @staticmethod
+    def clave(paciente_id: int, endpoint: str, params: Dict[str, Any], version: int) -> str:
+        parametros = urlencode(sorted((params or {}).items()))
+        return f"analiticas:{endpoint}:{paciente_id}:v{version}:{parametros}"
+
+    def obtener_o_calcular(self, paciente_id: int, endpoint: str, params: Dict[str, Any],
+                           calcular: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Devuelve (resultado, acierto). Si no hay entrada para la versión
+        actual del paciente, ejecuta `calcular` y guarda su resultado.
+        """
+        clave = self.clave(paciente_id, endpoint, params, self.version(paciente_id))
+        resultado = self.backend.obtener(clave)
+        acierto = resultado is not None
+        self.backend.registrar(acierto)
+        if not acierto:
+            resultado = calcular()
+            self.backend.guardar(clave, resultado)
+        return resultado, acierto
+
+    def estadisticas(self) -> Dict[str, Any]:
+        contadores = self.backend.contadores()
+        consultas = contadores['aciertos'] + contadores['fallos']
+        return {
+            'backend': self.backend.nombre,
+            'worker': os.getpid(),
+            **contadores,
+            'tasa_aciertos': round(contadores['aciertos'] / consultas, 3) if consultas else 0.0,
+        }
+
+
+def crear_cache_analiticas() -> CacheAnaliticas:
+    """Construye la caché a partir del setting ANALITICAS_CACHE."""
+    config = getattr(settings, 'ANALITICAS_CACHE', {})
+    tipo = config.get('BACKEND', 'local')
+    if tipo == 'django':
+        backend = CacheCompartidaDjango(config.get('ALIAS', 'default'), config.get('TIMEOUT', 3600))
+    elif tipo == 'local':
+        backend = CacheLocalLRU(config.get('MAX_ENTRIES', 1024))
+    else:
+        raise ValueError(f"Backend de caché de analíticas no soportado: {tipo}")
+    return CacheAnaliticas(backend)
+
+
+cache_analiticas = crear_cache_analiticas()
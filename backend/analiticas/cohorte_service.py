@@ -0,0 +1,66 @@
+# analiticas/cohorte_service.py
+from collections import Counter
+from typing import Any, Dict, List, Sequence
+from usuarios.models import Usuario
+from .analisis_patrones_data_structures import VALORES_SEVERIDAD
+
+
+class CohorteMedicoService:
+    """
+    Resumen de la bitácora de los pacientes de un médico, para revisar su
+    panel completo sin consultar las estadísticas de cada paciente.
+    """
+
+    def __init__(self, repository=None):
+        if repository is None:
+            from .repositories import DjangoAnalisisPatronesRepository
+            self.repository = DjangoAnalisisPatronesRepository()
+        else:
+            self.repository = repository
+
+    def resumir_pacientes(self, pacientes: Sequence[Usuario]) -> List[Dict[str, Any]]:
+        """
+        Una fila por paciente, en el mismo orden. Los agregados de todos los
+        pacientes se calculan juntos si el repositorio lo soporta; si no, se
+        recorren los episodios de cada uno.
+        """
+        paciente_ids = [paciente.pk for paciente in pacientes]
+        agregados = self.repository.obtener_agregados_cohorte(paciente_ids)
+        if agregados is None:
+            agregados = {paciente_id: self._agregar_en_memoria(paciente_id) for paciente_id in paciente_ids}
+        return [self._fila(paciente, agregados.get(paciente.pk)) for paciente in pacientes]
+
+    def _agregar_en_memoria(self, paciente_id: int) -> Dict[str, Any]:
+        """Mismos agregados que DjangoAnalisisPatronesRepository.obtener_agregados_cohorte."""
+        total, duracion_total, ultimo_episodio = 0, 0.0, None
+        severidades, categorias = Counter(), Counter()
+        for episodio in self.repository.iterar_episodios(paciente_id):
+            total += 1
+            duracion_total += episodio.duracion_cefalea_horas
+            severidades[episodio.severidad] += 1
+            categorias[episodio.categoria_diagnostica] += 1
+            if ultimo_episodio is None or episodio.fecha_creacion > ultimo_episodio:
+                ultimo_episodio = episodio.fecha_creacion
+        return {
+            'total': total,
+            'duracion_promedio': duracion_total / total if total else None,
+            'ultimo_episodio': ultimo_episodio,
+            'severidades': {severidad: severidades[severidad] for severidad in VALORES_SEVERIDAD},
+            'categorias': dict(sorted(categorias.items(), key=lambda c: (-c[1], c[0]))),
+        }
+
+    @staticmethod
+    def _fila(paciente: Usuario, agregados) -> Dict[str, Any]:
+        if not agregados:
+            agregados = {'total': 0, 'duracion_promedio': None, 'ultimo_episodio': None,
+                         'severidades': dict.fromkeys(VALORES_SEVERIDAD, 0), 'categorias': {}}
+        duracion = agregados['duracion_promedio']
+        return {
+            'paciente_id': paciente.pk,
+            'nombre': paciente.get_full_name(),
+            'total_episodios': agregados['total'],
+            'duracion_promedio': round(float(duracion), 1) if duracion is not None else None,
+            'distribucion_severidad': agregados['severidades'],
+            'categorias_diagnosticas': agregados['categorias'],
+            'fecha_ultimo_episodio': agregados['ultimo_episodio'],
+        }
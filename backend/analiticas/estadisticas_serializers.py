@@ -61,3 +61,55 @@ class PromediaSemanalRequestSerializer(serializers.Serializer):
         required=False,
         help_text="Fecha de fin del período a analizar"
     )
+
+
+class VentanaAnaliticaSerializer(serializers.Serializer):
+    """
+    Parámetros opcionales que limitan los episodios analizados.
+    Sin parámetros se analiza el historial completo.
+    """
+    ultimos = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        help_text="Analizar solo los últimos N episodios"
+    )
+    desde = serializers.DateField(
+        required=False,
+        help_text="Analizar los episodios registrados desde esta fecha (inclusive)"
+    )
+    hasta = serializers.DateField(
+        required=False,
+        help_text="Analizar los episodios registrados hasta esta fecha (inclusive)"
+    )
+
+    def validate(self, data):
+        if data.get('desde') and data.get('hasta') and data['desde'] > data['hasta']:
+            raise serializers.ValidationError("'desde' no puede ser posterior a 'hasta'.")
+        return data
+
+
+class CohortePacienteSerializer(serializers.Serializer):
+    """
+    Resumen de la bitácora de un paciente dentro de la cohorte de un médico.
+    """
+    paciente_id = serializers.IntegerField()
+    nombre = serializers.CharField()
+    total_episodios = serializers.IntegerField(
+        help_text="Total de episodios registrados"
+    )
+    duracion_promedio = serializers.FloatField(
+        allow_null=True,
+        help_text="Duración promedio por episodio en horas"
+    )
+    distribucion_severidad = serializers.DictField(
+        child=serializers.IntegerField(),
+        help_text="Episodios por severidad (Leve, Moderada, Severa)"
+    )
+    categorias_diagnosticas = serializers.DictField(
+        child=serializers.IntegerField(),
+        help_text="Episodios por categoría diagnóstica, de la más a la menos frecuente"
+    )
+    fecha_ultimo_episodio = serializers.DateTimeField(
+        allow_null=True,
+        help_text="Fecha del último episodio registrado"
+    )
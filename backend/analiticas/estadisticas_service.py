@@ -1,10 +1,11 @@
 # analiticas/estadisticas_service.py
-from typing import List, Dict, Any
-from datetime import datetime, timedelta
+from collections import Counter
+from typing import List, Dict, Any, Optional
+from datetime import date, datetime, timedelta
 from django.core.exceptions import ValidationError
 from django.db import transaction
 from usuarios.models import Usuario
-from .analisis_patrones_data_structures import EpisodioData
+from .analisis_patrones_data_structures import EpisodioData, ResumenEpisodios, VentanaEpisodios, VALORES_SEVERIDAD
 
 
 class EstadisticasHistorialService:
@@ -27,15 +28,12 @@ class EstadisticasHistorialService:
         """
         Calcula el promedio semanal de episodios entre dos fechas.
         """
-        episodios = self.repository.obtener_episodios_por_paciente(paciente_id)
-        
-        # Filtrar episodios en el rango de fechas
-        episodios_en_rango = [
-            ep for ep in episodios 
-            if fecha_inicio.date() <= ep.fecha_creacion.date() <= fecha_fin.date()
-        ]
-        
-        total_episodios = len(episodios_en_rango)
+        # El conteo se hace en la base de datos si el repositorio lo soporta
+        total_episodios = self.repository.contar_episodios_en_rango(
+            paciente_id, fecha_inicio.date(), fecha_fin.date()
+        )
+        if total_episodios is None:
+            total_episodios = len(self._episodios_en_rango(paciente_id, fecha_inicio, fecha_fin))
         
         # Calcular número de semanas en el período
         delta_dias = (fecha_fin.date() - fecha_inicio.date()).days
@@ -46,6 +44,43 @@ class EstadisticasHistorialService:
             
         return round(total_episodios / semanas, 1)
 
+    def calcular_serie_semanal(self, paciente_id: int, fecha_inicio: datetime,
+                               fecha_fin: datetime) -> List[Dict[str, Any]]:
+        """
+        Calcula el número de episodios de cada semana (de lunes a domingo)
+        entre dos fechas. Incluye las semanas sin episodios para graficar.
+        """
+        conteos = self.repository.contar_episodios_por_semana(
+            paciente_id, fecha_inicio.date(), fecha_fin.date()
+        )
+        if conteos is None:
+            conteos = Counter(
+                self._inicio_semana(ep.fecha_creacion.date())
+                for ep in self._episodios_en_rango(paciente_id, fecha_inicio, fecha_fin)
+            ).items()
+        episodios_por_semana = dict(conteos)
+
+        serie = []
+        semana = self._inicio_semana(fecha_inicio.date())
+        while semana <= fecha_fin.date():
+            serie.append({"semana": semana, "episodios": episodios_por_semana.get(semana, 0)})
+            semana += timedelta(weeks=1)
+        return serie
+
+    def _episodios_en_rango(self, paciente_id: int, fecha_inicio: datetime,
+                            fecha_fin: datetime) -> List[EpisodioData]:
+        """Filtra en memoria los episodios entre dos fechas (ambas inclusive)."""
+        episodios = self.repository.obtener_episodios_por_paciente(paciente_id)
+        return [
+            ep for ep in episodios
+            if fecha_inicio.date() <= ep.fecha_creacion.date() <= fecha_fin.date()
+        ]
+
+    @staticmethod
+    def _inicio_semana(fecha: date) -> date:
+        """Lunes de la semana de la fecha, igual que TruncWeek."""
+        return fecha - timedelta(days=fecha.weekday())
+
     def calcular_duracion_promedio(self, paciente_id: int) -> float:
         """
         Calcula la duración promedio de episodios en horas.
@@ -67,22 +102,26 @@ class EstadisticasHistorialService:
         if not episodios:
             return "No hay datos"
             
-        # Mapeo de severidad a valores numéricos
-        valores_severidad = {'Leve': 1, 'Moderada': 2, 'Severa': 3}
-        
         suma_severidad = 0
         episodios_validos = 0
         
         for ep in episodios:
-            if ep.severidad in valores_severidad:
-                suma_severidad += valores_severidad[ep.severidad]
+            if ep.severidad in VALORES_SEVERIDAD:
+                suma_severidad += VALORES_SEVERIDAD[ep.severidad]
                 episodios_validos += 1
         
         if episodios_validos == 0:
             return "No hay datos"
             
-        promedio = suma_severidad / episodios_validos
-        
+        return self._intensidad_desde_promedio(suma_severidad / episodios_validos)
+
+    def _intensidad_desde_promedio(self, promedio) -> str:
+        """
+        Convierte el promedio numérico de severidad a texto.
+        """
+        if promedio is None:
+            return "No hay datos"
+
         # Convertir de vuelta a texto (usando formas masculinas para compatibilidad con feature)
         if promedio <= 1.5:
             return "Leve"
@@ -119,6 +158,50 @@ class EstadisticasHistorialService:
         episodios = self.repository.obtener_episodios_por_paciente(paciente_id)
         return len(episodios) >= minimos
 
+    def calcular_estadisticas_historial(self, paciente_id: int,
+                                        ventana: Optional[VentanaEpisodios] = None) -> Dict[str, Any]:
+        """
+        Calcula todas las estadísticas del historial (o de la ventana indicada) de una sola vez.
+
+        Si el repositorio puede agregar en la base de datos se usa una única
+        consulta; si no (p. ej. el repositorio fake), se calcula en memoria.
+
+        Returns:
+            Dict con las estadísticas presentes (ver EstadisticasHistorialSerializer)
+        """
+        agregados = self.repository.obtener_estadisticas_agregadas(paciente_id, ventana)
+        if agregados is None:
+            agregados = self._agregar_en_memoria(paciente_id, ventana)
+
+        total = agregados['total']
+        resultados = {"total_episodios": total}
+        if not total:
+            resultados["porcentaje_menstruacion"] = 0.0
+            resultados["porcentaje_anticonceptivos"] = 0.0
+            return resultados
+
+        duracion_promedio = round(float(agregados['duracion_promedio'] or 0), 1)
+        if duracion_promedio > 0:
+            resultados["duracion_promedio"] = duracion_promedio
+
+        intensidad_promedio = self._intensidad_desde_promedio(agregados['severidad_promedio'])
+        if intensidad_promedio != "No hay datos":
+            resultados["intensidad_promedio"] = intensidad_promedio
+
+        resultados["porcentaje_menstruacion"] = round((agregados['episodios_menstruacion'] / total) * 100, 1)
+        resultados["porcentaje_anticonceptivos"] = round((agregados['episodios_anticonceptivos'] / total) * 100, 1)
+        resultados["fecha_primer_episodio"] = agregados['primer_episodio'].date()
+        resultados["fecha_ultimo_episodio"] = agregados['ultimo_episodio'].date()
+        return resultados
+
+    def _agregar_en_memoria(self, paciente_id: int, ventana: Optional[VentanaEpisodios] = None) -> Dict[str, Any]:
+        """
+        Calcula los mismos agregados que el repositorio Django, acumulando
+        los episodios a medida que se recorren.
+        """
+        episodios = self.repository.iterar_episodios(paciente_id, ventana)
+        return ResumenEpisodios.desde_episodios(episodios).estadisticas()
+
     def calcular_evolucion_midas(self, promedio_puntuacion: float, puntuacion_actual: float) -> Dict[str, Any]:
         """
         Calcula la evolución de la puntuación MIDAS.
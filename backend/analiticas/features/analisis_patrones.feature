@@ -102,4 +102,29 @@ Esquema del escenario: Detección de un posible patrón de migraña menstrual
 
     Ejemplos:
       | mensaje_conclusion_hormonal                                                                                                                                                                             |
-      | "Hemos detectado que una parte significativa de tus episodios de migraña ocurren durante tu menstruación. Esto podría indicar un patrón de 'migraña menstrual'. Te recomendamos conversar sobre este patrón con tu médico." |
\ No newline at end of file
+      | "Hemos detectado que una parte significativa de tus episodios de migraña ocurren durante tu menstruación. Esto podría indicar un patrón de 'migraña menstrual'. Te recomendamos conversar sobre este patrón con tu médico." |
+Escenario: Análisis completo de patrones con una sola lectura de la bitácora
+    Dado que el paciente ha registrado los siguientes episodios
+      | localizacion | caracter_dolor | empeora_actividad | severidad  | nauseas_vomitos | fonofobia | presencia_aura | sintomas_aura | duracion_aura_minutos | dia       |
+      | "Unilateral" | "Pulsátil"     | "Sí"              | "Severa"   | "Sí"            | "Sí"      | "Sí"           | "Visuales"    | 20                    | "Lunes"   |
+      | "Unilateral" | "Pulsátil"     | "Sí"              | "Moderada" | "No"            | "Sí"      | "No"           | "Ninguno"     | 0                     | "Viernes" |
+      | "Bilateral"  | "Opresivo"     | "No"              | "Leve"     | "No"            | "No"      | "No"           | "Ninguno"     | 0                     | "Lunes"   |
+      | "Unilateral" | "Pulsátil"     | "Sí"              | "Severa"   | "Sí"            | "Sí"      | "Sí"           | "Visuales"    | 30                    | "Viernes" |
+      | "Unilateral" | "Pulsátil"     | "Sí"              | "Severa"   | "No"            | "Sí"      | "No"           | "Ninguno"     | 0                     | "Martes"  |
+    Cuando se solicita el análisis completo de patrones
+    Entonces la bitácora del paciente se consulta una sola vez
+    Y el análisis completo coincide con cada análisis individual
+
+Escenario: Coocurrencia y correlación entre síntomas
+    Dado que el paciente ha registrado los siguientes episodios
+      | nauseas_vomitos | fotofobia | fonofobia | severidad  |
+      | "Sí"            | "Sí"      | "No"      | "Severa"   |
+      | "Sí"            | "Sí"      | "Sí"      | "Severa"   |
+      | "No"            | "No"      | "Sí"      | "Leve"     |
+      | "No"            | "No"      | "No"      | "Moderada" |
+    Cuando se calcula la correlación entre los síntomas
+    Entonces "nauseas_vomitos" y "fotofobia" coinciden en 2 episodios con una correlación de 1.0
+    Y "nauseas_vomitos" y "severidad_severa" coinciden en 2 episodios con una correlación de 1.0
+    Y "nauseas_vomitos" y "fonofobia" coinciden en 1 episodios con una correlación de 0.0
+    Y "fonofobia" y "severidad_moderada" coinciden en 0 episodios con una correlación de -0.577
+    Y la correlación de "presencia_aura" no está definida porque no varía
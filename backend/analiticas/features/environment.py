@@ -3,4 +3,8 @@ import django
 
 def before_all(context):
     os.environ.setdefault("DJANGO_SETTINGS_MODULE", "migraine_app.settings")
-    django.setup()
\ No newline at end of file
+    django.setup()
+
+    # Las peticiones del cliente de pruebas de DRF llegan con el host 'testserver'
+    from utilidades_behave import habilitar_cliente_de_pruebas
+    habilitar_cliente_de_pruebas()
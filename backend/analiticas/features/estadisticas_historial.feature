@@ -67,4 +67,103 @@ Ejemplos:
   Ejemplos:
     | puntuacion_promedio | puntuacion_actual | variacion_puntaje_midas | tendencia_de_discapacidad|
     | 20                  | 15                | -5                      | "Mejorado"               |
-    | 15                  | 22                | 7                       | "Empeorado"              |
\ No newline at end of file
+    | 15                  | 22                | 7                       | "Empeorado"              |
+  @resumen_estadistico
+  Escenario: Resumen estadístico del historial calculado en la base de datos
+  Dado que el paciente tiene 6 episodios guardados en la base de datos
+  Cuando solicito el resumen estadístico del historial
+  Entonces el resumen calculado en la base de datos coincide con el calculado en memoria
+  Y el resumen indica un total de 6 episodios
+
+  @serie_semanal
+  Escenario: Promedio y serie semanal calculados en la base de datos para más de 50 episodios
+  Dado que el paciente tiene 5 episodios por semana guardados en la base de datos durante 12 semanas desde 2024-01-01
+  Cuando solicito el promedio y la serie semanal entre 2024-01-01 y 2024-03-24
+  Entonces el sistema mostrará que el promedio semanal de episodios es 5.1 veces
+  Y la serie semanal tiene 12 semanas con 5 episodios cada una
+
+  @cache_analiticas
+  Escenario: Estadísticas del historial servidas desde la caché hasta que se registra un nuevo episodio
+  Dado que el paciente tiene 6 episodios guardados en la base de datos
+  Cuando consulto dos veces las estadísticas del historial con caché
+  Entonces la segunda consulta se obtiene de la caché
+  Cuando el paciente registra un nuevo episodio
+  Y consulto nuevamente las estadísticas del historial con caché
+  Entonces la consulta se recalcula con un total de 7 episodios
+
+  @token_sin_estado
+  Escenario: Estadísticas del historial autenticadas solo con los claims del token
+  Dado que el paciente tiene 6 episodios guardados en la base de datos
+  Cuando el paciente inicia sesión y consulta sus estadísticas con su token de acceso
+  Entonces el token de acceso incluye el tipo de usuario y el género del paciente
+  Y la consulta de estadísticas no lee la tabla de usuarios para autenticarlo
+
+  @episodios_recientes
+  Escenario: Episodios recientes leídos de la base de datos sin instanciar el modelo
+  Dado que el paciente tiene 60 episodios guardados en la base de datos
+  Cuando se leen los últimos 50 episodios del paciente desde la base de datos
+  Entonces se obtienen los 50 episodios más recientes con una sola consulta
+  Y cada episodio coincide con el construido desde el modelo
+
+  @lote_columnar
+  Escenario: Resumen del historial completo calculado por columnas
+  Dado que el paciente tiene 60 episodios guardados en la base de datos
+  Cuando se carga el historial completo del paciente en columnas
+  Entonces el resumen por columnas coincide con el calculado episodio por episodio
+  Y el historial en columnas ocupa menos memoria que los episodios individuales
+
+  @ventana_analitica
+  Esquema del escenario: Estadísticas del historial completo o de una ventana de episodios
+  Dado que el paciente tiene 5 episodios por semana guardados en la base de datos durante 12 semanas desde 2024-01-01
+  Cuando el paciente consulta sus estadísticas con los parámetros "<parametros>"
+  Entonces las estadísticas consideran <total> episodios
+  Y el análisis de patrones con los mismos parámetros considera <total> episodios
+
+  Ejemplos:
+    | parametros                                  | total |
+    |                                             | 60    |
+    | ultimos=10                                  | 10    |
+    | desde=2024-01-08&hasta=2024-01-21           | 10    |
+    | ultimos=3&desde=2024-01-01&hasta=2024-01-07 | 3     |
+
+  @ventana_analitica
+  Escenario: Ventana de análisis con fechas invertidas
+  Dado que el paciente tiene 6 episodios guardados en la base de datos
+  Cuando el paciente consulta sus estadísticas con los parámetros "desde=2024-02-01&hasta=2024-01-01"
+  Entonces la consulta se rechaza por parámetros inválidos
+
+  @recurrencia_semanal
+  Escenario: Recurrencia semanal agrupada por día ISO en la base de datos
+  Dado que el paciente tiene 5 episodios por semana guardados en la base de datos durante 3 semanas desde 2024-01-01
+  Cuando se cuenta en la base de datos la recurrencia semanal del paciente
+  Entonces el histograma semanal tiene 3 episodios de lunes a viernes y ninguno el fin de semana
+  Y la recurrencia semanal se obtiene con una sola consulta agrupada
+  Y el análisis de patrones del paciente alerta sobre los días "Lunes, Martes, Miércoles, Jueves, Viernes"
+  Y el análisis de patrones presenta el histograma con el nombre de cada día
+
+  @cohorte_medico
+  Escenario: Cohorte de pacientes del médico calculada con consultas agrupadas
+  Dado que el médico tiene 7 pacientes con citas y 4 episodios registrados cada uno
+  Y otro médico tiene 2 pacientes con citas
+  Cuando el médico consulta su cohorte con páginas de 3 pacientes
+  Entonces se recorren 3 páginas con los 7 pacientes del médico
+  Y cada paciente de la cohorte coincide con los episodios guardados en la base de datos
+  Y cada página de la cohorte se calcula con 3 consultas
+
+  @correlacion_sintomas
+  Escenario: Correlación de síntomas de la cohorte del médico leída con una sola consulta
+  Dado que el médico tiene 4 pacientes con citas y 5 episodios registrados cada uno
+  Y otro médico tiene 2 pacientes con citas
+  Cuando el médico consulta la correlación de síntomas de su cohorte
+  Entonces la correlación considera 20 episodios leídos con una sola consulta
+  Y la matriz de la cohorte coincide con la calculada episodio por episodio
+
+  @resumen_materializado
+  Escenario: Resumen analítico materializado al registrar episodios y reconstruido si se corrompe
+  Dado que el paciente registra 12 episodios con el servicio de la bitácora
+  Entonces el resumen analítico del paciente coincide con el calculado sobre sus episodios
+  Y el análisis de patrones y las estadísticas del paciente leen el resumen con una sola consulta
+  Cuando se corrompen los contadores del resumen analítico del paciente
+  Y se reconstruye el resumen analítico del paciente
+  Entonces el resumen analítico del paciente coincide con el calculado sobre sus episodios
+  Y la reconstrucción bloquea el resumen antes de leer los episodios
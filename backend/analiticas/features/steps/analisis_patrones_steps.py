@@ -121,3 +121,54 @@ def step_impl(context, mensaje_conclusion_hormonal):
     valor_esperado = mensaje_conclusion_hormonal.strip('"')
     assert context.conclusion_hormonal == valor_esperado, \
         f"Esperado: '{valor_esperado}', Obtenido: '{context.conclusion_hormonal}'"
+
+
+@when("se solicita el análisis completo de patrones")
+def step_impl(context):
+    context.analisis_repo.lecturas = 0
+    context.analisis_completo = context.analisis_service.analizar_todo(context.paciente.pk)
+    assert context.analisis_completo is not None, "El servicio no devolvió el análisis completo."
+
+
+@then("la bitácora del paciente se consulta una sola vez")
+def step_impl(context):
+    assert context.analisis_repo.lecturas == 1, \
+        f"Se esperaba 1 lectura del repositorio, pero se realizaron {context.analisis_repo.lecturas}."
+
+
+@then("el análisis completo coincide con cada análisis individual")
+def step_impl(context):
+    servicio = context.analisis_service
+    paciente_id = context.paciente.pk
+    esperado = {
+        "conclusion_clinica": servicio.analizar_patrones_clinicos(paciente_id),
+        "conclusiones_sintomas": servicio.analizar_frecuencia_sintomas(paciente_id),
+        "conclusion_aura": servicio.analizar_patrones_aura(paciente_id),
+        "dias_recurrentes": servicio.analizar_recurrencia_semanal(paciente_id),
+        "recurrencia_semanal": servicio.histograma_dias_semana(paciente_id),
+        "conclusion_hormonal": servicio.analizar_patron_menstrual(paciente_id),
+    }
+    assert context.analisis_completo == esperado, \
+        f"Esperado: {esperado}, Obtenido: {context.analisis_completo}"
+
+
+@when("se calcula la correlación entre los síntomas")
+def step_impl(context):
+    context.correlacion = context.analisis_service.analizar_correlacion_sintomas([context.paciente.pk])
+    assert context.correlacion is not None, "El servicio no devolvió la correlación de síntomas."
+
+
+@then('"(?P<primera>\\w+)" y "(?P<segunda>\\w+)" coinciden en (?P<episodios>\\d+) episodios '
+      'con una correlación de (?P<phi>-?[\\d.]+)')
+def step_impl(context, primera, segunda, episodios, phi):
+    caracteristicas = context.correlacion["caracteristicas"]
+    i, j = caracteristicas.index(primera), caracteristicas.index(segunda)
+    assert context.correlacion["coocurrencias"][i][j] == int(episodios), context.correlacion["coocurrencias"]
+    assert context.correlacion["coocurrencias"][j][i] == int(episodios), "La matriz debe ser simétrica"
+    assert context.correlacion["correlaciones_phi"][i][j] == float(phi), context.correlacion["correlaciones_phi"]
+
+
+@then('la correlación de "(?P<caracteristica>\\w+)" no está definida porque no varía')
+def step_impl(context, caracteristica):
+    i = context.correlacion["caracteristicas"].index(caracteristica)
+    assert all(phi is None for phi in context.correlacion["correlaciones_phi"][i]), context.correlacion
@@ -10,8 +10,9 @@ from faker import Faker
 from usuarios.repositories import FakeUserRepository
 from analiticas.repositories import FakeAnalisisPatronesRepository
 from analiticas.estadisticas_service import EstadisticasHistorialService
-from analiticas.analisis_patrones_data_structures import EpisodioData
+from analiticas.analisis_patrones_data_structures import EpisodioData, ResumenEpisodios
 from django.core.exceptions import ValidationError
+from utilidades_behave import cliente_autenticado
 
 use_step_matcher("re")
 
@@ -507,4 +508,612 @@ def step_impl(context, tendencia_esperada):
     tendencia_calculada = context.evolucion_calculada["tendencia"]
     
     assert tendencia_calculada == tendencia_esperada, \
-        f"Se esperaba que la discapacidad haya '{tendencia_esperada}', pero se obtuvo '{tendencia_calculada}'"
\ No newline at end of file
+        f"Se esperaba que la discapacidad haya '{tendencia_esperada}', pero se obtuvo '{tendencia_calculada}'"
+
+# ============ STEPS PARA RESUMEN ESTADÍSTICO EN BASE DE DATOS ============
+
+@given(r'que el paciente tiene (?P<total_episodios>\d+) episodios guardados en la base de datos')
+def step_impl(context, total_episodios):
+    from analiticas.repositories import DjangoAnalisisPatronesRepository
+    from evaluacion_diagnostico.models import EpisodioCefalea
+    from usuarios.models import Usuario
+
+    context.paciente = Usuario.objects.create_user(
+        username=fake.unique.user_name(),
+        email=fake.unique.email(),
+        password='testpassword123',
+        first_name=fake.first_name(),
+        last_name=fake.last_name(),
+        cedula=str(fake.unique.random_number(digits=10, fix_len=True)),
+        tipo_usuario=Usuario.TipoUsuario.PACIENTE,
+        genero=Usuario.Genero.FEMENINO,
+    )
+
+    for _ in range(int(total_episodios)):
+        presencia_aura = fake.boolean()
+        EpisodioCefalea.objects.create(
+            paciente=context.paciente,
+            duracion_cefalea_horas=fake.random_int(min=1, max=12),
+            severidad=fake.random_element(elements=('Leve', 'Moderada', 'Severa')),
+            localizacion=fake.random_element(elements=('Unilateral', 'Bilateral')),
+            caracter_dolor=fake.random_element(elements=('Pulsátil', 'Opresivo', 'Punzante')),
+            empeora_actividad=fake.boolean(),
+            nauseas_vomitos=fake.boolean(),
+            fotofobia=fake.boolean(),
+            fonofobia=fake.boolean(),
+            presencia_aura=presencia_aura,
+            sintomas_aura='Visuales' if presencia_aura else 'Ninguno',
+            duracion_aura_minutos=fake.random_int(min=5, max=60) if presencia_aura else 0,
+            en_menstruacion=fake.boolean(),
+            anticonceptivos=fake.boolean(),
+            categoria_diagnostica=fake.random_element(elements=('Migraña sin aura', 'Migraña con aura', 'Cefalea de tipo tensional')),
+        )
+
+    context.django_repo = DjangoAnalisisPatronesRepository()
+
+
+@when('solicito el resumen estadístico del historial')
+def step_impl(context):
+    servicio_bd = EstadisticasHistorialService(repository=context.django_repo)
+    context.resumen_bd = servicio_bd.calcular_estadisticas_historial(context.paciente.id)
+
+    # Mismo historial cargado en el repositorio fake para forzar el cálculo en memoria
+    repo_memoria = FakeAnalisisPatronesRepository()
+    for episodio in context.django_repo.obtener_episodios_por_paciente(context.paciente.id):
+        repo_memoria.guardar_episodio(context.paciente.id, episodio)
+    servicio_memoria = EstadisticasHistorialService(repository=repo_memoria)
+    context.resumen_memoria = servicio_memoria.calcular_estadisticas_historial(context.paciente.id)
+
+
+@then('el resumen calculado en la base de datos coincide con el calculado en memoria')
+def step_impl(context):
+    assert context.resumen_bd == context.resumen_memoria, \
+        f"Base de datos: {context.resumen_bd}, Memoria: {context.resumen_memoria}"
+
+
+@then(r'el resumen indica un total de (?P<total_esperado>\d+) episodios')
+def step_impl(context, total_esperado):
+    assert context.resumen_bd["total_episodios"] == int(total_esperado), \
+        f"Se esperaban {total_esperado} episodios, pero se obtuvo {context.resumen_bd['total_episodios']}"
+
+
+# ============ STEPS PARA PROMEDIO Y SERIE SEMANAL EN BASE DE DATOS ============
+
+@given(r'que el paciente tiene (?P<por_semana>\d+) episodios por semana guardados en la base de datos '
+       r'durante (?P<semanas>\d+) semanas desde (?P<fecha_inicio>[\d-]+)')
+def step_impl(context, por_semana, semanas, fecha_inicio):
+    from django.utils import timezone
+    from evaluacion_diagnostico.models import EpisodioCefalea
+
+    context.execute_steps('Dado que el paciente tiene 0 episodios guardados en la base de datos')
+    inicio = timezone.make_aware(datetime.fromisoformat(fecha_inicio))
+
+    for semana in range(int(semanas)):
+        for dia in range(int(por_semana)):
+            episodio = EpisodioCefalea.objects.create(
+                paciente=context.paciente,
+                duracion_cefalea_horas=fake.random_int(min=1, max=12),
+                severidad=fake.random_element(elements=('Leve', 'Moderada', 'Severa')),
+                localizacion=fake.random_element(elements=('Unilateral', 'Bilateral')),
+                caracter_dolor=fake.random_element(elements=('Pulsátil', 'Opresivo', 'Punzante')),
+                empeora_actividad=fake.boolean(),
+                nauseas_vomitos=fake.boolean(),
+                fotofobia=fake.boolean(),
+                fonofobia=fake.boolean(),
+                presencia_aura=False,
+                sintomas_aura='Ninguno',
+                duracion_aura_minutos=0,
+                en_menstruacion=fake.boolean(),
+                anticonceptivos=fake.boolean(),
+                categoria_diagnostica='Cefalea de tipo tensional',
+            )
+            # creado_en es auto_now_add: se ajusta después de crear el episodio
+            EpisodioCefalea.objects.filter(pk=episodio.pk).update(
+                creado_en=inicio + timedelta(weeks=semana, days=dia, hours=12)
+            )
+
+
+@when(r'solicito el promedio y la serie semanal entre (?P<fecha_inicio>[\d-]+) y (?P<fecha_fin>[\d-]+)')
+def step_impl(context, fecha_inicio, fecha_fin):
+    servicio = EstadisticasHistorialService(repository=context.django_repo)
+    inicio = datetime.fromisoformat(fecha_inicio)
+    fin = datetime.fromisoformat(fecha_fin)
+    context.error = None
+    context.promedio_calculado = servicio.calcular_promedio_semanal(context.paciente.id, inicio, fin)
+    context.serie_calculada = servicio.calcular_serie_semanal(context.paciente.id, inicio, fin)
+
+
+@then(r'la serie semanal tiene (?P<semanas>\d+) semanas con (?P<por_semana>\d+) episodios cada una')
+def step_impl(context, semanas, por_semana):
+    assert len(context.serie_calculada) == int(semanas), \
+        f"Se esperaban {semanas} semanas, pero se obtuvieron {len(context.serie_calculada)}"
+    for punto in context.serie_calculada:
+        assert punto["semana"].weekday() == 0, f"La semana {punto['semana']} no inicia en lunes"
+        assert punto["episodios"] == int(por_semana), \
+            f"Semana {punto['semana']}: se esperaban {por_semana} episodios, pero hubo {punto['episodios']}"
+
+
+# ============ STEPS PARA CACHÉ DE ANALÍTICAS ============
+
+def _consultar_estadisticas_con_cache(context):
+    servicio = EstadisticasHistorialService(repository=context.django_repo)
+    paciente_id = context.paciente.id
+    return context.cache.obtener_o_calcular(
+        paciente_id, 'estadisticas', {},
+        lambda: servicio.calcular_estadisticas_historial(paciente_id)
+    )
+
+
+@when('consulto dos veces las estadísticas del historial con caché')
+def step_impl(context):
+    from analiticas.cache import CacheAnaliticas, CacheLocalLRU
+
+    context.cache = CacheAnaliticas(CacheLocalLRU(max_entradas=16))
+    context.primera_consulta = _consultar_estadisticas_con_cache(context)
+    context.segunda_consulta = _consultar_estadisticas_con_cache(context)
+
+
+@then('la segunda consulta se obtiene de la caché')
+def step_impl(context):
+    _, primer_acierto = context.primera_consulta
+    _, segundo_acierto = context.segunda_consulta
+    assert not primer_acierto and segundo_acierto, \
+        f"Aciertos esperados (False, True), obtenidos ({primer_acierto}, {segundo_acierto})"
+    assert context.cache.estadisticas()['aciertos'] == 1
+
+
+@when('el paciente registra un nuevo episodio')
+def step_impl(context):
+    from evaluacion_diagnostico.episodio_cefalea_service import episodio_cefalea_service
+
+    episodio_cefalea_service.registrar_nuevo_episodio(context.paciente, {
+        'duracion_cefalea_horas': 6,
+        'severidad': 'Severa',
+        'localizacion': 'Unilateral',
+        'caracter_dolor': 'Pulsátil',
+        'empeora_actividad': True,
+        'nauseas_vomitos': True,
+        'fotofobia': True,
+        'fonofobia': False,
+        'presencia_aura': False,
+        'sintomas_aura': 'Ninguno',
+        'duracion_aura_minutos': 0,
+        'en_menstruacion': False,
+        'anticonceptivos': False,
+    })
+
+
+@when('consulto nuevamente las estadísticas del historial con caché')
+def step_impl(context):
+    context.consulta_posterior = _consultar_estadisticas_con_cache(context)
+
+
+@then(r'la consulta se recalcula con un total de (?P<total_esperado>\d+) episodios')
+def step_impl(context, total_esperado):
+    resultados, acierto = context.consulta_posterior
+    assert not acierto, "La caché no se invalidó al registrar el nuevo episodio"
+    assert resultados["total_episodios"] == int(total_esperado), \
+        f"Se esperaban {total_esperado} episodios, pero se obtuvo {resultados['total_episodios']}"
+
+
+# ============ STEPS PARA AUTENTICACIÓN SIN ESTADO ============
+
+@when('el paciente inicia sesión y consulta sus estadísticas con su token de acceso')
+def step_impl(context):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+
+    cliente = APIClient()
+    login = cliente.post('/api/auth/jwt/create/',
+                         {'email': context.paciente.email, 'password': 'testpassword123'}, format='json')
+    assert login.status_code == 200, login.content
+    context.token_acceso = login.data['access']
+
+    cliente.credentials(HTTP_AUTHORIZATION=f"Bearer {context.token_acceso}")
+    with CaptureQueriesContext(connection) as consultas:
+        context.respuesta = cliente.get('/api/analiticas/estadisticas/')
+    context.consultas_estadisticas = [c['sql'] for c in consultas.captured_queries]
+
+
+@then('el token de acceso incluye el tipo de usuario y el género del paciente')
+def step_impl(context):
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    token = AccessToken(context.token_acceso)
+    assert token['tipo_usuario'] == context.paciente.tipo_usuario
+    assert token['genero'] == context.paciente.genero
+
+
+@then('la consulta de estadísticas no lee la tabla de usuarios para autenticarlo')
+def step_impl(context):
+    assert context.respuesta.status_code == 200, context.respuesta.content
+    assert context.respuesta.data['total_episodios'] == 6, context.respuesta.data
+    consultas_usuario = [sql for sql in context.consultas_estadisticas if '"usuarios_usuario"' in sql]
+    assert not consultas_usuario, f"Consultas a usuarios durante la petición: {consultas_usuario}"
+
+
+# ============ STEPS PARA EPISODIOS RECIENTES ============
+
+@when('se leen los últimos (?P<ultimos>\\d+) episodios del paciente desde la base de datos')
+def step_impl(context, ultimos):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from analiticas.analisis_patrones_data_structures import VentanaEpisodios
+
+    with CaptureQueriesContext(connection) as consultas:
+        context.episodios_recientes = context.django_repo.obtener_episodios_por_paciente(
+            context.paciente.id, VentanaEpisodios(ultimos=int(ultimos)))
+    context.consultas_recientes = [c['sql'] for c in consultas.captured_queries]
+
+
+@then('se obtienen los (?P<total>\\d+) episodios más recientes con una sola consulta')
+def step_impl(context, total):
+    assert len(context.consultas_recientes) == 1, context.consultas_recientes
+    assert len(context.episodios_recientes) == int(total), len(context.episodios_recientes)
+    fechas = [e.fecha_creacion for e in context.episodios_recientes]
+    assert fechas == sorted(fechas, reverse=True)
+
+
+@then('cada episodio coincide con el construido desde el modelo')
+def step_impl(context):
+    from evaluacion_diagnostico.models import EpisodioCefalea
+
+    modelos = (EpisodioCefalea.objects
+               .filter(paciente_id=context.paciente.id)
+               .order_by('-creado_en')[:len(context.episodios_recientes)])
+    esperados = [EpisodioData.desde_modelo(episodio) for episodio in modelos]
+    assert context.episodios_recientes == esperados
+
+
+# ============ STEPS PARA HISTORIAL EN COLUMNAS ============
+
+@when('se carga el historial completo del paciente en columnas')
+def step_impl(context):
+    from evaluacion_diagnostico.models import EpisodioCefalea
+
+    context.lote = context.django_repo.obtener_lote_episodios(context.paciente.id)
+    modelos = EpisodioCefalea.objects.filter(paciente_id=context.paciente.id).order_by('-creado_en', '-id')
+    context.episodios_individuales = [EpisodioData.desde_modelo(episodio) for episodio in modelos]
+
+
+@then('el resumen por columnas coincide con el calculado episodio por episodio')
+def step_impl(context):
+    por_columnas = context.lote.resumen()
+    esperado = ResumenEpisodios.desde_episodios(context.episodios_individuales)
+    assert len(context.lote) == len(context.episodios_individuales)
+    assert por_columnas == esperado, f"{por_columnas} != {esperado}"
+    # Mismo orden de claves para que most_common desempate igual
+    for contador in ('localizaciones', 'caracteres', 'sintomas', 'dias', 'severidades'):
+        assert list(getattr(por_columnas, contador).items()) == list(getattr(esperado, contador).items()), contador
+    assert [context.lote.episodio(i) for i in range(3)] == context.episodios_individuales[:3]
+
+
+@then('el historial en columnas ocupa menos memoria que los episodios individuales')
+def step_impl(context):
+    import sys
+
+    memoria_objetos = sum(sys.getsizeof(episodio) for episodio in context.episodios_individuales)
+    assert context.lote.nbytes * 4 < memoria_objetos, (context.lote.nbytes, memoria_objetos)
+
+
+# ============ STEPS PARA VENTANA DE ANÁLISIS ============
+
+@when(r'el paciente consulta sus estadísticas con los parámetros "(?P<parametros>[^"]*)"')
+def step_impl(context, parametros):
+    cliente = cliente_autenticado(context.paciente)
+    context.parametros_ventana = parametros
+    context.respuesta = cliente.get(f'/api/analiticas/estadisticas/?{parametros}')
+
+
+@then(r'las estadísticas consideran (?P<total>\d+) episodios')
+def step_impl(context, total):
+    assert context.respuesta.status_code == 200, context.respuesta.content
+    assert context.respuesta.data['total_episodios'] == int(total), context.respuesta.data
+
+
+@then(r'el análisis de patrones con los mismos parámetros considera (?P<total>\d+) episodios')
+def step_impl(context, total):
+    from django.http import QueryDict
+    from analiticas.analisis_patrones_data_structures import VentanaEpisodios
+    from analiticas.estadisticas_serializers import VentanaAnaliticaSerializer
+    from analiticas.services import AnalisisPatronesService
+
+    serializer = VentanaAnaliticaSerializer(data=QueryDict(context.parametros_ventana))
+    assert serializer.is_valid(), serializer.errors
+    ventana = VentanaEpisodios(**serializer.validated_data)
+    resumen = AnalisisPatronesService(repository=context.django_repo).obtener_resumen(context.paciente.id, ventana)
+    assert resumen.total == int(total), resumen.total
+
+
+@then('la consulta se rechaza por parámetros inválidos')
+def step_impl(context):
+    assert context.respuesta.status_code == 400, context.respuesta.content
+
+
+# ============ STEPS PARA RECURRENCIA SEMANAL ============
+
+@when('se cuenta en la base de datos la recurrencia semanal del paciente')
+def step_impl(context):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as consultas:
+        context.histograma = context.django_repo.contar_episodios_por_dia_semana(context.paciente.id)
+    context.consultas_histograma = [c['sql'] for c in consultas.captured_queries]
+
+
+@then(r'el histograma semanal tiene (?P<episodios>\d+) episodios de lunes a viernes y ninguno el fin de semana')
+def step_impl(context, episodios):
+    esperado = {1: int(episodios), 2: int(episodios), 3: int(episodios), 4: int(episodios), 5: int(episodios),
+                6: 0, 7: 0}
+    assert context.histograma == esperado, context.histograma
+
+
+@then('la recurrencia semanal se obtiene con una sola consulta agrupada')
+def step_impl(context):
+    assert len(context.consultas_histograma) == 1, context.consultas_histograma
+    assert 'GROUP BY' in context.consultas_histograma[0], context.consultas_histograma[0]
+
+
+@then(r'el análisis de patrones del paciente alerta sobre los días "(?P<dias>[^"]+)"')
+def step_impl(context, dias):
+    cliente = cliente_autenticado(context.paciente)
+    context.respuesta = cliente.get('/api/analiticas/patrones/')
+    assert context.respuesta.status_code == 200, context.respuesta.content
+    assert context.respuesta.data['dias_recurrentes'] == dias.split(', '), context.respuesta.data
+
+
+@then('el análisis de patrones presenta el histograma con el nombre de cada día')
+def step_impl(context):
+    recurrencia = context.respuesta.data['recurrencia_semanal']
+    assert [dia['dia'] for dia in recurrencia] == list(range(1, 8)), recurrencia
+    assert recurrencia[0]['nombre'] == 'Lunes' and recurrencia[6]['nombre'] == 'Domingo', recurrencia
+    assert [dia['episodios'] for dia in recurrencia] == [context.histograma[dia] for dia in range(1, 8)], recurrencia
+
+
+# ============ STEPS PARA COHORTE DEL MÉDICO ============
+
+def _crear_usuario(tipo_usuario):
+    from usuarios.models import Usuario
+
+    return Usuario.objects.create_user(
+        username=fake.unique.user_name(),
+        email=fake.unique.email(),
+        password='testpassword123',
+        first_name=fake.first_name(),
+        last_name=fake.last_name(),
+        cedula=str(fake.unique.random_number(digits=10, fix_len=True)),
+        tipo_usuario=tipo_usuario,
+    )
+
+
+def _crear_pacientes_con_citas(medico, pacientes, episodios):
+    from datetime import date, time
+    from agendamiento_citas.models import Cita
+    from evaluacion_diagnostico.models import EpisodioCefalea
+    from usuarios.models import Usuario
+
+    creados = []
+    for indice in range(pacientes):
+        paciente = _crear_usuario(Usuario.TipoUsuario.PACIENTE)
+        Cita.objects.create(doctor=medico, paciente=paciente,
+                            fecha=date.today() + timedelta(days=indice + 1), hora=time(9, 0))
+        for numero in range(episodios):
+            EpisodioCefalea.objects.create(
+                paciente=paciente,
+                duracion_cefalea_horas=fake.random_int(min=1, max=12),
+                severidad=('Leve', 'Moderada', 'Severa')[(indice + numero) % 3],
+                localizacion=fake.random_element(elements=('Unilateral', 'Bilateral')),
+                caracter_dolor=fake.random_element(elements=('Pulsátil', 'Opresivo', 'Punzante')),
+                empeora_actividad=fake.boolean(),
+                nauseas_vomitos=fake.boolean(),
+                fotofobia=fake.boolean(),
+                fonofobia=fake.boolean(),
+                presencia_aura=False,
+                sintomas_aura='Ninguno',
+                duracion_aura_minutos=0,
+                en_menstruacion=fake.boolean(),
+                anticonceptivos=fake.boolean(),
+                categoria_diagnostica='Cefalea de tipo tensional',
+            )
+        creados.append(paciente)
+    return creados
+
+
+@given(r'que el médico tiene (?P<pacientes>\d+) pacientes con citas y (?P<episodios>\d+) episodios registrados cada uno')
+def step_impl(context, pacientes, episodios):
+    from usuarios.models import Usuario
+
+    context.medico = _crear_usuario(Usuario.TipoUsuario.MEDICO)
+    context.pacientes_cohorte = _crear_pacientes_con_citas(context.medico, int(pacientes), int(episodios))
+
+
+@given(r'otro médico tiene (?P<pacientes>\d+) pacientes con citas')
+def step_impl(context, pacientes):
+    from usuarios.models import Usuario
+
+    _crear_pacientes_con_citas(_crear_usuario(Usuario.TipoUsuario.MEDICO), int(pacientes), 1)
+
+
+@when(r'el médico consulta su cohorte con páginas de (?P<tamano>\d+) pacientes')
+def step_impl(context, tamano):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    cliente = cliente_autenticado(context.medico)
+
+    context.paginas_cohorte = []
+    context.consultas_cohorte = []
+    url = f'/api/analiticas/cohorte/?page_size={tamano}'
+    while url:
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = cliente.get(url)
+        assert respuesta.status_code == 200, respuesta.content
+        context.paginas_cohorte.append(respuesta.data['results'])
+        context.consultas_cohorte.append(len(consultas.captured_queries))
+        url = respuesta.data['next']
+
+
+@then(r'se recorren (?P<paginas>\d+) páginas con los (?P<total>\d+) pacientes del médico')
+def step_impl(context, paginas, total):
+    filas = [fila for pagina in context.paginas_cohorte for fila in pagina]
+    assert len(context.paginas_cohorte) == int(paginas), [len(p) for p in context.paginas_cohorte]
+    assert len(filas) == int(total), len(filas)
+    assert [fila['paciente_id'] for fila in filas] == sorted(p.id for p in context.pacientes_cohorte)
+
+
+@then('cada paciente de la cohorte coincide con los episodios guardados en la base de datos')
+def step_impl(context):
+    from collections import Counter
+    from evaluacion_diagnostico.models import EpisodioCefalea
+
+    for fila in (fila for pagina in context.paginas_cohorte for fila in pagina):
+        episodios = list(EpisodioCefalea.objects.filter(paciente_id=fila['paciente_id']))
+        severidades = Counter(e.severidad for e in episodios)
+        duracion = sum(float(e.duracion_cefalea_horas) for e in episodios) / len(episodios)
+        assert fila['total_episodios'] == len(episodios), fila
+        assert fila['duracion_promedio'] == round(duracion, 1), fila
+        assert fila['distribucion_severidad'] == {s: severidades[s] for s in ('Leve', 'Moderada', 'Severa')}, fila
+        assert fila['categorias_diagnosticas'] == dict(Counter(e.categoria_diagnostica for e in episodios)), fila
+        assert fila['fecha_ultimo_episodio'] is not None, fila
+
+
+@then(r'cada página de la cohorte se calcula con (?P<consultas>\d+) consultas')
+def step_impl(context, consultas):
+    assert context.consultas_cohorte == [int(consultas)] * len(context.consultas_cohorte), context.consultas_cohorte
+
+
+# ============ STEPS PARA CORRELACIÓN DE SÍNTOMAS ============
+
+@when('el médico consulta la correlación de síntomas de su cohorte')
+def step_impl(context):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    cliente = cliente_autenticado(context.medico)
+    with CaptureQueriesContext(connection) as consultas:
+        context.respuesta = cliente.get('/api/analiticas/correlacion-sintomas/?cohorte=true')
+    context.consultas_correlacion = [c['sql'] for c in consultas.captured_queries]
+
+
+@then(r'la correlación considera (?P<total>\d+) episodios leídos con una sola consulta')
+def step_impl(context, total):
+    assert context.respuesta.status_code == 200, context.respuesta.content
+    assert context.respuesta.data['total_episodios'] == int(total), context.respuesta.data
+    assert len(context.consultas_correlacion) == 1, context.consultas_correlacion
+
+
+@then('la matriz de la cohorte coincide con la calculada episodio por episodio')
+def step_impl(context):
+    from evaluacion_diagnostico.models import EpisodioCefalea
+    from analiticas.analisis_patrones_data_structures import MatrizSintomas
+
+    modelos = EpisodioCefalea.objects.filter(paciente__in=context.pacientes_cohorte)
+    esperado = MatrizSintomas.desde_episodios(EpisodioData.desde_modelo(episodio) for episodio in modelos)
+    assert context.respuesta.data == esperado.como_dict(), context.respuesta.data
+
+
+# ============ STEPS PARA RESUMEN ANALÍTICO MATERIALIZADO ============
+
+@given(r'que el paciente registra (?P<total>\d+) episodios con el servicio de la bitácora')
+def step_impl(context, total):
+    from evaluacion_diagnostico.episodio_cefalea_service import episodio_cefalea_service
+    from usuarios.models import Usuario
+
+    context.paciente = _crear_usuario(Usuario.TipoUsuario.PACIENTE)
+    for numero in range(int(total)):
+        presencia_aura = numero % 3 == 0
+        episodio_cefalea_service.registrar_nuevo_episodio(context.paciente, {
+            'duracion_cefalea_horas': 1.5 + numero % 4,
+            'severidad': ('Leve', 'Moderada', 'Severa')[numero % 3],
+            'localizacion': ('Unilateral', 'Bilateral')[numero % 2],
+            'caracter_dolor': ('Pulsátil', 'Opresivo', 'Punzante')[numero % 3],
+            'empeora_actividad': numero % 2 == 0,
+            'nauseas_vomitos': numero % 4 != 1,
+            'fotofobia': numero % 3 != 2,
+            'fonofobia': numero % 5 == 0,
+            'presencia_aura': presencia_aura,
+            'sintomas_aura': ('Visuales', 'Sensitivos')[numero % 2] if presencia_aura else 'Ninguno',
+            'duracion_aura_minutos': 10 + numero if presencia_aura else 0,
+            'en_menstruacion': numero % 4 == 0,
+            'anticonceptivos': numero % 6 == 0,
+        })
+
+
+@then('el resumen analítico del paciente coincide con el calculado sobre sus episodios')
+def step_impl(context):
+    from dataclasses import fields
+    from analiticas.models import ResumenAnaliticoPaciente
+    from evaluacion_diagnostico.models import EpisodioCefalea
+
+    materializado = ResumenAnaliticoPaciente.objects.get(paciente=context.paciente).a_resumen()
+    episodios = EpisodioCefalea.objects.filter(paciente=context.paciente).order_by('-creado_en', '-id')
+    esperado = ResumenEpisodios.desde_episodios(EpisodioData.desde_modelo(e) for e in episodios)
+
+    for campo in fields(ResumenEpisodios):
+        obtenido, calculado = getattr(materializado, campo.name), getattr(esperado, campo.name)
+        assert obtenido == calculado, f"{campo.name}: resumen {obtenido!r}, episodios {calculado!r}"
+
+
+@when('se corrompen los contadores del resumen analítico del paciente')
+def step_impl(context):
+    from analiticas.models import ResumenAnaliticoPaciente
+
+    ResumenAnaliticoPaciente.objects.filter(paciente=context.paciente).update(
+        total_episodios=1,
+        conteo_severidad={'Leve': 99},
+        conteo_sintomas={},
+        conteo_dias={'1': 7},
+        episodios_con_aura=0,
+        duracion_aura_min=None,
+        duracion_total_horas=0.0,
+        ultimo_episodio=None,
+    )
+    context.version_corrupta = ResumenAnaliticoPaciente.objects.get(paciente=context.paciente).version
+
+
+@when('se reconstruye el resumen analítico del paciente')
+def step_impl(context):
+    from analiticas.models import ResumenAnaliticoPaciente
+
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as consultas:
+        resumen = ResumenAnaliticoPaciente.reconstruir(context.paciente.id)
+    assert resumen.version > context.version_corrupta, "La reconstrucción no invalidó la caché"
+    context.consultas_reconstruccion = [c['sql'] for c in consultas.captured_queries]
+
+
+@then('la reconstrucción bloquea el resumen antes de leer los episodios')
+def step_impl(context):
+    consultas = context.consultas_reconstruccion
+    lectura_episodios = next(i for i, sql in enumerate(consultas)
+                             if 'FROM "evaluacion_episodio_cefalea"' in sql)
+    # La lectura del resumen es el SELECT ... FOR UPDATE (SQLite omite la cláusula)
+    lectura_resumen = next(i for i, sql in enumerate(consultas)
+                           if sql.startswith('SELECT') and 'FROM "analiticas_resumen_paciente"' in sql)
+    assert lectura_resumen < lectura_episodios, consultas
+
+
+@then('el análisis de patrones y las estadísticas del paciente leen el resumen con una sola consulta')
+def step_impl(context):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from analiticas.models import ResumenAnaliticoPaciente
+
+    cliente = cliente_autenticado(context.paciente)
+    for url in ('/api/analiticas/patrones/', '/api/analiticas/estadisticas/'):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = cliente.get(url)
+        assert respuesta.status_code == 200, respuesta.content
+        assert respuesta['X-Cache-Analiticas'] == 'MISS', f"{url} no se calculó"
+
+        # La caché lee antes la versión del resumen; el cálculo debe hacerse con una sola lectura más
+        lecturas = [c['sql'] for c in consultas.captured_queries
+                    if not c['sql'].startswith('SELECT "analiticas_resumen_paciente"."version"')]
+        assert len(lecturas) == 1, f"{url}: {lecturas}"
+        assert 'FROM "analiticas_resumen_paciente"' in lecturas[0], f"{url} no lee el resumen: {lecturas[0]}"
+    assert respuesta.data['total_episodios'] == ResumenAnaliticoPaciente.objects.get(
+        paciente=context.paciente).total_episodios, respuesta.data
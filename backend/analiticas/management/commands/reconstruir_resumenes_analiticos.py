@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from evaluacion_diagnostico.models import EpisodioCefalea
+from analiticas.models import ResumenAnaliticoPaciente
+
+
+class Command(BaseCommand):
+    help = "Reconstruye desde cero los resúmenes analíticos de los pacientes a partir de sus episodios."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--paciente',
+            type=int,
+            action='append',
+            dest='pacientes',
+            help='ID del paciente a reconstruir (se puede repetir). Por defecto, todos los que tienen episodios.'
+        )
+
+    def handle(self, *args, **options):
+        pacientes = options.get('pacientes')
+        if not pacientes:
+            pacientes = (EpisodioCefalea.objects
+                         .order_by('paciente_id')
+                         .values_list('paciente_id', flat=True)
+                         .distinct())
+
+        total = 0
+        for paciente_id in pacientes:
+            resumen = ResumenAnaliticoPaciente.reconstruir(paciente_id)
+            total += 1
+            self.stdout.write(f"Paciente {paciente_id}: {resumen.total_episodios} episodios")
+
+        self.stdout.write(self.style.SUCCESS(f"Resúmenes reconstruidos: {total}"))
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('evaluacion_diagnostico', '0002_pregunta_alter_episodiocefalea_anticonceptivos_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenAnaliticoPaciente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_episodios', models.PositiveIntegerField(default=0, verbose_name='Total de Episodios')),
+                ('conteo_localizacion', models.JSONField(default=dict, verbose_name='Episodios por Localización')),
+                ('conteo_caracter', models.JSONField(default=dict, verbose_name='Episodios por Carácter del Dolor')),
+                ('conteo_severidad', models.JSONField(default=dict, verbose_name='Episodios por Severidad')),
+                ('conteo_sintomas', models.JSONField(default=dict, verbose_name='Episodios por Síntoma Asociado')),
+                ('conteo_tipos_aura', models.JSONField(default=dict, verbose_name='Episodios por Tipo de Aura')),
+                ('conteo_dias', models.JSONField(default=dict, verbose_name='Episodios por Día de la Semana')),
+                ('episodios_empeora_actividad', models.PositiveIntegerField(default=0)),
+                ('episodios_severos_con_nauseas', models.PositiveIntegerField(default=0)),
+                ('episodios_con_aura', models.PositiveIntegerField(default=0)),
+                ('duracion_aura_min', models.PositiveIntegerField(blank=True, null=True, verbose_name='Duración Mínima del Aura (min)')),
+                ('duracion_aura_max', models.PositiveIntegerField(blank=True, null=True, verbose_name='Duración Máxima del Aura (min)')),
+                ('episodios_menstruacion', models.PositiveIntegerField(default=0)),
+                ('migranas_menstruales', models.PositiveIntegerField(default=0)),
+                ('episodios_anticonceptivos', models.PositiveIntegerField(default=0)),
+                ('duracion_total_horas', models.FloatField(default=0.0, verbose_name='Suma de Duraciones (horas)')),
+                ('fecha_primer_episodio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_ultimo_episodio', models.DateTimeField(blank=True, null=True)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('paciente', models.OneToOneField(limit_choices_to={'tipo_usuario': 'paciente'}, on_delete=django.db.models.deletion.CASCADE, related_name='resumen_analitico', to=settings.AUTH_USER_MODEL, verbose_name='Paciente')),
+                ('ultimo_episodio', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='evaluacion_diagnostico.episodiocefalea')),
+                ('ultimo_episodio_con_aura', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='evaluacion_diagnostico.episodiocefalea')),
+            ],
+            options={
+                'verbose_name': 'Resumen Analítico de Paciente',
+                'verbose_name_plural': 'Resúmenes Analíticos de Pacientes',
+                'db_table': 'analiticas_resumen_paciente',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analiticas', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resumenanaliticopaciente',
+            name='version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Versión de los Episodios'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+from django.db.models import Count, F
+from django.db.models.functions import ExtractIsoWeekDay
+
+
+def conteo_dias_iso(apps, schema_editor):
+    """
+    conteo_dias pasaba de nombres de strftime('%A') (dependientes del locale)
+    a días ISO: se recalcula con una sola consulta agrupada por paciente y día.
+    """
+    ResumenAnaliticoPaciente = apps.get_model('analiticas', 'ResumenAnaliticoPaciente')
+    EpisodioCefalea = apps.get_model('evaluacion_diagnostico', 'EpisodioCefalea')
+
+    conteos = {}
+    filas = (EpisodioCefalea.objects
+             .annotate(dia_semana=ExtractIsoWeekDay('creado_en'))
+             .order_by()
+             .values('paciente_id', 'dia_semana')
+             .annotate(episodios=Count('id')))
+    for fila in filas:
+        conteos.setdefault(fila['paciente_id'], {})[str(fila['dia_semana'])] = fila['episodios']
+
+    for resumen in ResumenAnaliticoPaciente.objects.only('id', 'paciente_id'):
+        ResumenAnaliticoPaciente.objects.filter(pk=resumen.pk).update(
+            conteo_dias=conteos.get(resumen.paciente_id, {}),
+            # Invalida los resultados en caché calculados con las claves anteriores
+            version=F('version') + 1,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analiticas', '0002_resumen_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(conteo_dias_iso, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,222 @@
-from django.db import models
+from collections import Counter
+from typing import Dict
+from django.db import models, transaction
+from django.db.models import Count
+from django.db.models.functions import ExtractIsoWeekDay
+from usuarios.models import Usuario
+from evaluacion_diagnostico.models import EpisodioCefalea
+from .analisis_patrones_data_structures import CAMPOS_LOTE, DIAS_ISO, EpisodioData, LoteEpisodios, ResumenEpisodios
 
-# Create your models here.
+
+class ResumenAnaliticoPaciente(models.Model):
+    """
+    Resumen materializado de la bitácora de un paciente.
+
+    Guarda los contadores acumulados de todos sus episodios para que el
+    análisis de patrones y las estadísticas del historial se lean en una
+    sola consulta, sin recorrer los episodios. Se actualiza al registrar
+    cada episodio y puede reconstruirse con el comando
+    `reconstruir_resumenes_analiticos`.
+    """
+    paciente = models.OneToOneField(
+        Usuario,
+        on_delete=models.CASCADE,
+        related_name='resumen_analitico',
+        limit_choices_to={'tipo_usuario': Usuario.TipoUsuario.PACIENTE},
+        verbose_name='Paciente'
+    )
+
+    total_episodios = models.PositiveIntegerField(default=0, verbose_name='Total de Episodios')
+
+    # Aumenta con cada episodio registrado; invalida la caché de analíticas del paciente
+    version = models.PositiveIntegerField(default=0, verbose_name='Versión de los Episodios')
+
+    # Contadores por categoría: {valor: número de episodios}
+    conteo_localizacion = models.JSONField(default=dict, verbose_name='Episodios por Localización')
+    conteo_caracter = models.JSONField(default=dict, verbose_name='Episodios por Carácter del Dolor')
+    conteo_severidad = models.JSONField(default=dict, verbose_name='Episodios por Severidad')
+    conteo_sintomas = models.JSONField(default=dict, verbose_name='Episodios por Síntoma Asociado')
+    conteo_tipos_aura = models.JSONField(default=dict, verbose_name='Episodios por Tipo de Aura')
+    # {día ISO de la semana (1 = lunes): episodios}; JSON guarda las claves como texto
+    conteo_dias = models.JSONField(default=dict, verbose_name='Episodios por Día de la Semana')
+
+    episodios_empeora_actividad = models.PositiveIntegerField(default=0)
+    episodios_severos_con_nauseas = models.PositiveIntegerField(default=0)
+    episodios_con_aura = models.PositiveIntegerField(default=0)
+    duracion_aura_min = models.PositiveIntegerField(null=True, blank=True, verbose_name='Duración Mínima del Aura (min)')
+    duracion_aura_max = models.PositiveIntegerField(null=True, blank=True, verbose_name='Duración Máxima del Aura (min)')
+    episodios_menstruacion = models.PositiveIntegerField(default=0)
+    migranas_menstruales = models.PositiveIntegerField(default=0)
+    episodios_anticonceptivos = models.PositiveIntegerField(default=0)
+    duracion_total_horas = models.FloatField(default=0.0, verbose_name='Suma de Duraciones (horas)')
+
+    fecha_primer_episodio = models.DateTimeField(null=True, blank=True)
+    fecha_ultimo_episodio = models.DateTimeField(null=True, blank=True)
+
+    # Necesarios para el modo descriptivo (menos de 5 episodios)
+    ultimo_episodio = models.ForeignKey(
+        EpisodioCefalea,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    ultimo_episodio_con_aura = models.ForeignKey(
+        EpisodioCefalea,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+
+    # Auditoría
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Resumen Analítico de Paciente'
+        verbose_name_plural = 'Resúmenes Analíticos de Pacientes'
+        db_table = 'analiticas_resumen_paciente'
+
+    def __str__(self):
+        return f"Resumen de {self.paciente.get_full_name()} - {self.total_episodios} episodios"
+
+    def a_resumen(self) -> ResumenEpisodios:
+        """Convierte los contadores guardados en un ResumenEpisodios para el análisis."""
+        return ResumenEpisodios(
+            total=self.total_episodios,
+            ultimo=EpisodioData.desde_modelo(self.ultimo_episodio) if self.ultimo_episodio else None,
+            localizaciones=Counter(self.conteo_localizacion),
+            caracteres=Counter(self.conteo_caracter),
+            empeora_actividad=self.episodios_empeora_actividad,
+            sintomas=Counter(self.conteo_sintomas),
+            severos=self.conteo_severidad.get('Severa', 0),
+            nauseas_en_severos=self.episodios_severos_con_nauseas,
+            con_aura=self.episodios_con_aura,
+            ultimo_con_aura=(EpisodioData.desde_modelo(self.ultimo_episodio_con_aura)
+                             if self.ultimo_episodio_con_aura else None),
+            tipos_aura=set(self.conteo_tipos_aura),
+            duracion_aura_min=self.duracion_aura_min,
+            duracion_aura_max=self.duracion_aura_max,
+            dias=Counter({int(dia): episodios for dia, episodios in self.conteo_dias.items()}),
+            menstruales=self.episodios_menstruacion,
+            migranas_menstruales=self.migranas_menstruales,
+            anticonceptivos=self.episodios_anticonceptivos,
+            severidades=Counter(self.conteo_severidad),
+            duracion_total=self.duracion_total_horas,
+            fecha_primer_episodio=self.fecha_primer_episodio,
+            fecha_ultimo_episodio=self.fecha_ultimo_episodio,
+        )
+
+    def _aplicar_resumen(self, resumen: ResumenEpisodios, episodios_tipo_aura: Counter):
+        """Copia los contadores de un ResumenEpisodios a los campos del modelo."""
+        self.total_episodios = resumen.total
+        self.conteo_localizacion = dict(resumen.localizaciones)
+        self.conteo_caracter = dict(resumen.caracteres)
+        self.conteo_severidad = dict(resumen.severidades)
+        self.conteo_sintomas = dict(resumen.sintomas)
+        self.conteo_tipos_aura = dict(episodios_tipo_aura)
+        self.conteo_dias = dict(resumen.dias)
+        self.episodios_empeora_actividad = resumen.empeora_actividad
+        self.episodios_severos_con_nauseas = resumen.nauseas_en_severos
+        self.episodios_con_aura = resumen.con_aura
+        self.duracion_aura_min = resumen.duracion_aura_min
+        self.duracion_aura_max = resumen.duracion_aura_max
+        self.episodios_menstruacion = resumen.menstruales
+        self.migranas_menstruales = resumen.migranas_menstruales
+        self.episodios_anticonceptivos = resumen.anticonceptivos
+        self.duracion_total_horas = resumen.duracion_total
+        self.fecha_primer_episodio = resumen.fecha_primer_episodio
+        self.fecha_ultimo_episodio = resumen.fecha_ultimo_episodio
+
+    @staticmethod
+    def _tipo_aura(episodio) -> str:
+        """Clave del contador de tipos de aura (misma regla que ResumenEpisodios.tipos_aura)."""
+        if episodio.presencia_aura and episodio.sintomas_aura and episodio.sintomas_aura != "Ninguno":
+            return episodio.sintomas_aura.lower()
+        return ''
+
+    @classmethod
+    def registrar_episodio(cls, episodio: EpisodioCefalea) -> 'ResumenAnaliticoPaciente':
+        """
+        Incorpora un episodio recién guardado al resumen de su paciente.
+        Debe llamarse dentro de la misma transacción que guarda el episodio.
+        """
+        return cls.registrar_episodios(episodio.paciente_id, [episodio])
+
+    @classmethod
+    @transaction.atomic
+    def registrar_episodios(cls, paciente_id: int, episodios) -> 'ResumenAnaliticoPaciente':
+        """
+        Incorpora varios episodios recién guardados de un paciente, en orden de
+        registro, con una sola lectura y una sola escritura del resumen.
+        """
+        resumen_orm = (cls.objects.select_for_update()
+                       .select_related('ultimo_episodio', 'ultimo_episodio_con_aura')
+                       .filter(paciente_id=paciente_id)
+                       .first())
+        if resumen_orm is None:
+            # Sin resumen previo: se construye con todo el historial, que ya incluye estos episodios
+            return cls.reconstruir(paciente_id)
+
+        resumen = resumen_orm.a_resumen()
+        episodios_tipo_aura = Counter(resumen_orm.conteo_tipos_aura)
+        for episodio in episodios:
+            resumen.agregar_mas_reciente(EpisodioData.desde_modelo(episodio))
+            tipo_aura = cls._tipo_aura(episodio)
+            if tipo_aura:
+                episodios_tipo_aura[tipo_aura] += 1
+            resumen_orm.ultimo_episodio = episodio
+            if episodio.presencia_aura:
+                resumen_orm.ultimo_episodio_con_aura = episodio
+
+        resumen_orm._aplicar_resumen(resumen, episodios_tipo_aura)
+        resumen_orm.version += 1
+        resumen_orm.save()
+        return resumen_orm
+
+    @staticmethod
+    def anotar_dia_semana(episodios: models.QuerySet) -> models.QuerySet:
+        """
+        Añade dia_semana: el día ISO de creado_en (1 = lunes ... 7 = domingo),
+        calculado por la base de datos en la zona horaria activa.
+        """
+        return episodios.annotate(dia_semana=ExtractIsoWeekDay('creado_en'))
+
+    @classmethod
+    def histograma_dias_semana(cls, episodios: models.QuerySet) -> Dict[int, int]:
+        """Episodios por día ISO de la semana (los 7 días), con un GROUP BY en la base de datos."""
+        histograma = dict.fromkeys(DIAS_ISO, 0)
+        filas = (cls.anotar_dia_semana(episodios)
+                 .order_by()
+                 .values('dia_semana')
+                 .annotate(episodios=Count('id')))
+        for fila in filas:
+            histograma[fila['dia_semana']] = fila['episodios']
+        return histograma
+
+    @classmethod
+    def lote_episodios(cls, paciente_id: int) -> LoteEpisodios:
+        """Historial completo del paciente en columnas, sin crear un objeto por episodio."""
+        return LoteEpisodios(cls.anotar_dia_semana(EpisodioCefalea.objects.filter(paciente_id=paciente_id))
+                             .order_by('-creado_en', '-id')
+                             .values_list(*CAMPOS_LOTE))
+
+    @classmethod
+    @transaction.atomic
+    def reconstruir(cls, paciente_id: int) -> 'ResumenAnaliticoPaciente':
+        """
+        Recalcula desde cero el resumen de un paciente a partir de todos sus episodios.
+        Bloquea la fila del resumen antes de leer el historial: un episodio que se
+        registre a la vez espera el bloqueo y se suma sobre el resumen reconstruido.
+        """
+        resumen_orm, _ = cls.objects.select_for_update().get_or_create(paciente_id=paciente_id)
+
+        lote = cls.lote_episodios(paciente_id)
+        resumen = lote.resumen()
+        con_aura = lote.booleanos['presencia_aura']
+        resumen_orm._aplicar_resumen(resumen, lote.conteo_tipos_aura())
+        resumen_orm.ultimo_episodio_id = int(lote.ids[0]) if len(lote) else None
+        resumen_orm.ultimo_episodio_con_aura_id = int(lote.ids[con_aura.argmax()]) if con_aura.any() else None
+        resumen_orm.version += 1
+        resumen_orm.save()
+        return resumen_orm
@@ -0,0 +1,14 @@
+# analiticas/pagination.py
+from rest_framework.pagination import CursorPagination
+
+
+class CohorteCursorPagination(CursorPagination):
+    """
+    Paginación por cursor de la cohorte de un médico, por ID de paciente.
+    Cada página continúa desde el último ID visto (clave primaria), así que
+    un panel de miles de pacientes no paga OFFSET ni un COUNT(*).
+    """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
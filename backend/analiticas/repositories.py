@@ -1,28 +1,112 @@
 # analiticas/repositories.py
 
 from abc import ABC, abstractmethod
-from typing import List
-from .analisis_patrones_data_structures import EpisodioData
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from django.db.models import Avg, Case, Count, IntegerField, Max, Min, Q, Value, When
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+from .analisis_patrones_data_structures import (
+    CAMPOS_EPISODIO, CAMPOS_MATRIZ_SINTOMAS, EpisodioData, LoteEpisodios, MatrizSintomas, ResumenEpisodios,
+    VentanaEpisodios, VALORES_SEVERIDAD,
+)
 from evaluacion_diagnostico.models import EpisodioCefalea
+from .models import ResumenAnaliticoPaciente
 
 
 class AnalisisPatronesRepository(ABC):
     """Interfaz del repositorio."""
 
     @abstractmethod
-    def obtener_episodios_por_paciente(self, paciente_id: int) -> List[EpisodioData]:
+    def obtener_episodios_por_paciente(self, paciente_id: int,
+                                       ventana: Optional[VentanaEpisodios] = None) -> List[EpisodioData]:
+        """Episodios de la ventana indicada (por defecto, el historial completo)."""
         pass
 
+    def iterar_episodios(self, paciente_id: int,
+                         ventana: Optional[VentanaEpisodios] = None) -> Iterator[EpisodioData]:
+        """
+        Recorre los episodios de la ventana, del más reciente al más antiguo.
+        Los repositorios que lo soportan los leen por bloques, sin cargar
+        todo el historial en memoria.
+        """
+        return iter(self.obtener_episodios_por_paciente(paciente_id, ventana))
+
     # Este es el método que tu contrato requiere
     @abstractmethod
     def guardar_episodio(self, paciente_id: int, episodio: EpisodioData):
         pass
 
+    def obtener_resumen_por_paciente(self, paciente_id: int) -> Optional[ResumenEpisodios]:
+        """
+        Resumen ya calculado de la bitácora del paciente.
+        Devuelve None si no existe; en ese caso el servicio lo construye
+        recorriendo los episodios.
+        """
+        return None
+
+    def obtener_lote_episodios(self, paciente_id: int) -> Optional[LoteEpisodios]:
+        """
+        Historial completo del paciente en formato columnar.
+        Devuelve None si el repositorio no lo soporta.
+        """
+        return None
+
+    def obtener_estadisticas_agregadas(self, paciente_id: int,
+                                       ventana: Optional[VentanaEpisodios] = None) -> Optional[Dict[str, Any]]:
+        """
+        Agregados de la bitácora calculados por el almacenamiento.
+        Devuelve None si el repositorio no los soporta; en ese caso el
+        servicio los calcula en memoria a partir de los episodios.
+        """
+        return None
+
+    def contar_episodios_en_rango(self, paciente_id: int, fecha_inicio: date, fecha_fin: date) -> Optional[int]:
+        """
+        Número de episodios registrados entre dos fechas (ambas inclusive).
+        Devuelve None si el repositorio no lo soporta.
+        """
+        return None
+
+    def contar_episodios_por_semana(self, paciente_id: int, fecha_inicio: date,
+                                    fecha_fin: date) -> Optional[List[Tuple[date, int]]]:
+        """
+        Pares (lunes de la semana, episodios) de las semanas con episodios
+        entre dos fechas (ambas inclusive). Devuelve None si el repositorio
+        no lo soporta.
+        """
+        return None
+
+    def contar_episodios_por_dia_semana(self, paciente_id: int,
+                                        ventana: Optional[VentanaEpisodios] = None) -> Optional[Dict[int, int]]:
+        """
+        Episodios de la ventana por día ISO de la semana (1 = lunes), con los
+        7 días. Devuelve None si el repositorio no lo soporta.
+        """
+        return None
+
+    def obtener_agregados_cohorte(self, paciente_ids: Sequence[int]) -> Optional[Dict[int, Dict[str, Any]]]:
+        """
+        Agregados de la bitácora de varios pacientes a la vez, por ID de
+        paciente (los que no tienen episodios no aparecen). Devuelve None si
+        el repositorio no lo soporta.
+        """
+        return None
+
+    def obtener_matriz_sintomas(self, paciente_ids) -> Optional[MatrizSintomas]:
+        """
+        Matriz de síntomas de todos los episodios de los pacientes indicados
+        (una lista de IDs o una subconsulta). Devuelve None si el repositorio
+        no lo soporta.
+        """
+        return None
+
 
 # --- Implementación para Pruebas ---
 class FakeAnalisisPatronesRepository(AnalisisPatronesRepository):
     def __init__(self):
         self._episodios = {}
+        self.lecturas = 0  # Número de consultas realizadas (útil para testing)
 
     def limpiar_repositorio(self):
         """Limpia todos los episodios del repositorio fake."""
@@ -33,8 +117,13 @@ class FakeAnalisisPatronesRepository(AnalisisPatronesRepository):
             self._episodios[paciente_id] = []
         self._episodios[paciente_id].append(episodio)
 
-    def obtener_episodios_por_paciente(self, paciente_id: int) -> List[EpisodioData]:
-        return self._episodios.get(paciente_id, [])
+    def obtener_episodios_por_paciente(self, paciente_id: int,
+                                       ventana: Optional[VentanaEpisodios] = None) -> List[EpisodioData]:
+        self.lecturas += 1
+        episodios = self._episodios.get(paciente_id, [])
+        if ventana is None or ventana.completa:
+            return episodios
+        return ventana.aplicar(episodios)
 
 
 # --- Implementación para Producción ---
@@ -43,33 +132,155 @@ class DjangoAnalisisPatronesRepository(AnalisisPatronesRepository):
     Implementación real que interactúa con la base de datos de Django.
     """
 
-    def obtener_episodios_por_paciente(self, paciente_id: int) -> List[EpisodioData]:
-        # --- CORRECCIÓN AQUÍ: Cambiamos 'fecha_creacion' por 'creado_en' ---
-        episodios_orm = EpisodioCefalea.objects.filter(paciente_id=paciente_id).order_by('-creado_en')[:50]
-        episodios_data = []
-        for orm_obj in episodios_orm:
-            # --- Y TAMBIÉN AQUÍ ---
-            data = EpisodioData(
-                localizacion=orm_obj.localizacion,
-                caracter_dolor=orm_obj.caracter_dolor,
-                empeora_actividad=bool(orm_obj.empeora_actividad),  # Aseguramos que sea un booleano
-                severidad=orm_obj.severidad,
-                nauseas_vomitos=bool(orm_obj.nauseas_vomitos),  # Aseguramos que sea un booleano
-                fotofobia=bool(orm_obj.fotofobia),  # Aseguramos que sea un booleano
-                fonofobia=bool(orm_obj.fonofobia),  # Aseguramos que sea un booleano
-                presencia_aura=bool(orm_obj.presencia_aura),  # Aseguramos que sea un booleano
-                sintomas_aura=orm_obj.sintomas_aura,
-                duracion_aura_minutos=orm_obj.duracion_aura_minutos,
-                duracion_cefalea_horas=float(orm_obj.duracion_cefalea_horas),  # Agregamos el campo que faltaba
-                en_menstruacion=bool(orm_obj.en_menstruacion),  # Aseguramos que sea un booleano
-                anticonceptivos=bool(orm_obj.anticonceptivos),  # Agregamos el campo que faltaba
-                categoria_diagnostica=orm_obj.categoria_diagnostica,
-                dia=orm_obj.creado_en.strftime('%A'),
-                fecha_creacion=orm_obj.creado_en,
-                paciente_id=orm_obj.paciente_id
-            )
-            episodios_data.append(data)
-        return episodios_data
+    # Filas leídas de la base de datos en cada bloque al recorrer un historial
+    TAMANO_BLOQUE = 2000
+
+    @staticmethod
+    def _inicio_dia(fecha: date) -> datetime:
+        return timezone.make_aware(datetime.combine(fecha, time.min))
+
+    def _episodios_en_ventana(self, paciente_id: int, ventana: Optional[VentanaEpisodios]):
+        """
+        Episodios del paciente dentro de la ventana. Los límites de fecha se
+        aplican sobre creado_en para aprovechar el índice (paciente, creado_en);
+        los últimos N se resuelven con una subconsulta ordenada por ese índice.
+        """
+        episodios = EpisodioCefalea.objects.filter(paciente_id=paciente_id)
+        if ventana is None:
+            return episodios
+        if ventana.desde is not None:
+            episodios = episodios.filter(creado_en__gte=self._inicio_dia(ventana.desde))
+        if ventana.hasta is not None:
+            episodios = episodios.filter(creado_en__lt=self._inicio_dia(ventana.hasta + timedelta(days=1)))
+        if ventana.ultimos is not None:
+            recientes = episodios.order_by('-creado_en', '-id').values('id')[:ventana.ultimos]
+            episodios = EpisodioCefalea.objects.filter(id__in=recientes)
+        return episodios
+
+    def iterar_episodios(self, paciente_id: int,
+                         ventana: Optional[VentanaEpisodios] = None) -> Iterator[EpisodioData]:
+        """
+        Lee solo las columnas que usa EpisodioData, por bloques de
+        TAMANO_BLOQUE filas y sin instanciar el modelo.
+        """
+        episodios = ResumenAnaliticoPaciente.anotar_dia_semana(self._episodios_en_ventana(paciente_id, ventana))
+        filas = (episodios
+                 .order_by('-creado_en', '-id')
+                 .values_list(*CAMPOS_EPISODIO)
+                 .iterator(chunk_size=self.TAMANO_BLOQUE))
+        return (EpisodioData.desde_fila(fila) for fila in filas)
+
+    def obtener_episodios_por_paciente(self, paciente_id: int,
+                                       ventana: Optional[VentanaEpisodios] = None) -> List[EpisodioData]:
+        return list(self.iterar_episodios(paciente_id, ventana))
+
+    def obtener_lote_episodios(self, paciente_id: int) -> LoteEpisodios:
+        return ResumenAnaliticoPaciente.lote_episodios(paciente_id)
+
+    def obtener_resumen_por_paciente(self, paciente_id: int) -> Optional[ResumenEpisodios]:
+        """
+        Lee el resumen materializado del paciente (una sola consulta).
+        """
+        resumen_orm = (ResumenAnaliticoPaciente.objects
+                       .select_related('ultimo_episodio', 'ultimo_episodio_con_aura')
+                       .filter(paciente_id=paciente_id)
+                       .first())
+        return resumen_orm.a_resumen() if resumen_orm else None
+
+    def obtener_estadisticas_agregadas(self, paciente_id: int,
+                                       ventana: Optional[VentanaEpisodios] = None) -> Dict[str, Any]:
+        """
+        Obtiene los agregados de la bitácora del paciente. Para el historial
+        completo se usa el resumen materializado si existe; en otro caso, una
+        sola consulta de agregación sobre los episodios de la ventana.
+        """
+        if ventana is None or ventana.completa:
+            resumen = self.obtener_resumen_por_paciente(paciente_id)
+            if resumen is not None:
+                return resumen.estadisticas()
+
+        peso_severidad = Case(
+            *[When(severidad=severidad, then=Value(valor)) for severidad, valor in VALORES_SEVERIDAD.items()],
+            default=None,
+            output_field=IntegerField(),
+        )
+        return self._episodios_en_ventana(paciente_id, ventana).aggregate(
+            total=Count('id'),
+            duracion_promedio=Avg('duracion_cefalea_horas'),
+            severidad_promedio=Avg(peso_severidad),
+            episodios_menstruacion=Count('id', filter=Q(en_menstruacion=True)),
+            episodios_anticonceptivos=Count('id', filter=Q(anticonceptivos=True)),
+            primer_episodio=Min('creado_en'),
+            ultimo_episodio=Max('creado_en'),
+        )
+
+    def _episodios_en_rango(self, paciente_id: int, fecha_inicio: date, fecha_fin: date):
+        """
+        Filtra por límites de creado_en (en lugar de creado_en__date) para que
+        la base de datos pueda usar el índice de la columna.
+        """
+        return self._episodios_en_ventana(paciente_id, VentanaEpisodios(desde=fecha_inicio, hasta=fecha_fin))
+
+    def contar_episodios_en_rango(self, paciente_id: int, fecha_inicio: date, fecha_fin: date) -> int:
+        return self._episodios_en_rango(paciente_id, fecha_inicio, fecha_fin).count()
+
+    def contar_episodios_por_semana(self, paciente_id: int, fecha_inicio: date,
+                                    fecha_fin: date) -> List[Tuple[date, int]]:
+        semanas = (self._episodios_en_rango(paciente_id, fecha_inicio, fecha_fin)
+                   .annotate(semana=TruncWeek('creado_en'))
+                   .values('semana')
+                   .annotate(episodios=Count('id'))
+                   .order_by('semana'))
+        return [(fila['semana'].date(), fila['episodios']) for fila in semanas]
+
+    def contar_episodios_por_dia_semana(self, paciente_id: int,
+                                        ventana: Optional[VentanaEpisodios] = None) -> Dict[int, int]:
+        return ResumenAnaliticoPaciente.histograma_dias_semana(self._episodios_en_ventana(paciente_id, ventana))
+
+    def obtener_agregados_cohorte(self, paciente_ids: Sequence[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        Dos consultas agrupadas por paciente, sin importar cuántos sean: una con
+        el total, la duración promedio, la fecha del último episodio y el
+        conteo de cada severidad, y otra con la mezcla de categorías diagnósticas.
+        """
+        episodios = EpisodioCefalea.objects.filter(paciente_id__in=paciente_ids).order_by()
+        conteos_severidad = {
+            f'severidad_{severidad.lower()}': Count('id', filter=Q(severidad=severidad))
+            for severidad in VALORES_SEVERIDAD
+        }
+        agregados = {}
+        for fila in (episodios.values('paciente_id')
+                     .annotate(total=Count('id'),
+                               duracion_promedio=Avg('duracion_cefalea_horas'),
+                               ultimo_episodio=Max('creado_en'),
+                               **conteos_severidad)):
+            agregados[fila['paciente_id']] = {
+                'total': fila['total'],
+                'duracion_promedio': fila['duracion_promedio'],
+                'ultimo_episodio': fila['ultimo_episodio'],
+                'severidades': {severidad: fila[f'severidad_{severidad.lower()}'] for severidad in VALORES_SEVERIDAD},
+                'categorias': {},
+            }
+
+        categorias = (episodios.values('paciente_id', 'categoria_diagnostica')
+                      .annotate(episodios=Count('id'))
+                      .order_by('paciente_id', '-episodios', 'categoria_diagnostica'))
+        for fila in categorias:
+            agregados[fila['paciente_id']]['categorias'][fila['categoria_diagnostica']] = fila['episodios']
+        return agregados
+
+    def obtener_matriz_sintomas(self, paciente_ids) -> MatrizSintomas:
+        """
+        Una sola consulta agrupada por las columnas de la matriz: devuelve una
+        fila por combinación distinta (a lo sumo 2^7 × 3) con su número de
+        episodios, en lugar de una fila por episodio.
+        """
+        return MatrizSintomas.desde_conteos(EpisodioCefalea.objects
+                                            .filter(paciente_id__in=paciente_ids)
+                                            .order_by()
+                                            .values(*CAMPOS_MATRIZ_SINTOMAS)
+                                            .annotate(episodios=Count('id'))
+                                            .values_list(*CAMPOS_MATRIZ_SINTOMAS, 'episodios'))
 
     def guardar_episodio(self, paciente_id: int, episodio: EpisodioData):
         """
@@ -1,6 +1,25 @@
 # analiticas/serializers.py
 from rest_framework import serializers
 
+from .analisis_patrones_data_structures import DIAS_ISO, NOMBRES_DIAS
+
+
+class HistogramaDiasField(serializers.Field):
+    """
+    Histograma {día ISO: episodios}. Se presenta como una lista de lunes a
+    domingo con el nombre de cada día, que solo se añade al serializar.
+    """
+
+    def to_internal_value(self, data):
+        try:
+            return {int(dia): int(data.get(dia, data.get(str(dia), 0))) for dia in DIAS_ISO}
+        except (AttributeError, TypeError, ValueError):
+            raise serializers.ValidationError("Se esperaba un histograma {día ISO: episodios}.")
+
+    def to_representation(self, value):
+        return [{'dia': dia, 'nombre': NOMBRES_DIAS[dia], 'episodios': value.get(dia, 0)} for dia in DIAS_ISO]
+
+
 class AnalisisPatronesSerializer(serializers.Serializer):
     """
     Serializador para empaquetar todas las conclusiones del análisis.
@@ -9,4 +28,5 @@ class AnalisisPatronesSerializer(serializers.Serializer):
     conclusiones_sintomas = serializers.DictField()
     conclusion_aura = serializers.CharField()
     dias_recurrentes = serializers.ListField(child=serializers.CharField())
-    conclusion_hormonal = serializers.CharField()
\ No newline at end of file
+    recurrencia_semanal = HistogramaDiasField()
+    conclusion_hormonal = serializers.CharField()
@@ -1,9 +1,15 @@
 # analiticas/urls.py
 from django.urls import path
-from .views import AnalisisPatronesView, EstadisticasHistorialView, PromedioSemanalView
+from .views import (
+    AnalisisPatronesView, EstadisticasHistorialView, PromedioSemanalView, EstadisticasCacheView, CohorteMedicoView,
+    CorrelacionSintomasView,
+)
 
 urlpatterns = [
     path('patrones/', AnalisisPatronesView.as_view(), name='analisis-patrones'),
     path('estadisticas/', EstadisticasHistorialView.as_view(), name='estadisticas-historial'),
     path('promedio-semanal/', PromedioSemanalView.as_view(), name='promedio-semanal'),
+    path('cache/', EstadisticasCacheView.as_view(), name='estadisticas-cache'),
+    path('cohorte/', CohorteMedicoView.as_view(), name='cohorte-medico'),
+    path('correlacion-sintomas/', CorrelacionSintomasView.as_view(), name='correlacion-sintomas'),
 ]
\ No newline at end of file
@@ -1,27 +1,60 @@
 # analiticas/views.py
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework import status
 from django.http import Http404
 from datetime import datetime
 
+from .cache import cache_analiticas
 from .services import AnalisisPatronesService
 from .repositories import DjangoAnalisisPatronesRepository
 from .serializers import AnalisisPatronesSerializer
 from .estadisticas_service import EstadisticasHistorialService
-from .estadisticas_serializers import EstadisticasHistorialSerializer, PromediaSemanalRequestSerializer
+from .estadisticas_serializers import (
+    CohortePacienteSerializer, EstadisticasHistorialSerializer, PromediaSemanalRequestSerializer,
+    VentanaAnaliticaSerializer,
+)
+from .cohorte_service import CohorteMedicoService
+from .pagination import CohorteCursorPagination
+from .analisis_patrones_data_structures import VentanaEpisodios
 from drf_spectacular.utils import extend_schema
 from rest_framework.views import APIView
+from usuarios.authentication import JWTAuthenticationSinEstado
 from usuarios.models import Usuario
+from usuarios.permissions import EsMedico
+from agendamiento_citas.models import Cita
+
+
+def _ventana_desde_parametros(request) -> VentanaEpisodios:
+    """Ventana de episodios indicada con ?ultimos=N y/o ?desde=...&hasta=... (por defecto, todo el historial)."""
+    serializer = VentanaAnaliticaSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    return VentanaEpisodios(**serializer.validated_data)
+
+
+def _pacientes_del_medico(medico_id: int):
+    """Pacientes con al menos una cita con el médico."""
+    citas = Cita.objects.filter(doctor_id=medico_id).values('paciente_id')
+    return Usuario.objects.filter(tipo_usuario=Usuario.TipoUsuario.PACIENTE, id__in=citas)
+
+
+def _respuesta_con_cache(data, acierto, **kwargs):
+    """Construye la respuesta indicando si el resultado vino de la caché de analíticas."""
+    response = Response(data, **kwargs)
+    response['X-Cache-Analiticas'] = 'HIT' if acierto else 'MISS'
+    return response
 
 @extend_schema(
     summary="Análisis de patrones de migraña",
     description="Endpoint para analizar y devolver patrones en los datos de migraña del usuario.",
+    parameters=[VentanaAnaliticaSerializer],
     responses={200: {'type': 'object', 'example': {'patron_comun': 'estres', 'frecuencia': 10}}}
 )
 class AnalisisPatronesView(APIView):
     permission_classes = [IsAuthenticated] # Solo usuarios autenticados pueden ver su análisis
+    # La vista solo usa el ID y el rol del usuario: se resuelve desde el token, sin consultas
+    authentication_classes = [JWTAuthenticationSinEstado]
 
     def get(self, request, *args, **kwargs):
         # 1. Obtener el ID del paciente del usuario autenticado
@@ -31,23 +64,23 @@ class AnalisisPatronesView(APIView):
         repo = DjangoAnalisisPatronesRepository()
         servicio_analisis = AnalisisPatronesService(repository=repo)
 
-        # 3. Ejecutar todos los métodos de análisis
-        resultados = {
-            "conclusion_clinica": servicio_analisis.analizar_patrones_clinicos(paciente_id),
-            "conclusiones_sintomas": servicio_analisis.analizar_frecuencia_sintomas(paciente_id),
-            "conclusion_aura": servicio_analisis.analizar_patrones_aura(paciente_id),
-            "dias_recurrentes": servicio_analisis.analizar_recurrencia_semanal(paciente_id),
-            "conclusion_hormonal": servicio_analisis.analizar_patron_menstrual(paciente_id),
-        }
+        # 3. Ejecutar todos los análisis con una sola lectura de episodios,
+        #    salvo que ya estén en caché para la versión actual de la bitácora
+        ventana = _ventana_desde_parametros(request)
+        resultados, acierto = cache_analiticas.obtener_o_calcular(
+            paciente_id, 'patrones', ventana.como_parametros(),
+            lambda: servicio_analisis.analizar_todo(paciente_id, ventana)
+        )
 
         # 4. Usar el serializador para formatear la respuesta
         serializer = AnalisisPatronesSerializer(data=resultados)
         serializer.is_valid(raise_exception=True)
 
-        return Response(serializer.data)
+        return _respuesta_con_cache(serializer.data, acierto)
 
 @extend_schema(
     summary="Estadísticas del historial de migrañas",
+    parameters=[VentanaAnaliticaSerializer],
     responses={200: {'type': 'object'}} # Ajusta la respuesta según lo que devuelvas
 )
 class EstadisticasHistorialView(APIView):
@@ -57,8 +90,11 @@ class EstadisticasHistorialView(APIView):
     Endpoints:
     - GET /api/analiticas/estadisticas/ - Estadísticas del usuario actual (paciente)
     - GET /api/analiticas/estadisticas/?paciente_id=X - Estadísticas de paciente específico (personal médico)
+    - ?ultimos=N, ?desde=YYYY-MM-DD&hasta=YYYY-MM-DD - Limitar los episodios analizados (por defecto, todo el historial)
     """
     permission_classes = [IsAuthenticated]
+    # La vista solo usa el ID y el rol del usuario: se resuelve desde el token, sin consultas
+    authentication_classes = [JWTAuthenticationSinEstado]
 
     def get_paciente_id(self, request):
         """
@@ -110,52 +146,48 @@ class EstadisticasHistorialView(APIView):
         repo = DjangoAnalisisPatronesRepository()
         servicio_estadisticas = EstadisticasHistorialService(repository=repo)
 
+        # Obtener todas las estadísticas de bitácora digital en una sola consulta (o de la caché)
+        ventana = _ventana_desde_parametros(request)
+        resultados, acierto = cache_analiticas.obtener_o_calcular(
+            paciente_id, 'estadisticas', ventana.como_parametros(),
+            lambda: servicio_estadisticas.calcular_estadisticas_historial(paciente_id, ventana)
+        )
+
         # Validar que el paciente tenga episodios mínimos
-        if not servicio_estadisticas.validar_episodios_minimos(paciente_id):
-            return Response(
+        if resultados["total_episodios"] < 3:
+            return _respuesta_con_cache(
                 {"error": "El paciente debe tener al menos 3 episodios registrados para generar estadísticas"},
+                acierto,
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Obtener todas las estadísticas de bitácora digital
-        resultados = {}
-        
-        # 1. Duración promedio
-        duracion_promedio = servicio_estadisticas.calcular_duracion_promedio(paciente_id)
-        if duracion_promedio > 0:
-            resultados["duracion_promedio"] = duracion_promedio
-        
-        # 2. Intensidad promedio
-        intensidad_promedio = servicio_estadisticas.calcular_intensidad_promedio(paciente_id)
-        if intensidad_promedio != "No hay datos":
-            resultados["intensidad_promedio"] = intensidad_promedio
-        
-        # 3. Análisis hormonal
-        porcentajes_hormonales = servicio_estadisticas.calcular_porcentajes_hormonales(paciente_id)
-        resultados["porcentaje_menstruacion"] = porcentajes_hormonales["menstruacion"]
-        resultados["porcentaje_anticonceptivos"] = porcentajes_hormonales["anticonceptivos"]
-        
-        # 4. Información general de episodios
-        episodios = repo.obtener_episodios_por_paciente(paciente_id)
-        if episodios:
-            resultados["total_episodios"] = len(episodios)
-            resultados["fecha_primer_episodio"] = min(ep.fecha_creacion for ep in episodios).date()
-            resultados["fecha_ultimo_episodio"] = max(ep.fecha_creacion for ep in episodios).date()
-
         # Serializar y retornar respuesta
         serializer = EstadisticasHistorialSerializer(data=resultados)
         serializer.is_valid(raise_exception=True)
         
-        return Response(serializer.data)
+        return _respuesta_con_cache(serializer.data, acierto)
 
 @extend_schema(
     summary="Promedio Semanal de Episodios",
-    description="Calcula y devuelve el promedio de episodios de migraña por semana.",
+    description=(
+        "Calcula y devuelve el promedio de episodios de migraña por semana. "
+        "Con modo=serie devuelve el número de episodios de cada semana del período."
+    ),
     responses={
         200: { # Describe la respuesta exitosa
             'type': 'object',
             'properties': {
-                'promedio_semanal': {'type': 'number', 'example': 1.5}
+                'promedio_semanal': {'type': 'number', 'example': 1.5},
+                'serie': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'object',
+                        'properties': {
+                            'semana': {'type': 'string', 'format': 'date', 'example': '2024-01-01'},
+                            'episodios': {'type': 'integer', 'example': 2}
+                        }
+                    }
+                }
             }
         }
     }
@@ -167,8 +199,12 @@ class PromedioSemanalView(APIView):
     Endpoints:
     - GET /api/analiticas/promedio-semanal/ - Promedio semanal del usuario actual
     - GET /api/analiticas/promedio-semanal/?paciente_id=X&fecha_inicio=Y&fecha_fin=Z
+    - GET /api/analiticas/promedio-semanal/?fecha_inicio=Y&fecha_fin=Z&modo=serie - Episodios por semana
     """
+    MODOS = ('promedio', 'serie')
     permission_classes = [IsAuthenticated]
+    # La vista solo usa el ID y el rol del usuario: se resuelve desde el token, sin consultas
+    authentication_classes = [JWTAuthenticationSinEstado]
 
     def get_paciente_id(self, request):
         """
@@ -227,17 +263,164 @@ class PromedioSemanalView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Inicializar servicio y calcular promedio semanal
+        modo = request.query_params.get('modo', 'promedio')
+        if modo not in self.MODOS:
+            return Response(
+                {"error": f"Modo inválido. Use uno de: {', '.join(self.MODOS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Inicializar servicio y calcular promedio semanal (o la serie por semana)
         repo = DjangoAnalisisPatronesRepository()
         servicio_estadisticas = EstadisticasHistorialService(repository=repo)
-        
-        promedio_semanal = servicio_estadisticas.calcular_promedio_semanal(
-            paciente_id, fecha_inicio, fecha_fin
+        parametros = {'fecha_inicio': fecha_inicio_str, 'fecha_fin': fecha_fin_str}
+
+        if modo == 'serie':
+            serie, acierto = cache_analiticas.obtener_o_calcular(
+                paciente_id, 'serie-semanal', parametros,
+                lambda: servicio_estadisticas.calcular_serie_semanal(paciente_id, fecha_inicio, fecha_fin)
+            )
+            return _respuesta_con_cache({
+                "serie": serie,
+                "fecha_inicio": fecha_inicio.date(),
+                "fecha_fin": fecha_fin.date(),
+                "paciente_id": paciente_id
+            }, acierto)
+
+        promedio_semanal, acierto = cache_analiticas.obtener_o_calcular(
+            paciente_id, 'promedio-semanal', parametros,
+            lambda: servicio_estadisticas.calcular_promedio_semanal(paciente_id, fecha_inicio, fecha_fin)
         )
         
-        return Response({
+        return _respuesta_con_cache({
             "promedio_semanal": promedio_semanal,
             "fecha_inicio": fecha_inicio.date(),
             "fecha_fin": fecha_fin.date(),
             "paciente_id": paciente_id
-        })
\ No newline at end of file
+        }, acierto)
+
+
+@extend_schema(
+    summary="Estadísticas de la caché de analíticas",
+    description="Aciertos y fallos de la caché de analíticas. Con el backend 'local' los valores son del worker que responde.",
+    responses={200: {'type': 'object'}}
+)
+class EstadisticasCacheView(APIView):
+    """
+    API View para monitorear la caché de analíticas.
+
+    Endpoints:
+    - GET /api/analiticas/cache/ - Contadores de aciertos y fallos (solo administradores)
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(cache_analiticas.estadisticas())
+
+
+@extend_schema(
+    summary="Cohorte de pacientes del médico",
+    description=(
+        "Resumen de la bitácora de cada paciente con citas con el médico autenticado: total de episodios, "
+        "duración promedio, distribución de severidad, categorías diagnósticas y fecha del último episodio. "
+        "Paginado por cursor (?cursor=..., ?page_size=N)."
+    ),
+    responses={200: CohortePacienteSerializer(many=True)}
+)
+class CohorteMedicoView(APIView):
+    """
+    API View para la cohorte de pacientes de un médico.
+
+    Endpoints:
+    - GET /api/analiticas/cohorte/ - Pacientes del médico autenticado, por páginas
+
+    Cada página cuesta tres consultas sin importar su tamaño: la página de
+    pacientes y dos agregaciones agrupadas por paciente sobre sus episodios.
+    """
+    permission_classes = [EsMedico]
+    # El médico se identifica con el ID del token, sin consultas
+    authentication_classes = [JWTAuthenticationSinEstado]
+    pagination_class = CohorteCursorPagination
+
+    def get_queryset(self):
+        return _pacientes_del_medico(self.request.user.pk).only('id', 'first_name', 'last_name')
+
+    def get(self, request, *args, **kwargs):
+        paginador = self.pagination_class()
+        pacientes = paginador.paginate_queryset(self.get_queryset(), request, view=self)
+        filas = CohorteMedicoService().resumir_pacientes(pacientes)
+        return paginador.get_paginated_response(CohortePacienteSerializer(filas, many=True).data)
+
+
+@extend_schema(
+    summary="Coocurrencia y correlación de síntomas",
+    description=(
+        "Matriz de coocurrencias y de correlación phi entre síntomas (náuseas, fotofobia, fonofobia, aura, "
+        "empeora con la actividad), factores hormonales y niveles de severidad. Del paciente autenticado, "
+        "de un paciente (?paciente_id=X, personal médico) o de toda la cohorte del médico (?cohorte=true)."
+    ),
+    responses={200: {'type': 'object'}}
+)
+class CorrelacionSintomasView(APIView):
+    """
+    API View para la correlación entre síntomas.
+
+    Endpoints:
+    - GET /api/analiticas/correlacion-sintomas/ - Episodios del usuario actual (paciente)
+    - GET /api/analiticas/correlacion-sintomas/?paciente_id=X - Paciente específico (personal médico)
+    - GET /api/analiticas/correlacion-sintomas/?cohorte=true - Todos los pacientes del médico
+    """
+    permission_classes = [IsAuthenticated]
+    # La vista solo usa el ID y el rol del usuario: se resuelve desde el token, sin consultas
+    authentication_classes = [JWTAuthenticationSinEstado]
+
+    def get_paciente_id(self, request):
+        """
+        Obtiene el ID del paciente según el rol del usuario.
+        """
+        user = request.user
+
+        if user.es_medico or user.es_enfermera:
+            paciente_id = request.query_params.get('paciente_id')
+            if paciente_id:
+                try:
+                    paciente = Usuario.objects.get(id=paciente_id, tipo_usuario=Usuario.TipoUsuario.PACIENTE)
+                    return paciente.id
+                except (Usuario.DoesNotExist, ValueError):
+                    raise Http404("Paciente no encontrado")
+            return None
+        elif user.es_paciente:
+            return user.id
+        else:
+            return None
+
+    def get(self, request, *args, **kwargs):
+        servicio_analisis = AnalisisPatronesService(repository=DjangoAnalisisPatronesRepository())
+
+        if request.query_params.get('cohorte', '').lower() in ('true', '1'):
+            if not request.user.es_medico:
+                return Response(
+                    {"error": "Solo los médicos pueden consultar la correlación de su cohorte"},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+            # Los pacientes se pasan como subconsulta: la matriz se lee con una sola consulta
+            pacientes = _pacientes_del_medico(request.user.pk).values_list('id', flat=True)
+            return Response(servicio_analisis.analizar_correlacion_sintomas(pacientes))
+
+        paciente_id = self.get_paciente_id(request)
+        if paciente_id is None:
+            if request.user.es_medico or request.user.es_enfermera:
+                return Response(
+                    {"error": "Debe especificar 'paciente_id' o 'cohorte=true'"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return Response(
+                {"error": "No tiene permisos para acceder a estadísticas"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        resultados, acierto = cache_analiticas.obtener_o_calcular(
+            paciente_id, 'correlacion-sintomas', {},
+            lambda: servicio_analisis.analizar_correlacion_sintomas([paciente_id])
+        )
+        return _respuesta_con_cache(resultados, acierto)
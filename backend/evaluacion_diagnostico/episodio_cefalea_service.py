@@ -1,9 +1,20 @@
 # evaluacion_diagnostico/services.py
 from typing import Dict, Any, List, Optional
+
+import numpy as np
 from django.core.exceptions import ValidationError
 from django.db import transaction
 from usuarios.models import Usuario
 
+# Columnas que intervienen en la categorización IHS/ICHD-3
+CAMPOS_CATEGORIZACION = (
+    'presencia_aura', 'duracion_aura_minutos', 'severidad', 'localizacion', 'caracter_dolor',
+    'empeora_actividad', 'nauseas_vomitos', 'fotofobia', 'fonofobia',
+)
+
+# Índices de np.select: 0 con aura, 1 sin aura, 2 (por defecto) tensional
+CATEGORIAS_LOTE = np.array(['Migraña con aura', 'Migraña sin aura', 'Cefalea de tipo tensional'], dtype=object)
+
 
 class EpisodioCefaleaService:
     """
@@ -104,6 +115,68 @@ class EpisodioCefaleaService:
 
         return 'Cefalea de tipo tensional'
 
+    def categorizar_episodios(self, columnas: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Versión vectorizada de categorizar_episodio: recibe una columna (arreglo
+        NumPy) por cada campo de CAMPOS_CATEGORIZACION y devuelve la categoría
+        de cada fila. Debe mantenerse equivalente a la regla por episodio.
+        """
+        presencia_aura = columnas['presencia_aura'].astype(bool)
+        # Rasgos comunes a ambas migrañas
+        migrana = (np.isin(columnas['severidad'], ['Moderada', 'Severa']) &
+                   (columnas['localizacion'] == 'Unilateral') &
+                   (columnas['caracter_dolor'] == 'Pulsátil') &
+                   columnas['empeora_actividad'].astype(bool))
+        fotofobia_o_fonofobia = columnas['fotofobia'].astype(bool) | columnas['fonofobia'].astype(bool)
+
+        con_aura = presencia_aura & (columnas['duracion_aura_minutos'] > 0) & migrana & fotofobia_o_fonofobia
+        sin_aura = ~presencia_aura & migrana & (columnas['nauseas_vomitos'].astype(bool) | fotofobia_o_fonofobia)
+
+        return CATEGORIAS_LOTE[np.select([con_aura, sin_aura], [0, 1], default=2)]
+
+    def recategorizar_historial(self, tamano_lote: int = 5000, simular: bool = False) -> Dict[str, int]:
+        """
+        Vuelve a categorizar todos los episodios guardados, por lotes de
+        `tamano_lote` filas recorridos por ID. Solo se escriben las filas cuya
+        categoría cambió, con un UPDATE por categoría en cada lote. Al terminar
+        se reconstruye una sola vez el resumen analítico de cada paciente
+        afectado (lo que también invalida su caché de analíticas).
+        Con `simular` solo se cuentan los cambios.
+        """
+        from analiticas.models import ResumenAnaliticoPaciente
+        from .models import EpisodioCefalea
+
+        campos = ('id', 'paciente_id', 'categoria_diagnostica') + CAMPOS_CATEGORIZACION
+        revisados = actualizados = 0
+        ultimo_id = 0
+        pacientes_afectados = set()
+        while True:
+            filas = list(EpisodioCefalea.objects
+                         .filter(id__gt=ultimo_id)
+                         .order_by('id')
+                         .values_list(*campos)[:tamano_lote])
+            if not filas:
+                break
+            columnas = {campo: np.array(valores) for campo, valores in zip(campos, zip(*filas))}
+            categorias = self.categorizar_episodios(columnas)
+
+            cambios = categorias != columnas['categoria_diagnostica']
+            revisados += len(filas)
+            actualizados += int(cambios.sum())
+            if not simular and cambios.any():
+                with transaction.atomic():
+                    for categoria in np.unique(categorias[cambios]):
+                        ids = columnas['id'][cambios & (categorias == categoria)]
+                        EpisodioCefalea.objects.filter(id__in=ids.tolist()).update(categoria_diagnostica=categoria)
+                pacientes_afectados.update(np.unique(columnas['paciente_id'][cambios]).tolist())
+            ultimo_id = filas[-1][0]
+
+        # Un paciente cuyos episodios abarcan varios lotes se reconstruye una sola vez
+        for paciente_id in sorted(pacientes_afectados):
+            ResumenAnaliticoPaciente.reconstruir(paciente_id)
+
+        return {'revisados': revisados, 'actualizados': actualizados}
+
     @transaction.atomic
     def registrar_nuevo_episodio(self, paciente: Usuario, datos_validados: dict):
         """
@@ -124,8 +197,77 @@ class EpisodioCefaleaService:
         # 4. Persistencia final en la base de datos real.
         episodio.save()
 
+        # 5. Actualizar el resumen analítico del paciente en la misma transacción.
+        #    Su versión aumenta e invalida las respuestas de analíticas en caché.
+        from analiticas.models import ResumenAnaliticoPaciente
+        ResumenAnaliticoPaciente.registrar_episodio(episodio)
+
         return episodio
 
+    @transaction.atomic
+    def registrar_lote_episodios(self, paciente: Usuario, elementos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Registra un lote de episodios sincronizados desde la app móvil.
+
+        Cada elemento es {'datos': datos_validados, 'errores': errores_del_serializer}.
+        Los episodios cuyo uuid_cliente ya existe (o se repite en el lote) no se
+        vuelven a crear, por lo que reenviar un lote es seguro. Los válidos se
+        guardan con un solo INSERT y el resumen analítico se actualiza una vez.
+        Devuelve el resultado de cada elemento, en el orden recibido.
+        """
+        from .models import EpisodioCefalea
+        from analiticas.models import ResumenAnaliticoPaciente
+
+        # Bloquear al paciente serializa las sincronizaciones simultáneas del mismo dispositivo
+        Usuario.objects.select_for_update().filter(pk=paciente.pk).exists()
+
+        uuids = [e['datos']['uuid_cliente'] for e in elementos if e['datos']]
+        existentes = dict(EpisodioCefalea.objects
+                          .filter(paciente=paciente, uuid_cliente__in=uuids)
+                          .values_list('uuid_cliente', 'id'))
+
+        resultados = []
+        nuevos = []
+        vistos = set()
+        for indice, elemento in enumerate(elementos):
+            datos = elemento['datos']
+            resultado = {'indice': indice, 'uuid_cliente': datos['uuid_cliente'] if datos else None,
+                         'estado': 'error', 'id': None, 'errores': elemento['errores']}
+            resultados.append(resultado)
+            if datos is None:
+                continue
+
+            uuid_cliente = datos['uuid_cliente']
+            if uuid_cliente in existentes or uuid_cliente in vistos:
+                resultado.update(estado='existente', id=existentes.get(uuid_cliente))
+                continue
+
+            episodio = EpisodioCefalea(paciente=paciente, categoria_diagnostica=self.categorizar_episodio(datos),
+                                       **datos)
+            try:
+                # La unicidad ya se resolvió con los UUID consultados arriba
+                episodio.full_clean(exclude=['paciente'], validate_unique=False, validate_constraints=False)
+            except ValidationError as e:
+                resultado['errores'] = e.message_dict if hasattr(e, 'error_dict') else e.messages
+                continue
+
+            vistos.add(uuid_cliente)
+            nuevos.append((resultado, episodio))
+
+        if nuevos:
+            episodios = EpisodioCefalea.objects.bulk_create([episodio for _, episodio in nuevos])
+            for (resultado, _), episodio in zip(nuevos, episodios):
+                resultado.update(estado='creado', id=episodio.id)
+            # Los duplicados dentro del lote apuntan al episodio recién creado
+            creados = {episodio.uuid_cliente: episodio.id for episodio in episodios}
+            for resultado in resultados:
+                if resultado['estado'] == 'existente' and resultado['id'] is None:
+                    resultado['id'] = creados.get(resultado['uuid_cliente'])
+
+            ResumenAnaliticoPaciente.registrar_episodios(paciente.pk, episodios)
+
+        return resultados
+
     def crear_episodio(self, paciente: Usuario, datos_episodio: Dict[str, Any]):
         """Crear episodio usando el repositorio inyectado."""
         # Validaciones
@@ -29,3 +29,29 @@ Característica: Bitácora digital de episodios de cefalea.
       | Migraña sin aura          | 6                      | Severa    | Unilateral   | Pulsátil       | Sí                | Sí              | Sí        | Sí        | No             | Ninguno              | 0                     | Si              | Si              |
       | Migraña con aura          | 4                      | Moderada  | Unilateral   | Pulsátil       | Sí                | No              | Sí        | Sí        | Sí             | Visuales, Sensitivos | 30                    | Si              | Si              |
       | Cefalea de tipo tensional | 2                      | Leve      | Bilateral    | Opresivo       | No                | No              | No        | Sí        | No             | Ninguno              | 0                     | No              | No              |
+
+  Escenario: Sincronización por lote de episodios registrados sin conexión
+    Dado que un paciente registró sin conexión un lote de 5 episodios con un elemento inválido y un UUID repetido
+    Cuando el paciente sincroniza el lote
+    Entonces se crean 3 episodios, 1 se reporta como existente y 1 con error
+    Y la sincronización del lote usa un número de consultas que no depende de su tamaño
+    Y el resumen analítico del paciente cuenta 3 episodios
+    Cuando el paciente sincroniza el lote
+    Entonces se crean 0 episodios, 4 se reporta como existente y 1 con error
+    Y el resumen analítico del paciente cuenta 3 episodios
+
+  Escenario: Recategorización masiva del historial de episodios
+    Dado que existen 60 episodios guardados con una categoría desactualizada
+    Y el paciente ya consultó su análisis de patrones con las categorías desactualizadas
+    Cuando se ejecuta la recategorización del historial en lotes de 25 episodios
+    Entonces cada episodio queda con la misma categoría que asigna la categorización individual
+    Y el resumen analítico del paciente refleja las nuevas categorías tras reconstruirse una sola vez
+    Y el análisis de patrones del paciente se recalcula sin usar la caché
+    Y una segunda recategorización no modifica ningún episodio
+
+  Escenario: Paginación por cursor de la bitácora de un paciente
+    Dado que un paciente tiene 45 episodios registrados en su bitácora
+    Cuando el médico recorre la bitácora del paciente en páginas de 20 episodios
+    Entonces recibe los 45 episodios una sola vez, del más reciente al más antiguo
+    Y ninguna página cuenta el total de episodios
+    Y la última página ejecuta las mismas consultas que la primera
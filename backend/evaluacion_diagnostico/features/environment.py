@@ -24,3 +24,7 @@ def before_all(context):
     # Verificación final
     if not apps.ready:
         raise Exception("Django apps no están configuradas correctamente")
+
+    # Las peticiones del cliente de pruebas de DRF llegan con el host 'testserver'
+    from utilidades_behave import habilitar_cliente_de_pruebas
+    habilitar_cliente_de_pruebas()
@@ -4,6 +4,7 @@ from usuarios.repositories import FakeUserRepository
 from evaluacion_diagnostico.repositories import FakeEpisodioCefaleaRepository
 from evaluacion_diagnostico.episodio_cefalea_service import EpisodioCefaleaService
 from django.core.exceptions import ValidationError
+from utilidades_behave import cliente_autenticado
 
 use_step_matcher("re")
 
@@ -70,4 +71,294 @@ def step_impl(context):
     ultimo_episodio_guardado = context.episode_repo.obtener_ultimo_episodio(context.paciente)
     assert ultimo_episodio_guardado is not None, "El episodio no se guardó en la bitácora del paciente."
     assert ultimo_episodio_guardado.pk == context.episodio_creado.pk, \
-        "El episodio guardado en la bitácora no es el que se acaba de crear."
\ No newline at end of file
+        "El episodio guardado en la bitácora no es el que se acaba de crear."
+
+# ============ STEPS PARA SINCRONIZACIÓN POR LOTE ============
+
+@given("que un paciente registró sin conexión un lote de (?P<total>\\d+) episodios con un elemento inválido y un UUID repetido")
+def step_impl(context, total):
+    import uuid
+    from usuarios.models import Usuario
+
+    context.paciente = Usuario.objects.create_user(
+        username=fake.unique.user_name(),
+        email=fake.unique.email(),
+        password='testpassword123',
+        first_name=fake.first_name(),
+        last_name=fake.last_name(),
+        cedula=str(fake.unique.random_number(digits=10, fix_len=True)),
+        tipo_usuario=Usuario.TipoUsuario.PACIENTE,
+        genero=Usuario.Genero.FEMENINO,
+    )
+
+    context.lote = []
+    for _ in range(int(total) - 1):
+        context.lote.append({
+            'uuid_cliente': str(uuid.uuid4()),
+            'duracion_cefalea_horas': fake.random_int(min=1, max=12),
+            'severidad': 'Severa',
+            'localizacion': 'Unilateral',
+            'caracter_dolor': 'Pulsátil',
+            'empeora_actividad': True,
+            'nauseas_vomitos': True,
+            'fotofobia': True,
+            'fonofobia': False,
+            'presencia_aura': False,
+            'sintomas_aura': 'Ninguno',
+            'duracion_aura_minutos': 0,
+            'en_menstruacion': False,
+            'anticonceptivos': False,
+        })
+    # El tercer elemento tiene una severidad inválida y el último repite el UUID del primero
+    context.lote[2] = {**context.lote[2], 'severidad': 'Insoportable'}
+    context.lote.append({**context.lote[0]})
+
+
+@when("el paciente sincroniza el lote")
+def step_impl(context):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    cliente = cliente_autenticado(context.paciente)
+    with CaptureQueriesContext(connection) as consultas:
+        context.respuesta = cliente.post('/api/evaluaciones/episodios/lote/', context.lote, format='json')
+    context.consultas_lote = [c['sql'] for c in consultas.captured_queries
+                              if not c['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+
+
+@then("se crean (?P<creados>\\d+) episodios, (?P<existentes>\\d+) se reporta como existente y (?P<errores>\\d+) con error")
+def step_impl(context, creados, existentes, errores):
+    from evaluacion_diagnostico.models import EpisodioCefalea
+
+    datos = context.respuesta.data
+    assert context.respuesta.status_code in (200, 201), context.respuesta.content
+    assert (datos['creados'], datos['existentes'], datos['errores']) == (int(creados), int(existentes), int(errores)), datos
+
+    resultados = datos['resultados']
+    assert [r['indice'] for r in resultados] == list(range(len(context.lote)))
+    assert 'severidad' in resultados[2]['errores'], resultados[2]
+    # El UUID repetido apunta al mismo episodio que su primera aparición
+    assert resultados[-1]['id'] == resultados[0]['id'] is not None, resultados
+    assert EpisodioCefalea.objects.filter(paciente=context.paciente).count() == 3
+    assert all(r['estado'] != 'creado' or r['id'] for r in resultados)
+
+
+@then("la sincronización del lote usa un número de consultas que no depende de su tamaño")
+def step_impl(context):
+    # Bloqueo del paciente, UUID existentes, un INSERT masivo y la creación del resumen
+    inserciones = [sql for sql in context.consultas_lote if sql.startswith('INSERT INTO "evaluacion_episodio_cefalea"')]
+    assert len(inserciones) == 1, inserciones
+    assert len(context.consultas_lote) <= 10, f"El lote ejecutó {len(context.consultas_lote)} consultas"
+
+
+@then("el resumen analítico del paciente cuenta (?P<total>\\d+) episodios")
+def step_impl(context, total):
+    from analiticas.models import ResumenAnaliticoPaciente
+    from evaluacion_diagnostico.models import EpisodioCefalea
+
+    resumen = ResumenAnaliticoPaciente.objects.get(paciente=context.paciente)
+    assert resumen.total_episodios == int(total), resumen.total_episodios
+    ultimo = EpisodioCefalea.objects.filter(paciente=context.paciente).latest('creado_en', 'id')
+    assert resumen.ultimo_episodio_id == ultimo.id, (resumen.ultimo_episodio_id, ultimo.id)
+
+
+# ============ STEPS PARA RECATEGORIZACIÓN MASIVA ============
+
+@given("que existen (?P<total>\\d+) episodios guardados con una categoría desactualizada")
+def step_impl(context, total):
+    from evaluacion_diagnostico.models import EpisodioCefalea
+    from usuarios.models import Usuario
+
+    paciente = Usuario.objects.create_user(
+        username=fake.unique.user_name(),
+        email=fake.unique.email(),
+        password='testpassword123',
+        first_name=fake.first_name(),
+        last_name=fake.last_name(),
+        cedula=str(fake.unique.random_number(digits=10, fix_len=True)),
+        tipo_usuario=Usuario.TipoUsuario.PACIENTE,
+    )
+    episodios = []
+    for _ in range(int(total)):
+        presencia_aura = fake.boolean()
+        episodios.append(EpisodioCefalea(
+            paciente=paciente,
+            duracion_cefalea_horas=fake.random_int(min=1, max=12),
+            severidad=fake.random_element(elements=('Leve', 'Moderada', 'Severa')),
+            localizacion=fake.random_element(elements=('Unilateral', 'Bilateral')),
+            caracter_dolor=fake.random_element(elements=('Pulsátil', 'Opresivo', 'Punzante')),
+            empeora_actividad=fake.boolean(chance_of_getting_true=80),
+            nauseas_vomitos=fake.boolean(),
+            fotofobia=fake.boolean(),
+            fonofobia=fake.boolean(),
+            presencia_aura=presencia_aura,
+            sintomas_aura='Visuales' if presencia_aura else '',
+            duracion_aura_minutos=fake.random_int(min=5, max=60) if presencia_aura else 0,
+            en_menstruacion=False,
+            categoria_diagnostica='',
+        ))
+    # Algunas migrañas sin aura durante la menstruación, que hoy no cuentan como migrañas
+    for episodio in episodios[:5]:
+        episodio.severidad, episodio.localizacion, episodio.caracter_dolor = 'Severa', 'Unilateral', 'Pulsátil'
+        episodio.empeora_actividad = episodio.nauseas_vomitos = episodio.en_menstruacion = True
+        episodio.presencia_aura, episodio.sintomas_aura, episodio.duracion_aura_minutos = False, '', 0
+    context.episodios_ids = [e.id for e in EpisodioCefalea.objects.bulk_create(episodios)]
+    context.paciente = paciente
+
+
+@given("el paciente ya consultó su análisis de patrones con las categorías desactualizadas")
+def step_impl(context):
+    from analiticas.models import ResumenAnaliticoPaciente
+
+    resumen = ResumenAnaliticoPaciente.reconstruir(context.paciente.pk)
+    assert resumen.migranas_menstruales == 0, resumen.migranas_menstruales
+    context.version_previa = resumen.version
+    respuesta = _consultar_patrones(context)
+    respuesta = _consultar_patrones(context)
+    assert respuesta['X-Cache-Analiticas'] == 'HIT', respuesta['X-Cache-Analiticas']
+    context.patrones_previos = respuesta.data
+
+
+def _consultar_patrones(context):
+    cliente = cliente_autenticado(context.paciente)
+    respuesta = cliente.get('/api/analiticas/patrones/')
+    assert respuesta.status_code == 200, respuesta.content
+    return respuesta
+
+
+@when("se ejecuta la recategorización del historial en lotes de (?P<lote>\\d+) episodios")
+def step_impl(context, lote):
+    from io import StringIO
+    from django.core.management import call_command
+
+    salida = StringIO()
+    call_command('recategorizar_episodios', lote=int(lote), stdout=salida)
+    context.salida_recategorizacion = salida.getvalue()
+
+
+@then("cada episodio queda con la misma categoría que asigna la categorización individual")
+def step_impl(context):
+    from evaluacion_diagnostico.episodio_cefalea_service import CAMPOS_CATEGORIZACION, EpisodioCefaleaService
+    from evaluacion_diagnostico.models import EpisodioCefalea
+
+    servicio = EpisodioCefaleaService()
+    filas = EpisodioCefalea.objects.filter(id__in=context.episodios_ids).values(
+        'categoria_diagnostica', *CAMPOS_CATEGORIZACION)
+    for fila in filas:
+        esperada = servicio.categorizar_episodio(fila)
+        assert fila['categoria_diagnostica'] == esperada, (fila, esperada)
+    assert len(filas) == len(context.episodios_ids)
+    assert 'Episodios revisados' in context.salida_recategorizacion, context.salida_recategorizacion
+
+
+@then("el resumen analítico del paciente refleja las nuevas categorías tras reconstruirse una sola vez")
+def step_impl(context):
+    from analiticas.models import ResumenAnaliticoPaciente
+    from evaluacion_diagnostico.models import EpisodioCefalea
+
+    resumen = ResumenAnaliticoPaciente.objects.get(paciente=context.paciente)
+    migranas_menstruales = EpisodioCefalea.objects.filter(
+        paciente=context.paciente, en_menstruacion=True, categoria_diagnostica__contains='Migraña').count()
+    assert migranas_menstruales >= 5, migranas_menstruales
+    assert resumen.migranas_menstruales == migranas_menstruales, (resumen.migranas_menstruales, migranas_menstruales)
+    # Los episodios del paciente abarcan varios lotes, pero su resumen se reconstruye una vez
+    assert resumen.version == context.version_previa + 1, (resumen.version, context.version_previa)
+
+
+@then("el análisis de patrones del paciente se recalcula sin usar la caché")
+def step_impl(context):
+    respuesta = _consultar_patrones(context)
+    assert respuesta['X-Cache-Analiticas'] == 'MISS', respuesta['X-Cache-Analiticas']
+    assert respuesta.data['conclusion_hormonal'] != context.patrones_previos['conclusion_hormonal'], respuesta.data
+
+
+@then("una segunda recategorización no modifica ningún episodio")
+def step_impl(context):
+    from evaluacion_diagnostico.episodio_cefalea_service import EpisodioCefaleaService
+
+    resultado = EpisodioCefaleaService().recategorizar_historial(tamano_lote=25, simular=True)
+    assert resultado['actualizados'] == 0, resultado
+    assert resultado['revisados'] >= len(context.episodios_ids), resultado
+
+
+# ============ STEPS PARA PAGINACIÓN POR CURSOR ============
+
+@given("que un paciente tiene (?P<total>\\d+) episodios registrados en su bitácora")
+def step_impl(context, total):
+    from datetime import timedelta
+    from django.utils import timezone
+    from evaluacion_diagnostico.models import EpisodioCefalea
+    from usuarios.models import Usuario
+
+    context.paciente = Usuario.objects.create_user(
+        username=fake.unique.user_name(),
+        email=fake.unique.email(),
+        password='testpassword123',
+        first_name=fake.first_name(),
+        last_name=fake.last_name(),
+        cedula=str(fake.unique.random_number(digits=10, fix_len=True)),
+        tipo_usuario=Usuario.TipoUsuario.PACIENTE,
+    )
+    episodios = EpisodioCefalea.objects.bulk_create([
+        EpisodioCefalea(
+            paciente=context.paciente,
+            duracion_cefalea_horas=fake.random_int(min=1, max=12),
+            severidad='Moderada', localizacion='Bilateral', caracter_dolor='Opresivo',
+            empeora_actividad=False, nauseas_vomitos=False, fotofobia=False, fonofobia=False,
+            presencia_aura=False, duracion_aura_minutos=0,
+            categoria_diagnostica='Cefalea de tipo tensional',
+        )
+        for _ in range(int(total))
+    ])
+    # Fechas repartidas en el tiempo, con algunos episodios a la misma hora
+    inicio = timezone.now() - timedelta(days=400)
+    for i, episodio in enumerate(episodios):
+        episodio.creado_en = inicio + timedelta(days=(i // 3) * 7)
+    EpisodioCefalea.objects.bulk_update(episodios, ['creado_en'])
+    context.episodios_esperados = [e.id for e in sorted(episodios, key=lambda e: (e.creado_en, e.id), reverse=True)]
+
+
+@when("el médico recorre la bitácora del paciente en páginas de (?P<tamano>\\d+) episodios")
+def step_impl(context, tamano):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from usuarios.models import Usuario
+
+    medico = Usuario.objects.create_user(
+        username=fake.unique.user_name(),
+        email=fake.unique.email(),
+        password='testpassword123',
+        cedula=str(fake.unique.random_number(digits=10, fix_len=True)),
+        tipo_usuario=Usuario.TipoUsuario.MEDICO,
+    )
+    cliente = cliente_autenticado(medico)
+
+    context.paginas = []
+    url = f'/api/evaluaciones/episodios/?paciente_id={context.paciente.id}&page_size={tamano}'
+    while url:
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = cliente.get(url)
+        assert respuesta.status_code == 200, respuesta.content
+        context.paginas.append((respuesta.data, [c['sql'] for c in consultas.captured_queries]))
+        url = respuesta.data['next']
+
+
+@then("recibe los (?P<total>\\d+) episodios una sola vez, del más reciente al más antiguo")
+def step_impl(context, total):
+    recibidos = [e['id'] for datos, _ in context.paginas for e in datos['results']]
+    assert len(context.paginas) == 3, len(context.paginas)
+    assert len(recibidos) == int(total), len(recibidos)
+    assert recibidos == context.episodios_esperados, recibidos
+
+
+@then("ninguna página cuenta el total de episodios")
+def step_impl(context):
+    for datos, consultas in context.paginas:
+        assert 'count' not in datos, datos.keys()
+        assert not [sql for sql in consultas if 'COUNT(' in sql.upper()], consultas
+
+
+@then("la última página ejecuta las mismas consultas que la primera")
+def step_impl(context):
+    primera, ultima = context.paginas[0][1], context.paginas[-1][1]
+    assert len(primera) == len(ultima), (primera, ultima)
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from evaluacion_diagnostico.episodio_cefalea_service import episodio_cefalea_service
+
+
+class Command(BaseCommand):
+    help = ("Vuelve a categorizar todos los episodios de cefalea con los criterios IHS/ICHD-3 vigentes. "
+            "Usar tras modificar las reglas de categorización.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000,
+                            help='Episodios leídos y actualizados por lote (por defecto 5000).')
+        parser.add_argument('--simular', action='store_true',
+                            help='Solo cuenta los episodios que cambiarían de categoría, sin guardarlos.')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        resultado = episodio_cefalea_service.recategorizar_historial(
+            tamano_lote=options['lote'], simular=options['simular']
+        )
+        segundos = time.monotonic() - inicio
+
+        accion = 'cambiarían' if options['simular'] else 'actualizados'
+        self.stdout.write(self.style.SUCCESS(
+            f"Episodios revisados: {resultado['revisados']}, {accion}: {resultado['actualizados']} "
+            f"({segundos:.2f} s)"
+        ))
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('evaluacion_diagnostico', '0002_pregunta_alter_episodiocefalea_anticonceptivos_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='episodiocefalea',
+            name='uuid_cliente',
+            field=models.UUIDField(blank=True, editable=False, null=True, verbose_name='UUID del Cliente'),
+        ),
+        migrations.AddConstraint(
+            model_name='episodiocefalea',
+            constraint=models.UniqueConstraint(fields=('paciente', 'uuid_cliente'), name='episodio_uuid_cliente_unico'),
+        ),
+    ]
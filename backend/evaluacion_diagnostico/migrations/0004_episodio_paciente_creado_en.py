@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('evaluacion_diagnostico', '0003_episodio_uuid_cliente'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='episodiocefalea',
+            index=models.Index(fields=['paciente', 'creado_en'], name='evaluacion__pacient_114a61_idx'),
+        ),
+        # El índice compuesto cubre los filtros que usaban el índice solo por paciente
+        migrations.RemoveIndex(
+            model_name='episodiocefalea',
+            name='evaluacion__pacient_c53dc1_idx',
+        ),
+    ]
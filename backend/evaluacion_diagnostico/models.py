@@ -266,17 +266,29 @@ class EpisodioCefalea(models.Model):
         verbose_name='Fecha de Registro'
     )
 
+    # Identificador generado por la app móvil; hace idempotente la sincronización por lotes
+    uuid_cliente = models.UUIDField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='UUID del Cliente'
+    )
+
     class Meta:
         verbose_name = 'Episodio de Cefalea'
         verbose_name_plural = 'Episodios de Cefalea'
         db_table = 'evaluacion_episodio_cefalea'
         ordering = ['-creado_en']
         indexes = [
-            models.Index(fields=['paciente']),
+            # Bitácora de un paciente ordenada por fecha (paginación por cursor)
+            models.Index(fields=['paciente', 'creado_en']),
             models.Index(fields=['categoria_diagnostica']),
             models.Index(fields=['creado_en']),
             models.Index(fields=['severidad']),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=['paciente', 'uuid_cliente'], name='episodio_uuid_cliente_unico'),
+        ]
 
     def __str__(self):
         """Representación string del episodio"""
@@ -0,0 +1,18 @@
+# evaluacion_diagnostico/pagination.py
+from rest_framework.pagination import CursorPagination
+
+
+class EpisodioCursorPagination(CursorPagination):
+    """
+    Paginación por cursor de la bitácora, del episodio más reciente al más
+    antiguo. El cursor guarda solo la posición en creado_en (el primer campo
+    del orden); los episodios con el mismo creado_en se saltan con un
+    desplazamiento dentro del cursor. -id solo fija un orden estable entre
+    ellos: no es un keyset compuesto (creado_en, id). Así las páginas
+    profundas cuestan lo mismo que la primera y no se ejecuta un COUNT(*) del
+    historial. El índice (paciente, creado_en) resuelve el filtro por
+    paciente y el orden.
+    """
+    ordering = ('-creado_en', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
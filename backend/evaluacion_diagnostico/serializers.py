@@ -119,6 +119,33 @@ class CrearEpisodioCefaleaSerializer(serializers.ModelSerializer):
                 del self.fields['anticonceptivos']
 
 
+class LoteEpisodiosListSerializer(serializers.ListSerializer):
+    """
+    Valida un lote de episodios sin descartarlo entero por un elemento inválido.
+    Cada elemento queda como {'datos': ..., 'errores': ...} para que el servicio
+    informe el resultado de cada uno; las validaciones del lote (vacío, tamaño
+    máximo) siguen rechazando la petición completa.
+    """
+
+    def run_child_validation(self, data):
+        try:
+            return {'datos': super().run_child_validation(data), 'errores': None}
+        except serializers.ValidationError as exc:
+            return {'datos': None, 'errores': exc.detail}
+
+
+class CrearEpisodioLoteSerializer(CrearEpisodioCefaleaSerializer):
+    """
+    Episodio registrado sin conexión en la app móvil. El UUID lo genera el
+    cliente y permite reenviar el lote sin duplicar episodios.
+    """
+    uuid_cliente = serializers.UUIDField()
+
+    class Meta(CrearEpisodioCefaleaSerializer.Meta):
+        fields = CrearEpisodioCefaleaSerializer.Meta.fields + ['uuid_cliente']
+        list_serializer_class = LoteEpisodiosListSerializer
+
+
 class EpisodioCefaleaSerializer(serializers.ModelSerializer):
     """
     Serializer de solo lectura para mostrar la lista resumida y el detalle
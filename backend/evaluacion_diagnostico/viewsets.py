@@ -1,4 +1,5 @@
-from rest_framework import viewsets, mixins, permissions
+from rest_framework import viewsets, mixins, permissions, status
+from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from .models import Pregunta, Respuesta, AutoevaluacionMidas
@@ -6,8 +7,9 @@ from .permissions import EsPaciente, EsPropietarioDeLaAutoevaluacionOPersonalMed
 
 from .episodio_cefalea_service import episodio_cefalea_service
 from .models import EpisodioCefalea
+from .pagination import EpisodioCursorPagination
 from .permissions import EsPropietarioDelEpisodioOPersonalMedico
-from .serializers import CrearEpisodioCefaleaSerializer, EpisodioCefaleaSerializer
+from .serializers import CrearEpisodioCefaleaSerializer, CrearEpisodioLoteSerializer, EpisodioCefaleaSerializer
 
 
 from .serializers import (
@@ -97,10 +99,15 @@ class EpisodioCefaleaViewSet(
 
     Endpoints:
     - POST /api/evaluaciones/episodios/ - Crear un nuevo episodio (Solo Pacientes)
-    - GET /api/evaluaciones/episodios/ - Lista los episodios (Paciente ve los suyos, Personal Médico puede filtrar por paciente)
+    - POST /api/evaluaciones/episodios/lote/ - Sincronizar episodios registrados sin conexión (Solo Pacientes)
+    - GET /api/evaluaciones/episodios/ - Lista los episodios (Paciente ve los suyos, Personal Médico puede filtrar por paciente),
+      paginados por cursor: la respuesta incluye 'next' y 'previous' en lugar de 'count'
     - GET /api/evaluaciones/episodios/{id}/ - Detalle de un episodio específico
     """
-    queryset = EpisodioCefalea.objects.all().select_related('paciente').order_by('-creado_en')
+    queryset = EpisodioCefalea.objects.all().select_related('paciente').order_by('-creado_en', '-id')
+    pagination_class = EpisodioCursorPagination
+    # Máximo de episodios aceptados en una sincronización por lote
+    MAX_EPISODIOS_POR_LOTE = 200
 
     def get_serializer_class(self):
         """
@@ -108,13 +115,15 @@ class EpisodioCefaleaViewSet(
         """
         if self.action == 'create':
             return CrearEpisodioCefaleaSerializer
+        if self.action == 'lote':
+            return CrearEpisodioLoteSerializer
         return EpisodioCefaleaSerializer
 
     def get_permissions(self):
         """
         Asigna los permisos adecuados según la acción.
         """
-        if self.action == 'create':
+        if self.action in ('create', 'lote'):
             # Solo los pacientes autenticados pueden crear
             return [permissions.IsAuthenticated(), EsPaciente()]
 
@@ -162,3 +171,26 @@ class EpisodioCefaleaViewSet(
             paciente=self.request.user,
             datos_validados=serializer.validated_data
         )
+
+    @action(detail=False, methods=['post'], url_path='lote')
+    def lote(self, request):
+        """
+        Registra varios episodios en una sola petición (sincronización sin conexión).
+        Un elemento inválido no impide guardar los demás; cada uno indica si fue
+        'creado', si ya 'existente' (mismo uuid_cliente) o si tuvo 'error'.
+        """
+        serializer = self.get_serializer(data=request.data, many=True, max_length=self.MAX_EPISODIOS_POR_LOTE)
+        serializer.is_valid(raise_exception=True)
+
+        resultados = episodio_cefalea_service.registrar_lote_episodios(
+            paciente=request.user,
+            elementos=serializer.validated_data
+        )
+        estados = [r['estado'] for r in resultados]
+        creados = estados.count('creado')
+        return Response({
+            'creados': creados,
+            'existentes': estados.count('existente'),
+            'errores': estados.count('error'),
+            'resultados': resultados,
+        }, status=status.HTTP_201_CREATED if creados else status.HTTP_200_OK)
@@ -0,0 +1,140 @@
+# migraine_app/middleware.py
+"""
+Perfilado opcional de las consultas SQL de cada petición.
+
+Se activa con el setting PERFIL_CONSULTAS['ACTIVO']. Por cada petición se
+registra el número de consultas, el tiempo total en SQL, las consultas
+repetidas (misma sentencia con distintos parámetros, típico de un N+1), el
+tiempo de renderizado de la respuesta y el tiempo total. Los datos se
+devuelven como cabeceras X-Perfil-* y/o en una línea de log.
+
+Cada vista puede tener un presupuesto máximo de consultas
+(PERFIL_CONSULTAS['PRESUPUESTOS'], por nombre de vista como 'tratamiento-list').
+Si se excede se registra una advertencia y, con FALLAR_SI_EXCEDE, se lanza
+PresupuestoConsultasExcedido para que los tests fallen.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+CONFIGURACION_POR_DEFECTO = {
+    'ACTIVO': False,
+    'CABECERAS': True,
+    'LOG': True,
+    'PRESUPUESTOS': {},
+    'PRESUPUESTO_POR_DEFECTO': None,
+    'FALLAR_SI_EXCEDE': False,
+}
+
+# Listas de parámetros de longitud variable: IN (%s, %s, ...) -> IN (...)
+_LISTA_PARAMETROS = re.compile(r'\((?:\s*%s\s*,)*\s*%s\s*\)')
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+class PresupuestoConsultasExcedido(Exception):
+    """La vista ejecutó más consultas SQL que su presupuesto."""
+    pass
+
+
+def huella_consulta(sql: str) -> str:
+    """Normaliza una sentencia para agrupar las que solo difieren en sus parámetros."""
+    huella = _LITERALES.sub('?', sql)
+    huella = _LISTA_PARAMETROS.sub('(...)', huella)
+    return ' '.join(huella.split())
+
+
+class RegistroConsultas:
+    """execute_wrapper que acumula las consultas ejecutadas durante la petición."""
+
+    def __init__(self):
+        self.huellas = Counter()
+        self.segundos = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos += time.perf_counter() - inicio
+            self.huellas[huella_consulta(sql)] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(self.huellas.values())
+
+    @property
+    def duplicadas(self) -> dict:
+        """Huellas ejecutadas más de una vez, con su número de repeticiones."""
+        return {huella: veces for huella, veces in self.huellas.items() if veces > 1}
+
+
+class PerfilConsultasMiddleware:
+    """Mide las consultas SQL y el renderizado de cada petición (solo si está activo)."""
+
+    def __init__(self, get_response):
+        self.config = {**CONFIGURACION_POR_DEFECTO, **getattr(settings, 'PERFIL_CONSULTAS', {})}
+        if not self.config['ACTIVO']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        registro = RegistroConsultas()
+        request._perfil_renderizado = 0.0
+        inicio = time.perf_counter()
+
+        with ExitStack() as pila:
+            for conexion in connections.all():
+                pila.enter_context(conexion.execute_wrapper(registro))
+            response = self.get_response(request)
+
+        total = time.perf_counter() - inicio
+        vista = request.resolver_match.view_name if request.resolver_match else None
+        self._reportar(request, response, vista, registro, total)
+        self._verificar_presupuesto(request, vista, registro)
+        return response
+
+    def process_template_response(self, request, response):
+        # Las respuestas de DRF se renderizan (serializan a JSON) después de la vista
+        inicio = time.perf_counter()
+
+        def medir(_response):
+            request._perfil_renderizado = time.perf_counter() - inicio
+
+        response.add_post_render_callback(medir)
+        return response
+
+    def _reportar(self, request, response, vista, registro, total):
+        duplicadas = registro.duplicadas
+        metricas = {
+            'consultas': registro.total,
+            'tiempo-sql-ms': round(registro.segundos * 1000, 2),
+            'consultas-duplicadas': sum(duplicadas.values()) - len(duplicadas),
+            'tiempo-serializacion-ms': round(request._perfil_renderizado * 1000, 2),
+            'tiempo-total-ms': round(total * 1000, 2),
+        }
+        if self.config['CABECERAS']:
+            for nombre, valor in metricas.items():
+                response[f'X-Perfil-{nombre.title()}'] = str(valor)
+        if self.config['LOG']:
+            logger.info(f"{request.method} {request.path} vista={vista} "
+                        + ' '.join(f"{nombre}={valor}" for nombre, valor in metricas.items()))
+            for huella, veces in sorted(duplicadas.items(), key=lambda d: -d[1]):
+                logger.debug(f"  {veces}x {huella}")
+
+    def _verificar_presupuesto(self, request, vista, registro):
+        presupuesto = self.config['PRESUPUESTOS'].get(vista, self.config['PRESUPUESTO_POR_DEFECTO'])
+        if presupuesto is None or registro.total <= presupuesto:
+            return
+        mensaje = (f"{request.method} {request.path} ({vista}) ejecutó {registro.total} consultas; "
+                   f"presupuesto: {presupuesto}")
+        logger.warning(mensaje)
+        if self.config['FALLAR_SI_EXCEDE']:
+            raise PresupuestoConsultasExcedido(mensaje)
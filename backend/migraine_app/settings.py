@@ -58,6 +58,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Solo actúa si PERFIL_CONSULTAS['ACTIVO'] es verdadero
+    "migraine_app.middleware.PerfilConsultasMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware", 
     "django.middleware.security.SecurityMiddleware",
@@ -162,7 +164,8 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # REST Framework
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        # JWTAuthentication que carga el usuario junto con sus perfiles
+        "usuarios.authentication.JWTAuthenticationConPerfil",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -179,6 +182,29 @@ SIMPLE_JWT = {
     "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": True,
     "UPDATE_LAST_LOGIN": True,
+    # Incluye tipo_usuario, genero y perfil_id como claims (ver usuarios.tokens)
+    "TOKEN_OBTAIN_SERIALIZER": "usuarios.tokens.TokenObtainPairConPerfilSerializer",
+}
+
+# Caché de analíticas: 'local' (LRU por worker) o 'django' (caché compartida de CACHES)
+ANALITICAS_CACHE = {
+    "BACKEND": os.getenv("ANALITICAS_CACHE_BACKEND", "local"),
+    "MAX_ENTRIES": int(os.getenv("ANALITICAS_CACHE_MAX_ENTRIES", "1024")),
+    "ALIAS": "default",
+    "TIMEOUT": int(os.getenv("ANALITICAS_CACHE_TIMEOUT", "3600")),
+}
+
+# Enviador usado por el despachador de notificaciones (por defecto solo escribe en el log)
+NOTIFICACIONES_ENVIADOR = os.getenv("NOTIFICACIONES_ENVIADOR", "tratamiento.despachador.EnviadorLog")
+
+# Perfilado de consultas SQL por petición (migraine_app.middleware). Presupuestos por nombre de vista
+PERFIL_CONSULTAS = {
+    "ACTIVO": os.getenv("PERFIL_CONSULTAS", "False").lower() in ("1", "true", "yes"),
+    "CABECERAS": True,
+    "LOG": True,
+    "PRESUPUESTOS": {},
+    "PRESUPUESTO_POR_DEFECTO": None,
+    "FALLAR_SI_EXCEDE": False,
 }
 
 # Djoser
@@ -0,0 +1,154 @@
+# tratamiento/despachador.py
+"""
+Despacho periódico de notificaciones vencidas.
+
+En cada ciclo se consultan las alertas y recordatorios de tratamiento
+vencidos y los recordatorios de citas pendientes, se escalan las alertas
+que no fueron confirmadas a tiempo (Alerta.reenviar) y todo se entrega
+mediante un enviador intercambiable. El comando `despachar_notificaciones`
+ejecuta los ciclos de forma continua.
+"""
+import logging
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, asdict
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import BicolaNotificacion
+from .repositories import DjangoRepository
+
+logger = logging.getLogger(__name__)
+
+
+class EnviadorNotificaciones(ABC):
+    """Canal de entrega de las notificaciones (push, SMS, correo...)."""
+
+    @abstractmethod
+    def enviar(self, notificacion) -> bool:
+        """Entrega la notificación. Devuelve False si no se pudo enviar."""
+        pass
+
+
+class EnviadorLog(EnviadorNotificaciones):
+    """Enviador de prueba: solo registra el mensaje en el log. Útil en desarrollo local."""
+
+    def __init__(self):
+        self.enviadas = []
+
+    def enviar(self, notificacion) -> bool:
+        logger.info(f"[{notificacion.__class__.__name__}] {notificacion.mensaje}")
+        self.enviadas.append(notificacion)
+        return True
+
+
+def obtener_enviador(ruta=None) -> EnviadorNotificaciones:
+    """Instancia el enviador indicado por su ruta o por el setting NOTIFICACIONES_ENVIADOR."""
+    ruta = ruta or getattr(settings, 'NOTIFICACIONES_ENVIADOR', 'tratamiento.despachador.EnviadorLog')
+    return import_string(ruta)()
+
+
+@dataclass
+class MetricasDespacho:
+    """Contadores de uno o varios ciclos. El retraso se mide en segundos desde la hora programada."""
+    ciclos: int = 0
+    enviadas: int = 0
+    fallidas: int = 0
+    escaladas: int = 0
+    segundos: float = 0.0
+    retraso_total: float = 0.0
+    retraso_maximo: float = 0.0
+
+    def registrar_envio(self, retraso: float):
+        retraso = max(retraso, 0.0)
+        self.enviadas += 1
+        self.retraso_total += retraso
+        self.retraso_maximo = max(self.retraso_maximo, retraso)
+
+    def acumular(self, otras: 'MetricasDespacho'):
+        self.ciclos += otras.ciclos
+        self.enviadas += otras.enviadas
+        self.fallidas += otras.fallidas
+        self.escaladas += otras.escaladas
+        self.segundos += otras.segundos
+        self.retraso_total += otras.retraso_total
+        self.retraso_maximo = max(self.retraso_maximo, otras.retraso_maximo)
+
+    @property
+    def envios_por_segundo(self) -> float:
+        return self.enviadas / self.segundos if self.segundos else 0.0
+
+    @property
+    def retraso_promedio(self) -> float:
+        return self.retraso_total / self.enviadas if self.enviadas else 0.0
+
+    def como_dict(self) -> dict:
+        datos = asdict(self)
+        datos.pop('retraso_total')
+        datos['envios_por_segundo'] = round(self.envios_por_segundo, 2)
+        datos['retraso_promedio'] = round(self.retraso_promedio, 2)
+        datos['retraso_maximo'] = round(self.retraso_maximo, 2)
+        datos['segundos'] = round(self.segundos, 3)
+        return datos
+
+
+class DespachadorNotificaciones:
+    """Ejecuta ciclos de despacho y acumula sus métricas."""
+
+    def __init__(self, enviador: EnviadorNotificaciones, repository=None, recordatorio_repository=None,
+                 lote: int = 500):
+        if recordatorio_repository is None:
+            from agendamiento_citas.repositories import RecordatorioRepository
+            recordatorio_repository = RecordatorioRepository()
+        self.enviador = enviador
+        self.repository = repository or DjangoRepository()
+        self.recordatorio_repository = recordatorio_repository
+        self.lote = lote
+        self.metricas = MetricasDespacho()
+
+    def ejecutar_ciclo(self, ahora=None) -> MetricasDespacho:
+        inicio = time.monotonic()
+        if ahora is None:
+            ahora = timezone.now()
+        metricas = MetricasDespacho(ciclos=1)
+
+        # 1. Notificaciones de tratamiento vencidas, ya ordenadas por fecha_hora
+        bicola = BicolaNotificacion()
+        bicola.agregar_multiples(self.repository.get_notificaciones_vencidas(ahora, limite=self.lote))
+
+        # 2. Escalar las alertas sin confirmar: la nueva alerta entra al frente de la cola
+        for alerta in self.repository.get_alertas_por_escalar(ahora, limite=self.lote):
+            # Tras la tercera alerta reenviar marca la toma como no tomada y no devuelve nada
+            if alerta.reenviar(bicola, ahora):
+                metricas.escaladas += 1
+
+        while not bicola.estaVacia():
+            notificacion = bicola.eliminarFrente()
+            if self._entregar(notificacion, metricas):
+                notificacion.enviar()
+                metricas.registrar_envio((ahora - notificacion.fecha_hora).total_seconds())
+
+        # 3. Recordatorios de citas (guardan fecha y hora sin zona horaria)
+        ahora_local = timezone.make_naive(ahora)
+        for recordatorio in self.recordatorio_repository.get_recordatorios_por_enviar(ahora_local, limite=self.lote):
+            if self._entregar(recordatorio, metricas):
+                recordatorio.marcar_como_enviado()
+                programado = datetime.combine(recordatorio.fecha, recordatorio.hora)
+                metricas.registrar_envio((ahora_local - programado).total_seconds())
+
+        metricas.segundos = time.monotonic() - inicio
+        self.metricas.acumular(metricas)
+        return metricas
+
+    def _entregar(self, notificacion, metricas: MetricasDespacho) -> bool:
+        try:
+            if self.enviador.enviar(notificacion):
+                return True
+        except Exception:
+            logger.exception(f"Error enviando {notificacion}")
+        # Se reintenta en el siguiente ciclo porque sigue pendiente
+        metricas.fallidas += 1
+        return False
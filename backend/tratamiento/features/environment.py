@@ -0,0 +1,11 @@
+import os
+import django
+
+
+def before_all(context):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "migraine_app.settings")
+    django.setup()
+
+    # Las peticiones del cliente de pruebas de DRF llegan con el host 'testserver'
+    from utilidades_behave import habilitar_cliente_de_pruebas
+    habilitar_cliente_de_pruebas()
@@ -64,3 +64,89 @@ Característica: Generación y análisis de seguimiento de tratamiento médico
     Ejemplos:
       | porcentaje_cumplimiento | numero_tratamientos | motivo_cancelacion            |
       | 60                      | 1                   | Incumplimiento de tratamiento |
+
+
+  Escenario: Generación en lote de las notificaciones de un tratamiento
+
+    Dado que el paciente tiene un tratamiento con un medicamento cada 8 horas durante 30 días y una recomendación
+    Cuando el sistema genera las notificaciones del tratamiento para los próximos 30 días
+    Entonces se crean 90 alertas y 120 recordatorios para el tratamiento
+    Y las notificaciones se guardan con a lo sumo 7 consultas a la base de datos
+
+  Escenario: Cálculo progresivo de las tomas de un tratamiento prolongado
+
+    Dado un medicamento cada 8 horas durante 120 días que inicia a las 20:00
+    Cuando el sistema calcula las tomas de los próximos 3 días
+    Entonces obtiene 7 tomas ordenadas que coinciden con el inicio del tratamiento completo
+
+  Escenario: Cola de notificaciones ordenada por prioridad de escalamiento y hora
+
+    Dado una cola con 50 alertas y recordatorios programados en orden aleatorio
+    Cuando se reenvía una alerta que no fue confirmada
+    Entonces la alerta reenviada queda al frente de la cola
+    Y el resto de notificaciones sale de la cola ordenado por fecha y hora
+
+  Escenario: Despacho de notificaciones vencidas con escalamiento de alertas
+
+    Dado que hay 3 alertas y 2 recordatorios de tratamiento vencidos
+    Y hay 1 alerta enviada que no fue confirmada dentro de su plazo
+    Y hay 1 alerta enviada que aún está dentro de su plazo de confirmación
+    Y hay 2 recordatorios de citas pendientes de envío
+    Y las notificaciones de tratamiento vencidas se obtienen ordenadas con una sola consulta
+    Y las alertas por escalar se filtran por su plazo en la base de datos con una sola consulta
+    Cuando el despachador ejecuta un ciclo con el enviador de prueba
+    Entonces el enviador recibe 8 notificaciones
+    Y se escala 1 alerta sin confirmar
+    Y ninguna de las notificaciones vencidas queda pendiente de envío
+    Y las métricas del ciclo reportan el retraso de los envíos
+
+  Escenario: El despachador espera cada vez más entre ciclos cuando el canal de envío falla
+
+    Dado que hay 2 alertas de tratamiento vencidas por entregar
+    Cuando el despachador se ejecuta 4 ciclos con lotes de 2 y un enviador que siempre falla
+    Entonces entre ciclos espera 30, 60 y 120 segundos
+    Y las alertas siguen pendientes de envío
+
+  Escenario: Actualización incremental del cumplimiento al confirmar tomas
+
+    Dado que el paciente tiene un tratamiento con un medicamento cada 8 horas durante 30 días y una recomendación
+    Y el sistema genera las notificaciones del tratamiento para los próximos 30 días
+    Cuando el paciente confirma 30 tomas como tomadas y 5 como no tomadas
+    Y dos confirmaciones concurrentes de la misma toma parten de copias desactualizadas de la alerta
+    Y se asigna directamente el estado no tomado a una toma cumplida
+    Entonces el cumplimiento del tratamiento es 33.33 por ciento
+    Y cada confirmación se resuelve con a lo sumo 3 consultas a la base de datos
+    Y recalcular el cumplimiento desde cero da el mismo resultado con una sola consulta de agregación
+
+  Escenario: Cancelación de las notificaciones pendientes de un tratamiento
+
+    Dado que el paciente tiene un tratamiento con un medicamento cada 8 horas durante 30 días y una recomendación
+    Y el sistema genera las notificaciones del tratamiento para los próximos 30 días
+    Cuando el médico cancela el tratamiento después de confirmar 9 tomas
+    Entonces se eliminan 201 notificaciones pendientes y el cumplimiento es 100.0 por ciento
+    Y las notificaciones del tratamiento se consultan por el índice del tratamiento
+
+  Escenario: Listado de tratamientos con un número constante de consultas por página
+
+    Dado que hay 5 tratamientos registrados con 2 medicamentos cada uno
+    Y el médico consulta el listado de tratamientos y el historial del paciente
+    Cuando se registran 20 tratamientos más con 2 medicamentos cada uno
+    Y el médico consulta el listado de tratamientos y el historial del paciente
+    Entonces ambas consultas ejecutan el mismo número de consultas a la base de datos
+    Y el listado se resuelve con a lo sumo 3 consultas
+
+  Escenario: Perfilado de las consultas SQL del listado de tratamientos
+
+    Dado que hay 3 tratamientos registrados con 2 medicamentos cada uno
+    Y el perfilado de consultas está activo con un presupuesto de 3 consultas para "tratamiento-list"
+    Cuando el médico consulta el listado de tratamientos con el perfilado activo
+    Entonces la respuesta informa el número de consultas, el tiempo en SQL y el tiempo de serialización
+    Y no se reportan consultas duplicadas
+    Pero con un presupuesto de 1 consulta la petición falla por exceder el presupuesto
+
+  Escenario: Resolución del perfil del usuario autenticado con una sola consulta
+
+    Dado que hay 1 tratamientos registrados con 2 medicamentos cada uno
+    Cuando el paciente consulta su tratamiento con su token de acceso
+    Entonces obtiene el tratamiento con a lo sumo 3 consultas a la base de datos
+    Y otro paciente no puede ver ese tratamiento
@@ -11,6 +11,7 @@ from faker import Faker
 from tratamiento.repositories import FakeRepository
 from tratamiento.services import TratamientoService
 from tratamiento.models import EpisodioCefalea
+from utilidades_behave import cliente_autenticado, cliente_con_token
 
 use_step_matcher("re")
 fake = Faker('es_ES')
@@ -290,3 +291,648 @@ def crear_episodio_dummy(paciente, tipo_migraña):
         categoria_diagnostica=tipo_migraña
     )
 
+
+
+@step("que el paciente tiene un tratamiento con un medicamento cada (?P<frecuencia>\\d+) horas durante (?P<dias>\\d+) días y una recomendación")
+def step_impl(context, frecuencia, dias):
+    from datetime import time
+    from tratamiento.models import Medicamento, Tratamiento, Recomendacion
+
+    inicializar_contexto_basico(context)
+    episodio = crear_episodio_dummy(paciente=context.paciente.usuario, tipo_migraña='Migraña sin aura')
+    context.tratamiento = Tratamiento.objects.create(
+        paciente=context.paciente,
+        episodio=episodio,
+        fecha_inicio=timezone.now().date(),
+        recomendaciones=[Recomendacion.HIDRATACION],
+    )
+    medicamento = Medicamento.objects.create(
+        nombre='Ibuprofeno',
+        dosis='400mg',
+        frecuencia_horas=int(frecuencia),
+        duracion_dias=int(dias),
+        hora_de_inicio=time(hour=0),
+    )
+    context.tratamiento.medicamentos.add(medicamento)
+
+
+@step("el sistema genera las notificaciones del tratamiento para los próximos (?P<dias>\\d+) días")
+def step_impl(context, dias):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as consultas:
+        context.notificaciones = context.tratamiento.generarNotificaciones(dias_anticipacion=int(dias))
+    context.consultas_generacion = len(consultas)
+
+
+@step("se crean (?P<alertas>\\d+) alertas y (?P<recordatorios>\\d+) recordatorios para el tratamiento")
+def step_impl(context, alertas, recordatorios):
+    from tratamiento.models import Alerta, Recordatorio, Tratamiento
+
+    tratamiento = Tratamiento.objects.get(pk=context.tratamiento.pk)
+    assert tratamiento.alertas.count() + tratamiento.recordatorios.count() == len(context.notificaciones), \
+        "Las notificaciones guardadas no quedaron asociadas al tratamiento"
+
+    alertas_creadas = [n for n in context.notificaciones if isinstance(n, Alerta)]
+    recordatorios_creados = [n for n in context.notificaciones if isinstance(n, Recordatorio)]
+    assert len(alertas_creadas) == int(alertas), f"Se esperaban {alertas} alertas, se crearon {len(alertas_creadas)}"
+    assert len(recordatorios_creados) == int(recordatorios), \
+        f"Se esperaban {recordatorios} recordatorios, se crearon {len(recordatorios_creados)}"
+    assert Alerta.objects.filter(id__in=[a.id for a in alertas_creadas]).count() == int(alertas)
+    assert Recordatorio.objects.filter(id__in=[r.id for r in recordatorios_creados]).count() == int(recordatorios)
+
+
+@step("las notificaciones se guardan con a lo sumo (?P<maximo>\\d+) consultas a la base de datos")
+def step_impl(context, maximo):
+    assert context.consultas_generacion <= int(maximo), \
+        f"Se esperaban a lo sumo {maximo} consultas, se ejecutaron {context.consultas_generacion}"
+
+
+@step("un medicamento cada (?P<frecuencia>\\d+) horas durante (?P<dias>\\d+) días que inicia a las (?P<hora>[\\d:]+)")
+def step_impl(context, frecuencia, dias, hora):
+    from datetime import time
+    from tratamiento.models import Medicamento
+
+    context.medicamento = Medicamento(
+        nombre='Propranolol',
+        dosis='40mg',
+        frecuencia_horas=int(frecuencia),
+        duracion_dias=int(dias),
+        hora_de_inicio=time.fromisoformat(hora),
+    )
+    context.fecha_inicio_tomas = date(2025, 1, 1)
+
+
+@step("el sistema calcula las tomas de los próximos (?P<dias>\\d+) días")
+def step_impl(context, dias):
+    from datetime import timedelta
+
+    hasta = datetime.combine(context.fecha_inicio_tomas, datetime.min.time()) + timedelta(days=int(dias))
+    context.tomas = list(context.medicamento.iterarFechasDeTomas(context.fecha_inicio_tomas, hasta=hasta))
+
+
+@step("obtiene (?P<cantidad>\\d+) tomas ordenadas que coinciden con el inicio del tratamiento completo")
+def step_impl(context, cantidad):
+    assert len(context.tomas) == int(cantidad), f"Se esperaban {cantidad} tomas, se obtuvieron {len(context.tomas)}"
+    assert context.tomas == sorted(context.tomas), "Las tomas no están en orden"
+
+    tratamiento_completo = context.medicamento.calcularFechasDeTomas(context.fecha_inicio_tomas)
+    assert context.tomas == tratamiento_completo[:int(cantidad)], \
+        "Las tomas calculadas no coinciden con las del tratamiento completo"
+
+
+@step("una cola con (?P<cantidad>\\d+) alertas y recordatorios programados en orden aleatorio")
+def step_impl(context, cantidad):
+    from datetime import timedelta
+    from tratamiento.models import Alerta, Recordatorio, BicolaNotificacion, EstadoNotificacion
+
+    base = timezone.now()
+    context.bicola = BicolaNotificacion()
+    context.programadas = []
+    for i in range(int(cantidad)):
+        fecha_hora = base + timedelta(minutes=fake.random_int(min=1, max=10000))
+        if i % 2:
+            notificacion = Alerta(mensaje=f"Alerta {i}", fecha_hora=fecha_hora, estado=EstadoNotificacion.ACTIVO,
+                                  numero_alerta=1, duracion=15, tiempo_espera=15)
+        else:
+            notificacion = Recordatorio(mensaje=f"Recordatorio {i}", fecha_hora=fecha_hora,
+                                        estado=EstadoNotificacion.ACTIVO)
+        context.bicola.agregarFinal(notificacion)
+        context.programadas.append(notificacion)
+
+
+@step("se reenvía una alerta que no fue confirmada")
+def step_impl(context):
+    from tratamiento.models import Alerta, EstadoNotificacion
+
+    # Equivalente en memoria a Alerta.reenviar: la alerta #2 se programa para ahora
+    context.alerta_reenviada = Alerta(mensaje="Alerta (Alerta #2)", fecha_hora=timezone.now(),
+                                      estado=EstadoNotificacion.ACTIVO, numero_alerta=2,
+                                      duracion=15, tiempo_espera=15)
+    context.bicola.agregarFinal(context.alerta_reenviada)
+
+
+@step("la alerta reenviada queda al frente de la cola")
+def step_impl(context):
+    assert context.bicola.verFrente() is context.alerta_reenviada, "La alerta reenviada no está al frente"
+    assert context.bicola.eliminarFrente() is context.alerta_reenviada
+
+
+@step("el resto de notificaciones sale de la cola ordenado por fecha y hora")
+def step_impl(context):
+    drenadas = []
+    while not context.bicola.estaVacia():
+        drenadas.append(context.bicola.eliminarFrente())
+
+    esperadas = sorted(context.programadas, key=lambda n: n.fecha_hora)
+    assert [n.fecha_hora for n in drenadas] == [n.fecha_hora for n in esperadas], \
+        "Las notificaciones no salieron ordenadas por fecha y hora"
+    assert len(drenadas) == len(context.programadas)
+
+
+@step("que hay (?P<alertas>\\d+) alertas y (?P<recordatorios>\\d+) recordatorios de tratamiento vencidos")
+def step_impl(context, alertas, recordatorios):
+    from datetime import timedelta
+    from tratamiento.models import Alerta, Recordatorio, EstadoNotificacion
+
+    # Momento fijo en el pasado para que el ciclo solo vea las notificaciones de este escenario
+    context.ahora_despacho = timezone.make_aware(datetime(2001, 1, 1, 12, 0))
+    context.tratamiento_despacho = crear_tratamiento_para_despacho(context)
+    context.vencidas = []
+    for i in range(int(alertas)):
+        context.vencidas.append(Alerta.objects.create(
+            mensaje=f"Es hora de tomar Ibuprofeno #{i}", fecha_hora=context.ahora_despacho - timedelta(minutes=i + 1),
+            estado=EstadoNotificacion.ACTIVO, numero_alerta=1, duracion=15, tiempo_espera=15,
+            tratamiento=context.tratamiento_despacho))
+    for i in range(int(recordatorios)):
+        context.vencidas.append(Recordatorio.objects.create(
+            mensaje=f"Recordatorio para tomar Ibuprofeno #{i}",
+            fecha_hora=context.ahora_despacho - timedelta(minutes=30 + i), estado=EstadoNotificacion.ACTIVO,
+            tratamiento=context.tratamiento_despacho))
+
+    # Vencidas también, pero de un tratamiento inactivo o sin tratamiento (datos heredados): no se envían
+    inactivo = crear_tratamiento_para_despacho(context, activo=False)
+    vencida = {'fecha_hora': context.ahora_despacho - timedelta(hours=2), 'estado': EstadoNotificacion.ACTIVO}
+    context.ignoradas = [
+        Alerta.objects.create(mensaje="Alerta de un tratamiento inactivo", numero_alerta=1, duracion=15,
+                              tiempo_espera=15, tratamiento=inactivo, **vencida),
+        Recordatorio.objects.create(mensaje="Recordatorio de un tratamiento inactivo", tratamiento=inactivo,
+                                    **vencida),
+        Alerta.objects.create(mensaje="Alerta heredada sin tratamiento", numero_alerta=1, duracion=15,
+                              tiempo_espera=15, **vencida),
+        Alerta.objects.create(mensaje="Alerta sin confirmar de un tratamiento inactivo", numero_alerta=1,
+                              duracion=15, tiempo_espera=15, tratamiento=inactivo,
+                              fecha_hora=vencida['fecha_hora'], estado=EstadoNotificacion.SIN_CONFIRMAR),
+    ]
+
+
+def crear_tratamiento_para_despacho(context, activo=True):
+    from tratamiento.models import Tratamiento
+
+    inicializar_contexto_basico(context)
+    episodio = crear_episodio_dummy(paciente=context.paciente.usuario, tipo_migraña='Migraña sin aura')
+    return Tratamiento.objects.create(paciente=context.paciente, episodio=episodio, activo=activo)
+
+
+@step("hay (?P<cantidad>\\d+) alerta enviada que no fue confirmada dentro de su plazo")
+def step_impl(context, cantidad):
+    from datetime import timedelta
+    from tratamiento.models import Alerta, EstadoNotificacion
+
+    context.sin_confirmar = [
+        Alerta.objects.create(
+            mensaje="Es hora de tomar Sumatriptán", fecha_hora=context.ahora_despacho - timedelta(hours=1),
+            estado=EstadoNotificacion.SIN_CONFIRMAR, numero_alerta=1, duracion=15, tiempo_espera=15,
+            tratamiento=context.tratamiento_despacho)
+        for _ in range(int(cantidad))
+    ]
+
+
+@step("hay (?P<cantidad>\\d+) alerta enviada que aún está dentro de su plazo de confirmación")
+def step_impl(context, cantidad):
+    from datetime import timedelta
+    from tratamiento.models import Alerta, EstadoNotificacion
+
+    context.en_plazo = [
+        Alerta.objects.create(
+            mensaje="Es hora de tomar Naproxeno", fecha_hora=context.ahora_despacho - timedelta(minutes=10),
+            estado=EstadoNotificacion.SIN_CONFIRMAR, numero_alerta=1, duracion=15, tiempo_espera=15,
+            tratamiento=context.tratamiento_despacho)
+        for _ in range(int(cantidad))
+    ]
+
+
+@step("las alertas por escalar se filtran por su plazo en la base de datos con una sola consulta")
+def step_impl(context):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from tratamiento.repositories import DjangoRepository
+
+    with CaptureQueriesContext(connection) as consultas:
+        por_escalar = DjangoRepository().get_alertas_por_escalar(context.ahora_despacho)
+    assert len(consultas) == 1, f"Se esperaba una consulta, se ejecutaron {len(consultas)}"
+    ids = {a.id for a in por_escalar}
+    assert {a.id for a in context.sin_confirmar} <= ids, "Faltan alertas vencidas por escalar"
+    assert not ids & {a.id for a in context.en_plazo}, "Se escaló una alerta dentro de su plazo"
+    assert not ids & {a.id for a in context.ignoradas}, "Se escaló una alerta de un tratamiento inactivo"
+    assert len(DjangoRepository().get_alertas_por_escalar(context.ahora_despacho, limite=1)) == 1
+
+
+@step("hay (?P<cantidad>\\d+) recordatorios de citas pendientes de envío")
+def step_impl(context, cantidad):
+    from datetime import timedelta
+    from agendamiento_citas.models import Recordatorio as RecordatorioCita
+
+    inicializar_contexto_basico(context)
+    programado = timezone.make_naive(context.ahora_despacho) - timedelta(minutes=5)
+    context.recordatorios_citas = [
+        RecordatorioCita.objects.create(paciente=context.usuario_paciente, fecha=programado.date(),
+                                        hora=programado.time(), mensaje=f"Su cita es mañana #{i}")
+        for i in range(int(cantidad))
+    ]
+
+
+@step("el despachador ejecuta un ciclo con el enviador de prueba")
+def step_impl(context):
+    from tratamiento.despachador import DespachadorNotificaciones, EnviadorLog
+
+    context.enviador = EnviadorLog()
+    context.despachador = DespachadorNotificaciones(context.enviador)
+    context.metricas_ciclo = context.despachador.ejecutar_ciclo(context.ahora_despacho)
+
+
+@step("el enviador recibe (?P<cantidad>\\d+) notificaciones")
+def step_impl(context, cantidad):
+    assert len(context.enviador.enviadas) == int(cantidad), \
+        f"Se esperaban {cantidad} envíos, se realizaron {len(context.enviador.enviadas)}"
+    assert context.metricas_ciclo.enviadas == int(cantidad)
+
+
+@step("se escala (?P<cantidad>\\d+) alerta sin confirmar")
+def step_impl(context, cantidad):
+    from tratamiento.models import Alerta, EstadoNotificacion
+
+    assert context.metricas_ciclo.escaladas == int(cantidad)
+    for alerta in context.sin_confirmar:
+        alerta.refresh_from_db()
+        assert alerta.estado == EstadoNotificacion.REENVIADA, f"Estado inesperado: {alerta.estado}"
+
+    reenviadas = [n for n in context.enviador.enviadas if isinstance(n, Alerta) and n.numero_alerta == 2]
+    assert len(reenviadas) == int(cantidad), "La alerta reenviada no fue entregada"
+    assert context.enviador.enviadas[0] is reenviadas[0], "La alerta reenviada debe enviarse primero"
+    # La alerta reenviada se programa en el instante del ciclo, no con el reloj del sistema
+    assert all(alerta.fecha_hora == context.ahora_despacho for alerta in reenviadas), \
+        [alerta.fecha_hora for alerta in reenviadas]
+
+
+@step("ninguna de las notificaciones vencidas queda pendiente de envío")
+def step_impl(context):
+    from tratamiento.models import EstadoNotificacion
+
+    for notificacion in context.vencidas:
+        notificacion.refresh_from_db()
+        assert notificacion.estado == EstadoNotificacion.SIN_CONFIRMAR, f"{notificacion} sigue pendiente"
+    for recordatorio in context.recordatorios_citas:
+        recordatorio.refresh_from_db()
+        assert recordatorio.enviado, f"{recordatorio} no se marcó como enviado"
+    assert context.despachador.repository.get_notificaciones_vencidas(context.ahora_despacho) == []
+
+
+@step("las métricas del ciclo reportan el retraso de los envíos")
+def step_impl(context):
+    metricas = context.metricas_ciclo.como_dict()
+    # El recordatorio de tratamiento más antiguo estaba programado 31 minutos antes del ciclo
+    assert metricas['retraso_maximo'] == 31 * 60, f"Retraso máximo inesperado: {metricas['retraso_maximo']}"
+    assert metricas['retraso_promedio'] > 0
+    assert metricas['fallidas'] == 0
+
+
+@step("las notificaciones de tratamiento vencidas se obtienen ordenadas con una sola consulta")
+def step_impl(context):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from tratamiento.models import Alerta, EstadoNotificacion, Recordatorio
+    from tratamiento.repositories import DjangoRepository
+
+    with CaptureQueriesContext(connection) as consultas:
+        vencidas = DjangoRepository().get_notificaciones_vencidas(context.ahora_despacho)
+
+    assert len(consultas) == 1, f"Se esperaba una consulta, se ejecutaron {len(consultas)}"
+    assert [n.fecha_hora for n in vencidas] == sorted(n.fecha_hora for n in vencidas), "No están ordenadas"
+    obtenidas = {(type(n), n.id) for n in vencidas}
+    assert {(type(n), n.id) for n in context.vencidas} <= obtenidas, "Faltan notificaciones vencidas"
+    assert not {(type(n), n.id) for n in context.ignoradas} & obtenidas, \
+        "Se obtuvieron notificaciones sin tratamiento activo"
+
+    # El filtro por tratamiento activo no impide recorrer el índice (estado, fecha_hora)
+    for modelo in (Alerta, Recordatorio):
+        plan = modelo.objects.filter(tratamiento__activo=True, estado=EstadoNotificacion.ACTIVO,
+                                     fecha_hora__lte=context.ahora_despacho).explain()
+        if connection.vendor == 'sqlite':
+            assert f"{modelo._meta.model_name}_estado_fh_idx" in plan, f"{modelo.__name__} no usa el índice: {plan}"
+
+
+CONTROL_TRANSACCION = {'BEGIN', 'COMMIT', 'SAVEPOINT', 'RELEASE'}
+
+
+@step("el paciente confirma (?P<tomadas>\\d+) tomas como tomadas y (?P<no_tomadas>\\d+) como no tomadas")
+def step_impl(context, tomadas, no_tomadas):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from tratamiento.models import Alerta, EstadoNotificacion
+
+    alertas = [n for n in context.notificaciones if isinstance(n, Alerta)]
+    estados = ([EstadoNotificacion.CONFIRMADO_TOMADO] * int(tomadas)
+               + [EstadoNotificacion.CONFIRMADO_NO_TOMADO] * int(no_tomadas))
+    context.consultas_confirmacion = []
+    for alerta, estado in zip(alertas, estados):
+        with CaptureQueriesContext(connection) as consultas:
+            assert context.tratamiento.confirmarToma(alerta, estado)
+        # BEGIN/COMMIT delimitan la transacción de la confirmación; no son consultas
+        context.consultas_confirmacion.append(sum(
+            1 for c in consultas.captured_queries if c['sql'].split()[0].upper() not in CONTROL_TRANSACCION
+        ))
+
+    # Confirmar dos veces la misma toma no debe contarla de nuevo
+    assert context.tratamiento.confirmarToma(alertas[0], EstadoNotificacion.CONFIRMADO_TOMADO_TARDE)
+
+
+@step("dos confirmaciones concurrentes de la misma toma parten de copias desactualizadas de la alerta")
+def step_impl(context):
+    from tratamiento.models import Alerta, EstadoNotificacion
+
+    pendiente = context.tratamiento.alertas.filter(estado=EstadoNotificacion.ACTIVO).first()
+    primera, segunda = Alerta.objects.get(pk=pendiente.pk), Alerta.objects.get(pk=pendiente.pk)
+    cumplidas = context.tratamiento.tomas_cumplidas
+
+    assert context.tratamiento.confirmarToma(primera, EstadoNotificacion.CONFIRMADO_TOMADO)
+    # La segunda copia aún cree que la alerta está activa: su confirmación no debe contar otra toma
+    assert not context.tratamiento.confirmarToma(segunda, EstadoNotificacion.CONFIRMADO_TOMADO_TARDE)
+    assert segunda.estado == EstadoNotificacion.CONFIRMADO_TOMADO
+    assert context.tratamiento.tomas_cumplidas == cumplidas + 1, \
+        f"Se esperaban {cumplidas + 1} tomas cumplidas, hay {context.tratamiento.tomas_cumplidas}"
+    context.alerta_confirmada_concurrente = primera
+
+
+@step("se asigna directamente el estado no tomado a una toma cumplida")
+def step_impl(context):
+    from tratamiento.models import EstadoNotificacion
+
+    alerta = context.alerta_confirmada_concurrente
+    alerta.tratamiento = context.tratamiento
+    cumplidas = context.tratamiento.tomas_cumplidas
+    assert alerta.asignarEstado(EstadoNotificacion.CONFIRMADO_NO_TOMADO)
+    assert context.tratamiento.tomas_cumplidas == cumplidas - 1, \
+        f"Se esperaban {cumplidas - 1} tomas cumplidas, hay {context.tratamiento.tomas_cumplidas}"
+
+
+@step("el cumplimiento del tratamiento es (?P<porcentaje>[\\d.]+) por ciento")
+def step_impl(context, porcentaje):
+    from tratamiento.models import Tratamiento
+
+    tratamiento = Tratamiento.objects.get(pk=context.tratamiento.pk)
+    assert tratamiento.cumplimiento == float(porcentaje), \
+        f"Se esperaba {porcentaje}%, se obtuvo {tratamiento.cumplimiento}%"
+    assert context.tratamiento.cumplimiento == tratamiento.cumplimiento
+
+
+@step("cada confirmación se resuelve con a lo sumo (?P<maximo>\\d+) consultas a la base de datos")
+def step_impl(context, maximo):
+    assert max(context.consultas_confirmacion) <= int(maximo), \
+        f"Se esperaban a lo sumo {maximo} consultas, se ejecutaron {max(context.consultas_confirmacion)}"
+
+
+@step("recalcular el cumplimiento desde cero da el mismo resultado con una sola consulta de agregación")
+def step_impl(context):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    esperado = (context.tratamiento.tomas_programadas, context.tratamiento.tomas_cumplidas,
+                context.tratamiento.cumplimiento)
+    with CaptureQueriesContext(connection) as consultas:
+        context.tratamiento.calcular_cumplimiento()
+    lecturas = [c for c in consultas.captured_queries if c['sql'].lstrip().upper().startswith('SELECT')]
+
+    assert len(lecturas) == 1, f"Se esperaba una sola consulta de agregación, se ejecutaron {len(lecturas)}"
+    assert (context.tratamiento.tomas_programadas, context.tratamiento.tomas_cumplidas,
+            context.tratamiento.cumplimiento) == esperado
+
+
+@step("el médico cancela el tratamiento después de confirmar (?P<tomadas>\\d+) tomas")
+def step_impl(context, tomadas):
+    from tratamiento.models import Alerta, EstadoNotificacion
+    from tratamiento.services import TratamientoService
+
+    alertas = [n for n in context.notificaciones if isinstance(n, Alerta)][:int(tomadas)]
+    for alerta in alertas:
+        context.tratamiento.confirmarToma(alerta, EstadoNotificacion.CONFIRMADO_TOMADO)
+    context.canceladas = TratamientoService.cancelar_notificaciones(context.tratamiento)
+
+
+@step("se eliminan (?P<cantidad>\\d+) notificaciones pendientes y el cumplimiento es (?P<porcentaje>[\\d.]+) por ciento")
+def step_impl(context, cantidad, porcentaje):
+    from tratamiento.models import EstadoNotificacion, Tratamiento
+
+    tratamiento = Tratamiento.objects.get(pk=context.tratamiento.pk)
+    assert context.canceladas == int(cantidad), f"Se esperaban {cantidad} cancelaciones, hubo {context.canceladas}"
+    assert not tratamiento.alertas.filter(estado=EstadoNotificacion.ACTIVO).exists()
+    assert not tratamiento.recordatorios.filter(estado=EstadoNotificacion.ACTIVO).exists()
+    assert tratamiento.cumplimiento == float(porcentaje), \
+        f"Se esperaba {porcentaje}%, se obtuvo {tratamiento.cumplimiento}%"
+
+
+@step("las notificaciones del tratamiento se consultan por el índice del tratamiento")
+def step_impl(context):
+    from django.db import connection
+    from tratamiento.models import Alerta, Recordatorio
+
+    for modelo in (Alerta, Recordatorio):
+        consulta = modelo.objects.filter(tratamiento_id=context.tratamiento.pk).order_by('fecha_hora')
+        plan = consulta.explain()
+        if connection.vendor == 'sqlite':
+            assert f"{modelo._meta.model_name}_trat_fh_idx" in plan, f"{modelo.__name__} no usa el índice: {plan}"
+
+
+def crear_tratamientos_con_medicamentos(context, cantidad, medicamentos):
+    from datetime import time
+    from tratamiento.models import Medicamento, Tratamiento, Recomendacion
+
+    for _ in range(cantidad):
+        episodio = crear_episodio_dummy(paciente=context.paciente.usuario, tipo_migraña='Migraña sin aura')
+        tratamiento = Tratamiento.objects.create(
+            paciente=context.paciente,
+            episodio=episodio,
+            recomendaciones=[Recomendacion.HIDRATACION],
+        )
+        tratamiento.medicamentos.add(*[
+            Medicamento.objects.create(nombre=f'Medicamento {i}', dosis='1 tableta', frecuencia_horas=8,
+                                       duracion_dias=10, hora_de_inicio=time(hour=8))
+            for i in range(medicamentos)
+        ])
+
+
+@step("que hay (?P<cantidad>\\d+) tratamientos registrados con (?P<medicamentos>\\d+) medicamentos cada uno")
+def step_impl(context, cantidad, medicamentos):
+    inicializar_contexto_basico(context)
+    crear_tratamientos_con_medicamentos(context, int(cantidad), int(medicamentos))
+    context.consultas_por_listado = []
+
+
+@step("se registran (?P<cantidad>\\d+) tratamientos más con (?P<medicamentos>\\d+) medicamentos cada uno")
+def step_impl(context, cantidad, medicamentos):
+    crear_tratamientos_con_medicamentos(context, int(cantidad), int(medicamentos))
+
+
+@step("el médico consulta el listado de tratamientos y el historial del paciente")
+def step_impl(context):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    cliente = cliente_autenticado(context.usuario_medico)
+
+    with CaptureQueriesContext(connection) as listado:
+        respuesta = cliente.get('/api/tratamientos/')
+    assert respuesta.status_code == 200, respuesta.content
+    assert any(t['medicamentos'] for t in respuesta.data['results'])
+
+    with CaptureQueriesContext(connection) as historial:
+        respuesta = cliente.get(f'/api/tratamientos/historial/{context.paciente.pk}/')
+    assert respuesta.status_code == 200, respuesta.content
+
+    context.consultas_por_listado.append((len(listado), len(historial), len(respuesta.data)))
+
+
+@step("ambas consultas ejecutan el mismo número de consultas a la base de datos")
+def step_impl(context):
+    (listado_antes, historial_antes, filas_antes), (listado_despues, historial_despues, filas_despues) = \
+        context.consultas_por_listado
+    assert filas_despues > filas_antes
+    assert listado_antes == listado_despues, f"Listado: {listado_antes} consultas y luego {listado_despues}"
+    assert historial_antes == historial_despues, f"Historial: {historial_antes} consultas y luego {historial_despues}"
+
+
+@step("el listado se resuelve con a lo sumo (?P<maximo>\\d+) consultas")
+def step_impl(context, maximo):
+    consultas = context.consultas_por_listado[-1][0]
+    assert consultas <= int(maximo), f"Se esperaban a lo sumo {maximo} consultas, se ejecutaron {consultas}"
+
+
+def cliente_con_perfilado(context, presupuesto):
+    from django.test.utils import override_settings
+
+    perfil = {
+        'ACTIVO': True,
+        'PRESUPUESTOS': {context.vista_perfilada: presupuesto},
+        'FALLAR_SI_EXCEDE': True,
+    }
+    # El middleware lee su configuración al crear el cliente
+    with override_settings(PERFIL_CONSULTAS=perfil):
+        cliente = cliente_autenticado(context.usuario_medico)
+        cliente.handler.load_middleware()
+    return cliente
+
+
+@step('el perfilado de consultas está activo con un presupuesto de (?P<presupuesto>\\d+) consultas para "(?P<vista>[^"]+)"')
+def step_impl(context, presupuesto, vista):
+    context.vista_perfilada = vista
+    context.cliente_perfilado = cliente_con_perfilado(context, int(presupuesto))
+
+
+@step("el médico consulta el listado de tratamientos con el perfilado activo")
+def step_impl(context):
+    context.respuesta = context.cliente_perfilado.get('/api/tratamientos/')
+    assert context.respuesta.status_code == 200, context.respuesta.content
+
+
+@step("la respuesta informa el número de consultas, el tiempo en SQL y el tiempo de serialización")
+def step_impl(context):
+    respuesta = context.respuesta
+    for cabecera in ('X-Perfil-Consultas', 'X-Perfil-Tiempo-Sql-Ms', 'X-Perfil-Tiempo-Serializacion-Ms',
+                     'X-Perfil-Tiempo-Total-Ms'):
+        assert cabecera in respuesta, f"Falta la cabecera {cabecera}"
+    assert 1 <= int(respuesta['X-Perfil-Consultas']) <= 3, respuesta['X-Perfil-Consultas']
+    assert float(respuesta['X-Perfil-Tiempo-Serializacion-Ms']) > 0
+
+
+@step("no se reportan consultas duplicadas")
+def step_impl(context):
+    assert context.respuesta['X-Perfil-Consultas-Duplicadas'] == '0', context.respuesta['X-Perfil-Consultas-Duplicadas']
+
+
+@step("con un presupuesto de (?P<presupuesto>\\d+) consulta la petición falla por exceder el presupuesto")
+def step_impl(context, presupuesto):
+    from migraine_app.middleware import PresupuestoConsultasExcedido, huella_consulta
+
+    cliente = cliente_con_perfilado(context, int(presupuesto))
+    try:
+        cliente.get('/api/tratamientos/')
+    except PresupuestoConsultasExcedido as error:
+        assert context.vista_perfilada in str(error)
+    else:
+        raise AssertionError("Se esperaba PresupuestoConsultasExcedido")
+
+    # Las consultas que solo difieren en sus parámetros comparten huella
+    assert huella_consulta('SELECT * FROM t WHERE id IN (%s, %s, %s) LIMIT 21') == \
+        huella_consulta('SELECT * FROM t WHERE id IN (%s) LIMIT 20')
+
+
+@step("el paciente consulta su tratamiento con su token de acceso")
+def step_impl(context):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from tratamiento.models import Tratamiento
+
+    context.tratamiento = Tratamiento.objects.filter(paciente=context.paciente).latest('id')
+    cliente = cliente_con_token(context.usuario_paciente)
+    with CaptureQueriesContext(connection) as consultas:
+        context.respuesta = cliente.get(f'/api/tratamientos/{context.tratamiento.pk}/')
+    context.consultas_detalle = len(consultas)
+
+
+@step("obtiene el tratamiento con a lo sumo (?P<maximo>\\d+) consultas a la base de datos")
+def step_impl(context, maximo):
+    assert context.respuesta.status_code == 200, context.respuesta.content
+    assert context.respuesta.data['id'] == context.tratamiento.pk
+    assert context.consultas_detalle <= int(maximo), \
+        f"Se esperaban a lo sumo {maximo} consultas, se ejecutaron {context.consultas_detalle}"
+
+
+@step("otro paciente no puede ver ese tratamiento")
+def step_impl(context):
+    propietario = context.paciente
+    inicializar_contexto_basico(context)
+    assert context.paciente.pk != propietario.pk
+
+    respuesta = cliente_con_token(context.usuario_paciente).get(f'/api/tratamientos/{context.tratamiento.pk}/')
+    assert respuesta.status_code == 403, respuesta.status_code
+
+
+@step("que hay (?P<cantidad>\\d+) alertas de tratamiento vencidas por entregar")
+def step_impl(context, cantidad):
+    from datetime import timedelta
+    from tratamiento.models import Alerta, EstadoNotificacion
+
+    # Las más antiguas posibles para que salgan primero en cada lote
+    inicio = timezone.make_aware(datetime(1990, 1, 1, 12, 0))
+    tratamiento = crear_tratamiento_para_despacho(context)
+    context.alertas_por_entregar = [
+        Alerta.objects.create(mensaje=f"Es hora de tomar Paracetamol #{i}", fecha_hora=inicio + timedelta(minutes=i),
+                              estado=EstadoNotificacion.ACTIVO, numero_alerta=1, duracion=15, tiempo_espera=15,
+                              tratamiento=tratamiento)
+        for i in range(int(cantidad))
+    ]
+
+
+@step("el despachador se ejecuta (?P<ciclos>\\d+) ciclos con lotes de (?P<lote>\\d+) y un enviador que siempre falla")
+def step_impl(context, ciclos, lote):
+    from io import StringIO
+    from unittest import mock
+    from django.core.management import call_command
+    from tratamiento.despachador import EnviadorNotificaciones
+
+    class EnviadorCaido(EnviadorNotificaciones):
+        def enviar(self, notificacion):
+            return False
+
+    comando = 'tratamiento.management.commands.despachar_notificaciones'
+    with mock.patch(f'{comando}.obtener_enviador', return_value=EnviadorCaido()), \
+            mock.patch(f'{comando}.time.sleep') as dormir:
+        call_command('despachar_notificaciones', ciclos=int(ciclos), lote=int(lote), intervalo=30, stdout=StringIO())
+    context.esperas = [llamada.args[0] for llamada in dormir.call_args_list]
+
+
+@step("entre ciclos espera (?P<esperas>[\\d, y]+) segundos")
+def step_impl(context, esperas):
+    esperadas = [float(e) for e in esperas.replace(' y ', ', ').split(', ')]
+    assert context.esperas == esperadas, f"Esperas: {context.esperas}"
+
+
+@step("las alertas siguen pendientes de envío")
+def step_impl(context):
+    from tratamiento.models import Alerta, EstadoNotificacion
+
+    for alerta in context.alertas_por_entregar:
+        alerta.refresh_from_db()
+        assert alerta.estado == EstadoNotificacion.ACTIVO, f"Estado inesperado: {alerta.estado}"
+    Alerta.objects.filter(id__in=[a.id for a in context.alertas_por_entregar]).delete()
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tratamiento.despachador import DespachadorNotificaciones, obtener_enviador
+
+
+# Tope de la espera tras ciclos en que todos los envíos fallan, en intervalos
+MAX_FACTOR_ESPERA = 16
+
+
+class Command(BaseCommand):
+    help = ("Despacha de forma continua las alertas y recordatorios de tratamiento vencidos "
+            "y los recordatorios de citas pendientes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=float, default=30.0,
+                            help='Segundos entre ciclos (por defecto 30).')
+        parser.add_argument('--lote', type=int, default=500,
+                            help='Máximo de notificaciones de cada tipo por ciclo (por defecto 500).')
+        parser.add_argument('--ciclos', type=int, default=0,
+                            help='Número de ciclos a ejecutar; 0 para ejecutar indefinidamente.')
+        parser.add_argument('--enviador',
+                            help='Ruta del enviador a usar. Por defecto, el setting NOTIFICACIONES_ENVIADOR.')
+
+    def handle(self, *args, **options):
+        despachador = DespachadorNotificaciones(obtener_enviador(options.get('enviador')), lote=options['lote'])
+        ciclos = options['ciclos']
+        verbosidad = options['verbosity']
+
+        self.stdout.write(f"Despachador iniciado con {despachador.enviador.__class__.__name__}")
+        ejecutados = 0
+        ciclos_fallidos = 0
+        try:
+            while not ciclos or ejecutados < ciclos:
+                metricas = despachador.ejecutar_ciclo()
+                ejecutados += 1
+                if verbosidad > 1 or metricas.enviadas or metricas.fallidas or metricas.escaladas:
+                    self.stdout.write(f"Ciclo {ejecutados}: {metricas.como_dict()}")
+                if ciclos and ejecutados >= ciclos:
+                    break
+
+                # Si el canal no entregó nada, las fallidas siguen pendientes: se espera cada vez más
+                # (hasta MAX_FACTOR_ESPERA intervalos) en lugar de reintentarlas en bucle
+                ciclos_fallidos = ciclos_fallidos + 1 if metricas.fallidas and not metricas.enviadas else 0
+                if ciclos_fallidos:
+                    time.sleep(options['intervalo'] * min(2 ** (ciclos_fallidos - 1), MAX_FACTOR_ESPERA))
+                # Solo si los envíos llenaron el lote quedan pendientes por entregar: se continúa sin esperar
+                elif metricas.enviadas < despachador.lote:
+                    time.sleep(options['intervalo'])
+        except KeyboardInterrupt:
+            self.stdout.write("Despachador detenido")
+
+        self.stdout.write(self.style.SUCCESS(f"Totales: {despachador.metricas.como_dict()}"))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tratamiento', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='alerta',
+            name='estado',
+            field=models.CharField(choices=[('activo', 'Activo'), ('sin_confirmar', 'Sin Confirmar'), ('tomado', 'Confirmado Tomado'), ('no_tomado', 'Confirmado No Tomado'), ('tomado_tarde', 'Confirmado Tomado Tarde'), ('tomado_muy_tarde', 'Confirmado Tomado Muy Tarde'), ('reenviada', 'Reenviada')], default='activo', max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='recordatorio',
+            name='estado',
+            field=models.CharField(choices=[('activo', 'Activo'), ('sin_confirmar', 'Sin Confirmar'), ('tomado', 'Confirmado Tomado'), ('no_tomado', 'Confirmado No Tomado'), ('tomado_tarde', 'Confirmado Tomado Tarde'), ('tomado_muy_tarde', 'Confirmado Tomado Muy Tarde'), ('reenviada', 'Reenviada')], default='activo', max_length=30),
+        ),
+    ]
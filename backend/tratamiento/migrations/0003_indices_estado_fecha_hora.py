@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tratamiento', '0002_estado_reenviada'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alerta',
+            index=models.Index(fields=['estado', 'fecha_hora'], name='alerta_estado_fh_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recordatorio',
+            index=models.Index(fields=['estado', 'fecha_hora'], name='recordatorio_estado_fh_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tratamiento', '0003_indices_estado_fecha_hora'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tratamiento',
+            name='tomas_cumplidas',
+            field=models.PositiveIntegerField(default=0, verbose_name='Tomas Cumplidas'),
+        ),
+        migrations.AddField(
+            model_name='tratamiento',
+            name='tomas_programadas',
+            field=models.PositiveIntegerField(default=0, verbose_name='Tomas Programadas'),
+        ),
+    ]
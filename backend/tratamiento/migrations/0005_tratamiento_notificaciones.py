@@ -0,0 +1,98 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:25
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+ESTADOS_CUMPLIMIENTO = ['tomado', 'tomado_tarde', 'tomado_muy_tarde']
+
+
+def vincular_notificaciones(apps, schema_editor):
+    """
+    Asigna el tratamiento a las notificaciones listadas en notificaciones_generadas.
+
+    Las listas mezclan IDs de alertas y de recordatorios, que son tablas distintas,
+    así que un mismo ID puede aparecer en las listas de varios tratamientos. Esos
+    IDs ambiguos se dejan sin tratamiento en lugar de asignarlos al azar.
+    Después se reconstruyen los contadores de cumplimiento a partir del FK.
+    """
+    Tratamiento = apps.get_model('tratamiento', 'Tratamiento')
+    Alerta = apps.get_model('tratamiento', 'Alerta')
+    Recordatorio = apps.get_model('tratamiento', 'Recordatorio')
+
+    tratamientos_por_id = defaultdict(set)
+    for tratamiento_id, ids in Tratamiento.objects.values_list('id', 'notificaciones_generadas').iterator():
+        for notificacion_id in ids or []:
+            tratamientos_por_id[notificacion_id].add(tratamiento_id)
+
+    ids_por_tratamiento = defaultdict(list)
+    for notificacion_id, tratamientos in tratamientos_por_id.items():
+        if len(tratamientos) == 1:
+            ids_por_tratamiento[tratamientos.pop()].append(notificacion_id)
+
+    for tratamiento_id, ids in ids_por_tratamiento.items():
+        for modelo in (Alerta, Recordatorio):
+            modelo.objects.filter(id__in=ids, tratamiento__isnull=True).update(tratamiento_id=tratamiento_id)
+
+    conteos = (Alerta.objects.filter(tratamiento__isnull=False)
+               .values('tratamiento_id')
+               .annotate(programadas=Count('id', filter=Q(numero_alerta=1)),
+                         cumplidas=Count('id', filter=Q(estado__in=ESTADOS_CUMPLIMIENTO))))
+    for conteo in conteos:
+        programadas, cumplidas = conteo['programadas'], conteo['cumplidas']
+        Tratamiento.objects.filter(pk=conteo['tratamiento_id']).update(
+            tomas_programadas=programadas,
+            tomas_cumplidas=cumplidas,
+            cumplimiento=round(cumplidas / programadas * 100, 2) if programadas else 0.0,
+        )
+
+
+def reconstruir_listas(apps, schema_editor):
+    """Vuelve a llenar notificaciones_generadas a partir del FK."""
+    Tratamiento = apps.get_model('tratamiento', 'Tratamiento')
+    Alerta = apps.get_model('tratamiento', 'Alerta')
+    Recordatorio = apps.get_model('tratamiento', 'Recordatorio')
+
+    ids_por_tratamiento = defaultdict(list)
+    for modelo in (Recordatorio, Alerta):
+        filas = modelo.objects.filter(tratamiento__isnull=False).order_by('id').values_list('tratamiento_id', 'id')
+        for tratamiento_id, notificacion_id in filas.iterator():
+            ids_por_tratamiento[tratamiento_id].append(notificacion_id)
+
+    for tratamiento_id, ids in ids_por_tratamiento.items():
+        Tratamiento.objects.filter(pk=tratamiento_id).update(notificaciones_generadas=ids)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tratamiento', '0004_contadores_cumplimiento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alerta',
+            name='tratamiento',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)ss', to='tratamiento.tratamiento', verbose_name='Tratamiento'),
+        ),
+        migrations.AddField(
+            model_name='recordatorio',
+            name='tratamiento',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)ss', to='tratamiento.tratamiento', verbose_name='Tratamiento'),
+        ),
+        migrations.AddIndex(
+            model_name='alerta',
+            index=models.Index(fields=['tratamiento', 'fecha_hora'], name='alerta_trat_fh_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recordatorio',
+            index=models.Index(fields=['tratamiento', 'fecha_hora'], name='recordatorio_trat_fh_idx'),
+        ),
+        migrations.RunPython(vincular_notificaciones, reconstruir_listas),
+        migrations.RemoveField(
+            model_name='tratamiento',
+            name='notificaciones_generadas',
+        ),
+    ]
@@ -1,7 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Q, Value, When
+from django.db.models.functions import Round
+from django.db.models.lookups import GreaterThan
 from django.utils import timezone
-from collections import deque
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
+import heapq
+import itertools
 import logging
 
 from usuarios.models import PacienteProfile
@@ -9,6 +13,9 @@ from evaluacion_diagnostico.models import  EpisodioCefalea
 
 logger = logging.getLogger(__name__)
 
+# Número de notificaciones por INSERT al generarlas en lote
+TAMANO_LOTE_NOTIFICACIONES = 500
+
 
 class EstadoNotificacion(models.TextChoices):
     ACTIVO = 'activo'
@@ -17,73 +24,107 @@ class EstadoNotificacion(models.TextChoices):
     CONFIRMADO_NO_TOMADO = 'no_tomado'
     CONFIRMADO_TOMADO_TARDE = 'tomado_tarde'
     CONFIRMADO_TOMADO_MUY_TARDE = 'tomado_muy_tarde'
+    REENVIADA = 'reenviada'
+
+
+# Estados que consideramos como "cumplimiento positivo"
+ESTADOS_CUMPLIMIENTO = [
+    EstadoNotificacion.CONFIRMADO_TOMADO,
+    EstadoNotificacion.CONFIRMADO_TOMADO_TARDE,
+    EstadoNotificacion.CONFIRMADO_TOMADO_MUY_TARDE,
+]
 
 
 class BicolaNotificacion:
-    """Clase separada para manejar la bicola de notificaciones"""
+    """
+    Cola de prioridad de notificaciones implementada con un montículo (heapq).
+
+    Cada elemento se ordena por (prioridad, fecha_hora): las alertas reenviadas
+    (numero_alerta > 1) y lo agregado con agregarFrente salen primero; el resto
+    sale por fecha_hora. Insertar y extraer del frente cuestan O(log n).
+    """
+    PRIORIDAD_FRENTE = 0
+    PRIORIDAD_NORMAL = 1
 
     def __init__(self):
-        self.elementos = deque()
+        # Entradas (prioridad, fecha_hora, secuencia, notificacion); la secuencia
+        # desempata en orden de llegada y evita comparar notificaciones.
+        self.elementos = []
+        self._secuencia = itertools.count()
+
+    def _prioridad(self, elemento):
+        if isinstance(elemento, Alerta) and elemento.numero_alerta > 1:
+            return self.PRIORIDAD_FRENTE
+        return self.PRIORIDAD_NORMAL
+
+    def _entrada(self, elemento, prioridad):
+        return (prioridad, elemento.fecha_hora, next(self._secuencia), elemento)
 
     def agregarFrente(self, elemento):
-        self.elementos.appendleft(elemento)
+        heapq.heappush(self.elementos, self._entrada(elemento, self.PRIORIDAD_FRENTE))
 
     def agregarFinal(self, elemento):
-        self.elementos.append(elemento)
-        self.ordenar()
+        heapq.heappush(self.elementos, self._entrada(elemento, self._prioridad(elemento)))
 
     def eliminarFrente(self):
         if self.elementos:
-            return self.elementos.popleft()
+            return heapq.heappop(self.elementos)[-1]
         return None
 
     def eliminarFinal(self):
+        # O(n): el montículo solo mantiene ordenado el frente
         if self.elementos:
-            return self.elementos.pop()
+            indice = max(range(len(self.elementos)), key=self.elementos.__getitem__)
+            entrada = self.elementos[indice]
+            self.elementos[indice] = self.elementos[-1]
+            self.elementos.pop()
+            heapq.heapify(self.elementos)
+            return entrada[-1]
         return None
 
     def verFrente(self):
-        return self.elementos[0] if self.elementos else None
+        return self.elementos[0][-1] if self.elementos else None
 
     def verFinal(self):
-        return self.elementos[-1] if self.elementos else None
+        return max(self.elementos)[-1] if self.elementos else None
 
     def estaVacia(self):
         return len(self.elementos) == 0
 
-    def ordenar(self):
-        # Importación tardía para evitar referencias circulares
-        from .models import Alerta
-
-        alertas_frente = []
-        while (len(self.elementos) > 0 and
-               isinstance(self.elementos[0], Alerta) and
-               self.elementos[0].numero_alerta > 1):
-            alertas_frente.append(self.elementos.popleft())
-
-        self.elementos = deque(sorted(self.elementos, key=lambda n: n.fecha_hora))
-
-        for alerta in reversed(alertas_frente):
-            self.elementos.appendleft(alerta)
-
     def agregar_multiples(self, elementos):
-        self.elementos.extend(elementos)
-        self.ordenar()
+        self.elementos.extend(self._entrada(e, self._prioridad(e)) for e in elementos)
+        heapq.heapify(self.elementos)
 
     def __len__(self):
         return len(self.elementos)
 
     def listar_elementos(self):
-        return list(self.elementos)
+        return [entrada[-1] for entrada in sorted(self.elementos)]
 
 
 class Notificacion(models.Model):
     mensaje = models.CharField(max_length=255)
     fecha_hora = models.DateTimeField()
     estado = models.CharField(max_length=30, choices=EstadoNotificacion.choices, default=EstadoNotificacion.ACTIVO)
+    # related_name: tratamiento.alertas / tratamiento.recordatorios
+    tratamiento = models.ForeignKey(
+        'Tratamiento',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='%(class)ss',
+        db_index=False,
+        verbose_name='Tratamiento'
+    )
 
     class Meta:
         abstract = True
+        indexes = [
+            # Consulta de notificaciones vencidas: estado = activo AND fecha_hora <= ahora
+            models.Index(fields=['estado', 'fecha_hora'], name='%(class)s_estado_fh_idx'),
+            # Notificaciones de un tratamiento en orden cronológico (también cubre el FK)
+            models.Index(fields=['tratamiento', 'fecha_hora'], name='%(class)s_trat_fh_idx'),
+        ]
 
     def enviar(self):
         raise NotImplementedError("Las subclases deben implementar este método")
@@ -110,46 +151,79 @@ class Alerta(Notificacion):
     duracion = models.IntegerField()
     tiempo_espera = models.IntegerField()
 
-    def enviar(self):
-        if self.estado == EstadoNotificacion.ACTIVO:
-            self.estado = EstadoNotificacion.SIN_CONFIRMAR
+    def asignarEstado(self, estado):
+        return self.cambiarEstado(estado)
+
+    def cambiarEstado(self, estado):
+        """
+        Cambia el estado con un UPDATE condicionado al estado leído, de modo que
+        dos cambios concurrentes sobre la misma alerta no se pisen. Si la toma
+        entra o sale de los estados cumplidos ajusta los contadores del
+        tratamiento. Devuelve False si otro proceso cambió el estado antes.
+        """
+        estado_anterior = self.estado
+        if self.pk is None:
+            self.estado = estado
             self.save()
+            return True
+
+        with transaction.atomic():
+            actualizadas = Alerta.objects.filter(pk=self.pk, estado=estado_anterior).update(estado=estado)
+            if not actualizadas:
+                self.refresh_from_db(fields=['estado'])
+                return False
+            self.estado = estado
+            diferencia = (estado in ESTADOS_CUMPLIMIENTO) - (estado_anterior in ESTADOS_CUMPLIMIENTO)
+            if diferencia and self.tratamiento_id:
+                self.tratamiento._actualizarCumplimiento(tomas_cumplidas=diferencia)
+        return True
+
+    def enviar(self):
+        if self.estado == EstadoNotificacion.ACTIVO and self.cambiarEstado(EstadoNotificacion.SIN_CONFIRMAR):
             logger.info(f"Alerta enviada: {self.mensaje} - Número: {self.numero_alerta}")
             return True
         return False
 
-    def reenviar(self, bicola):
+    def reenviar(self, bicola, ahora=None):
+        if ahora is None:
+            ahora = timezone.now()
         siguiente_numero = self.numero_alerta + 1
 
         if siguiente_numero > 3:
-            self.estado = EstadoNotificacion.CONFIRMADO_NO_TOMADO
-            self.save()
-            logger.info(f"Máximo de alertas alcanzado. Marcando como no tomado: {self.mensaje}")
+            if self.cambiarEstado(EstadoNotificacion.CONFIRMADO_NO_TOMADO):
+                logger.info(f"Máximo de alertas alcanzado. Marcando como no tomado: {self.mensaje}")
             return None
 
-        nueva_alerta = Alerta(
-            mensaje=f"{self.mensaje} (Alerta #{siguiente_numero})",
-            fecha_hora=timezone.now(),
-            estado=EstadoNotificacion.ACTIVO,
-            numero_alerta=siguiente_numero,
-            duracion=self.duracion,
-            tiempo_espera=self.tiempo_espera
-        )
-        nueva_alerta.save()
+        with transaction.atomic():
+            # La confirmación pasa a la nueva alerta; esta ya no vuelve a escalarse.
+            # Si el paciente confirmó mientras tanto, no se reenvía.
+            if not self.cambiarEstado(EstadoNotificacion.REENVIADA):
+                return None
+
+            nueva_alerta = Alerta(
+                mensaje=f"{self.mensaje} (Alerta #{siguiente_numero})",
+                fecha_hora=ahora,
+                estado=EstadoNotificacion.ACTIVO,
+                numero_alerta=siguiente_numero,
+                duracion=self.duracion,
+                tiempo_espera=self.tiempo_espera,
+                tratamiento_id=self.tratamiento_id
+            )
+            nueva_alerta.save()
 
         bicola.agregarFrente(nueva_alerta)
         logger.info(f"Nueva alerta generada: {nueva_alerta.mensaje} - Número: {nueva_alerta.numero_alerta}")
         return nueva_alerta
 
-    def haExcedidoHoraDeConfirmacion(self):
-        ahora = timezone.now()
+    def haExcedidoHoraDeConfirmacion(self, ahora=None):
+        if ahora is None:
+            ahora = timezone.now()
         tiempo_transcurrido = (ahora - self.fecha_hora).total_seconds() / 60
         return tiempo_transcurrido > self.duracion
 
     def actualizarEstadoSegunTiempo(self, ahora):
         if self.estado == EstadoNotificacion.ACTIVO:
-            self.estado = EstadoNotificacion.SIN_CONFIRMAR
-            self.save()
+            self.cambiarEstado(EstadoNotificacion.SIN_CONFIRMAR)
 
         tiempo_transcurrido = (ahora - self.fecha_hora).total_seconds() / 60
 
@@ -161,6 +235,9 @@ class Alerta(Notificacion):
 
 class Recordatorio(Notificacion):
     def enviar(self):
+        if self.estado == EstadoNotificacion.ACTIVO:
+            self.estado = EstadoNotificacion.SIN_CONFIRMAR
+            self.save()
         logger.info(f"Recordatorio enviado: {self.mensaje}")
         return True
 
@@ -194,21 +271,36 @@ class Medicamento(models.Model):
     duracion_dias = models.IntegerField()
     hora_de_inicio = models.TimeField()
 
-    def calcularFechasDeTomas(self, fecha_inicio=None):
+    ANTICIPACION_RECORDATORIO = timedelta(minutes=30)
+
+    def iterarFechasDeTomas(self, fecha_inicio=None, hasta=None):
+        """
+        Genera en orden las fechas de las tomas, sin construir la lista del
+        tratamiento completo. Se detiene en `hasta` (inclusive) si se indica;
+        debe ser naive, como las fechas generadas.
+
+        Las tomas de un día ocupan a lo sumo 24 horas desde la hora de inicio,
+        así que la secuencia ya sale ordenada aunque alguna pase al día siguiente.
+        """
         if fecha_inicio is None:
             fecha_inicio = datetime.today().date()
-        fechas_tomas = []
+        tomas_por_dia = 24 // self.frecuencia_horas
         for dia in range(self.duracion_dias):
-            fecha_actual = fecha_inicio + timedelta(days=dia)
-            tomas_por_dia = 24 // self.frecuencia_horas
+            primera_toma = datetime.combine(fecha_inicio + timedelta(days=dia), self.hora_de_inicio)
             for i in range(tomas_por_dia):
-                hora_toma = datetime.combine(fecha_actual, self.hora_de_inicio) + timedelta(
-                    hours=i * self.frecuencia_horas)
-                fechas_tomas.append(hora_toma)
-        return sorted(fechas_tomas)
+                hora_toma = primera_toma + timedelta(hours=i * self.frecuencia_horas)
+                if hasta is not None and hora_toma > hasta:
+                    return
+                yield hora_toma
+
+    def calcularFechasDeTomas(self, fecha_inicio=None):
+        return list(self.iterarFechasDeTomas(fecha_inicio))
+
+    def calcularRecordatorio(self, fecha_toma):
+        return fecha_toma - self.ANTICIPACION_RECORDATORIO
 
     def calcularRecordatorios(self, fechas_tomas):
-        return [fecha_toma - timedelta(minutes=30) for fecha_toma in fechas_tomas]
+        return [self.calcularRecordatorio(fecha_toma) for fecha_toma in fechas_tomas]
 
     def __str__(self):
         return f"{self.nombre} ({self.dosis})"
@@ -230,10 +322,12 @@ class Tratamiento(models.Model):
 
     medicamentos = models.ManyToManyField('Medicamento', blank=True, related_name='tratamientos')
     recomendaciones = models.JSONField(default=list)
-    notificaciones_generadas = models.JSONField(default=list, verbose_name='IDs de Notificaciones')
     fecha_inicio = models.DateField(default=timezone.now)
     activo = models.BooleanField(default=True)
     cumplimiento = models.FloatField(default=0.0)
+    # Contadores del cumplimiento: se actualizan con expresiones F al generar y confirmar tomas
+    tomas_programadas = models.PositiveIntegerField(default=0, verbose_name='Tomas Programadas')
+    tomas_cumplidas = models.PositiveIntegerField(default=0, verbose_name='Tomas Cumplidas')
     motivo_cancelacion = models.TextField(blank=True, null=True)
 
     def __init__(self, *args, **kwargs):
@@ -274,56 +368,70 @@ class Tratamiento(models.Model):
         self.recomendaciones.append(Recomendacion.MENSTRUACION)
         self.recomendaciones.append(Recomendacion.ANTICONCEPTIVOS)
 
-    def generarNotificaciones(self, dias_anticipacion=7):
+    def _construirNotificaciones(self, dias_anticipacion):
+        """
+        Construye en memoria, sin guardarlas, las notificaciones del tratamiento:
+        por cada toma de cada medicamento su recordatorio y su alerta, y después
+        los recordatorios de recomendaciones. Solo se recorren las tomas hasta
+        el horizonte de `dias_anticipacion` días.
+        """
         todas_notificaciones = []
         fecha_limite = None
 
         if dias_anticipacion > 0:
-            fecha_limite = timezone.now() + timedelta(days=dias_anticipacion)
+            fecha_limite = timezone.make_naive(timezone.now() + timedelta(days=dias_anticipacion))
 
         for medicamento in self.medicamentos.all():
-            fechas_tomas = medicamento.calcularFechasDeTomas(self.fecha_inicio)
-            if fecha_limite:
-                fechas_tomas = [f for f in fechas_tomas if f <= fecha_limite]
-
-            recordatorios = medicamento.calcularRecordatorios(fechas_tomas)
-
-            for fr in recordatorios:
-                r = Recordatorio(
+            # Un único recorrido de las tomas alimenta recordatorios y alertas
+            for toma in medicamento.iterarFechasDeTomas(self.fecha_inicio, hasta=fecha_limite):
+                ft = timezone.make_aware(toma)
+                todas_notificaciones.append(Recordatorio(
                     mensaje=f"Recordatorio para tomar {medicamento.nombre} ({medicamento.dosis})",
-                    fecha_hora=fr,
-                    estado=EstadoNotificacion.ACTIVO
-                )
-                r.save()
-                todas_notificaciones.append(r)
-
-            for ft in fechas_tomas:
-                a = Alerta(
+                    fecha_hora=medicamento.calcularRecordatorio(ft),
+                    estado=EstadoNotificacion.ACTIVO,
+                    tratamiento=self
+                ))
+                todas_notificaciones.append(Alerta(
                     mensaje=f"Es hora de tomar {medicamento.nombre} ({medicamento.dosis})",
                     fecha_hora=ft,
                     estado=EstadoNotificacion.ACTIVO,
                     numero_alerta=1,
                     duracion=15,
-                    tiempo_espera=15
-                )
-                a.save()
-                todas_notificaciones.append(a)
+                    tiempo_espera=15,
+                    tratamiento=self
+                ))
 
-        for rec in self.recomendaciones.all():
+        descripciones = dict(Recomendacion.choices)
+        for rec in self.recomendaciones:
             for i in range(dias_anticipacion):
                 fecha = timezone.now().date() + timedelta(days=i)
-                hora = datetime.combine(fecha, datetime.min.time().replace(hour=9))
-                r = Recordatorio(
-                    mensaje=f"Recordatorio de recomendación: {rec.descripcion}",
+                hora = timezone.make_aware(datetime.combine(fecha, time(hour=9)))
+                todas_notificaciones.append(Recordatorio(
+                    mensaje=f"Recordatorio de recomendación: {descripciones.get(rec, rec)}",
                     fecha_hora=hora,
-                    estado=EstadoNotificacion.ACTIVO
-                )
-                r.save()
-                todas_notificaciones.append(r)
+                    estado=EstadoNotificacion.ACTIVO,
+                    tratamiento=self
+                ))
 
-        # Guardar los IDs de las notificaciones generadas
-        self.notificaciones_generadas = [n.id for n in todas_notificaciones]
-        self.save()
+        return todas_notificaciones
+
+    @transaction.atomic
+    def generarNotificaciones(self, dias_anticipacion=7):
+        todas_notificaciones = self._construirNotificaciones(dias_anticipacion)
+
+        # Un INSERT por lote y por tipo en lugar de un save() por notificación
+        Recordatorio.objects.bulk_create(
+            [n for n in todas_notificaciones if isinstance(n, Recordatorio)],
+            batch_size=TAMANO_LOTE_NOTIFICACIONES
+        )
+        Alerta.objects.bulk_create(
+            [n for n in todas_notificaciones if isinstance(n, Alerta)],
+            batch_size=TAMANO_LOTE_NOTIFICACIONES
+        )
+
+        # Sumar las nuevas tomas a los contadores de cumplimiento
+        nuevas_tomas = sum(1 for n in todas_notificaciones if isinstance(n, Alerta))
+        self._actualizarCumplimiento(tomas_programadas=nuevas_tomas)
 
         logger.info(f"Generadas {len(todas_notificaciones)} notificaciones para el tratamiento.")
         return todas_notificaciones
@@ -333,11 +441,51 @@ class Tratamiento(models.Model):
         if not isinstance(notificacion, Alerta):
             logger.warning("Notificación no válida")
             return False
-        notificacion.estado = estado
-        notificacion.save()
-        # actualizar cumplimiento al confirmar
-        self.calcular_cumplimiento()
-        return True
+        if notificacion.tratamiento_id == self.pk:
+            # Los contadores se actualizan sobre esta misma instancia
+            notificacion.tratamiento = self
+        return notificacion.cambiarEstado(estado)
+
+    @staticmethod
+    def _expresionCumplimiento(cumplidas, programadas):
+        """Porcentaje de tomas cumplidas, calculado por la base de datos (0 si no hay tomas)."""
+        porcentaje = ExpressionWrapper(Value(100.0) * cumplidas / programadas, output_field=FloatField())
+        return Case(
+            When(GreaterThan(programadas, 0), then=Round(porcentaje, 2)),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+
+    def _actualizarCumplimiento(self, tomas_programadas=0, tomas_cumplidas=0):
+        """
+        Suma a los contadores y recalcula el porcentaje en un único UPDATE atómico,
+        sin recorrer las alertas del tratamiento.
+        """
+        programadas = F('tomas_programadas') + tomas_programadas
+        cumplidas = F('tomas_cumplidas') + tomas_cumplidas
+        Tratamiento.objects.filter(pk=self.pk).update(
+            tomas_programadas=programadas,
+            tomas_cumplidas=cumplidas,
+            cumplimiento=self._expresionCumplimiento(cumplidas, programadas)
+        )
+        self.refresh_from_db(fields=['tomas_programadas', 'tomas_cumplidas', 'cumplimiento'])
+
+    @transaction.atomic
+    def cancelarNotificacionesPendientes(self):
+        """
+        Elimina las alertas y recordatorios que aún no se enviaron. Las tomas
+        de las alertas eliminadas dejan de contar como programadas.
+        """
+        pendientes = {'estado': EstadoNotificacion.ACTIVO}
+        tomas_canceladas, _ = self.alertas.filter(numero_alerta=1, **pendientes).delete()
+        alertas_canceladas, _ = self.alertas.filter(**pendientes).delete()
+        recordatorios_cancelados, _ = self.recordatorios.filter(**pendientes).delete()
+        if tomas_canceladas:
+            self._actualizarCumplimiento(tomas_programadas=-tomas_canceladas)
+
+        logger.info(f"Canceladas {tomas_canceladas + alertas_canceladas + recordatorios_cancelados} "
+                    f"notificaciones pendientes del tratamiento.")
+        return tomas_canceladas + alertas_canceladas + recordatorios_cancelados
 
 
     def calcularDuracion(self):
@@ -364,14 +512,17 @@ class Tratamiento(models.Model):
         return self.bicola_notificacion.listar_elementos()
 
 
-    def procesarNotificacionesPendientes(self):
+    def procesarNotificacionesPendientes(self, ahora=None):
         if not self.estaActivo():
             logger.info(f"No se procesaron notificaciones porque el tratamiento no está activo")
             return []
 
-        ahora = timezone.now()
+        if ahora is None:
+            ahora = timezone.now()
         notificaciones_procesadas = []
 
+        # El frente de la cola es siempre la siguiente notificación: se drena sin reordenar
+
         while not self.bicola_notificacion.estaVacia():
             notificacion = self.bicola_notificacion.verFrente()
             if notificacion.esHoraDeEnvio(ahora):
@@ -382,37 +533,33 @@ class Tratamiento(models.Model):
 
                 if (isinstance(notificacion_actual, Alerta) and
                         notificacion_actual.estado == EstadoNotificacion.SIN_CONFIRMAR and
-                        notificacion_actual.haExcedidoHoraDeConfirmacion()):
-                    notificacion_actual.reenviar(self.bicola_notificacion)
+                        notificacion_actual.haExcedidoHoraDeConfirmacion(ahora)):
+                    notificacion_actual.reenviar(self.bicola_notificacion, ahora)
             else:
                 break
 
         return notificaciones_procesadas
 
     def calcular_cumplimiento(self):
-        alertas_tratamiento = Alerta.objects.filter(id__in=self.notificaciones_generadas        )
+        """
+        Recalcula desde cero los contadores de cumplimiento con una sola
+        consulta de agregación. Alerta.cambiarEstado los mantiene al día de forma
+        incremental; esto sirve para reconstruirlos.
+        """
+        conteo = self.alertas.aggregate(
+            programadas=Count('id', filter=Q(numero_alerta=1)),
+            cumplidas=Count('id', filter=Q(estado__in=ESTADOS_CUMPLIMIENTO)),
+        )
 
-        if not alertas_tratamiento.exists():
+        if not conteo['programadas']:
             return 0.0
 
-        total_alertas = alertas_tratamiento.count()
-
-        # Estados que consideramos como "cumplimiento positivo"
-        estados_cumplimiento = [
-            EstadoNotificacion.CONFIRMADO_TOMADO,
-            EstadoNotificacion.CONFIRMADO_TOMADO_TARDE,
-            EstadoNotificacion.CONFIRMADO_TOMADO_MUY_TARDE
-        ]
-
-        # Contar alertas confirmadas como tomadas (en cualquier momento)
-        alertas_cumplidas = alertas_tratamiento.filter(estado__in=estados_cumplimiento).count()
-
-        # Calcular porcentaje
-        porcentaje_cumplimiento = (alertas_cumplidas / total_alertas) * 100
+        self.tomas_programadas = conteo['programadas']
+        self.tomas_cumplidas = conteo['cumplidas']
 
-        # Actualizar el campo cumplimiento del modelo
-        self.cumplimiento = round(porcentaje_cumplimiento, 2)
-        self.save(update_fields=['cumplimiento'])
+        # Calcular porcentaje y actualizar el campo cumplimiento del modelo
+        self.cumplimiento = round((self.tomas_cumplidas / self.tomas_programadas) * 100, 2)
+        self.save(update_fields=['tomas_programadas', 'tomas_cumplidas', 'cumplimiento'])
 
         return self.cumplimiento
 
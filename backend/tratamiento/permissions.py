@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from usuarios.permissions import obtener_perfil_id
+
 
 class EsMedico(permissions.BasePermission):
     """
@@ -12,7 +14,7 @@ class EsMedico(permissions.BasePermission):
         return (
             user.is_authenticated and
             user.tipo_usuario == 'medico' and
-            hasattr(user, 'perfil_medico')
+            obtener_perfil_id(user, 'perfil_medico') is not None
         )
 
 
@@ -24,7 +26,7 @@ class EsPaciente(permissions.BasePermission):
 
     def has_permission(self, request, view):
         user = request.user
-        return user.is_authenticated and hasattr(user, 'perfil_paciente')
+        return user.is_authenticated and obtener_perfil_id(user, 'perfil_paciente') is not None
 
 
 class EsPropietarioDelTratamientoOPersonalMedico(permissions.BasePermission):
@@ -40,12 +42,13 @@ class EsPropietarioDelTratamientoOPersonalMedico(permissions.BasePermission):
             return False
 
         # El personal médico tiene permiso para ver cualquier tratamiento
-        if hasattr(user, 'perfil_medico'):
+        if obtener_perfil_id(user, 'perfil_medico') is not None:
             return True
 
-        # Si es paciente, verificar si es el propietario del tratamiento
-        if hasattr(user, 'perfil_paciente'):
-            return obj.paciente.usuario == user  # Nota el acceso a usuario aquí
+        # Si es paciente, verificar si es el propietario del tratamiento (por ID, sin cargar el paciente)
+        perfil_paciente_id = obtener_perfil_id(user, 'perfil_paciente')
+        if perfil_paciente_id is not None:
+            return obj.paciente_id == perfil_paciente_id
 
         return False
 
@@ -62,12 +65,13 @@ class EsPropietarioDelMedicamentoOPersonalMedico(permissions.BasePermission):
             return False
 
         # El personal médico puede ver cualquier medicamento
-        if hasattr(user, 'perfil_medico'):
+        if obtener_perfil_id(user, 'perfil_medico') is not None:
             return True
 
         # Si es paciente, verificar si el medicamento pertenece a sus tratamientos
-        if hasattr(user, 'perfil_paciente'):
-            return obj.tratamientos.filter(paciente__usuario=user).exists()
+        perfil_paciente_id = obtener_perfil_id(user, 'perfil_paciente')
+        if perfil_paciente_id is not None:
+            return obj.tratamientos.filter(paciente_id=perfil_paciente_id).exists()
 
         return False
 
@@ -80,10 +84,10 @@ class PuedeConfirmarToma(permissions.BasePermission):
 
     def has_permission(self, request, view):
         user = request.user
-        return user.is_authenticated and hasattr(user, 'perfil_paciente')
+        return user.is_authenticated and obtener_perfil_id(user, 'perfil_paciente') is not None
 
     def has_object_permission(self, request, view, obj):
-        user = request.user
-        if hasattr(user, 'perfil_paciente'):
-            return obj.paciente.usuario == user
+        perfil_paciente_id = obtener_perfil_id(request.user, 'perfil_paciente')
+        if perfil_paciente_id is not None:
+            return obj.paciente_id == perfil_paciente_id
         return False
@@ -1,7 +1,10 @@
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
+from django.db.models import DateTimeField, DurationField, ExpressionWrapper, F, IntegerField, Value
 from django.utils import timezone
-from tratamiento.models import Medicamento, Tratamiento, Recordatorio, Alerta, EstadoNotificacion
+from tratamiento.models import (
+    Medicamento, Tratamiento, Recordatorio, Alerta, EstadoNotificacion, TAMANO_LOTE_NOTIFICACIONES
+)
 
 class BaseRepository(ABC):
     @abstractmethod
@@ -60,6 +63,28 @@ class BaseRepository(ABC):
     def get_notificaciones_pendientes(self, tratamiento_id, fecha_hora=None):
         pass
 
+    @abstractmethod
+    def get_notificaciones_vencidas(self, fecha_hora=None, limite=None):
+        """Alertas y recordatorios activos de los tratamientos activos con fecha_hora vencida, en orden."""
+        pass
+
+    @abstractmethod
+    def get_alertas_por_escalar(self, fecha_hora=None, limite=None):
+        """
+        Alertas enviadas sin confirmar, de tratamientos activos, cuyo tiempo de
+        confirmación ya pasó, de la más antigua a la más reciente.
+        """
+        pass
+
+    def save_notificaciones(self, notificaciones):
+        """Guarda varias notificaciones. Por defecto, una a una."""
+        for notificacion in notificaciones:
+            if isinstance(notificacion, Recordatorio):
+                self.save_recordatorio(notificacion)
+            elif isinstance(notificacion, Alerta):
+                self.save_alerta(notificacion)
+        return notificaciones
+
 
 class DjangoRepository(BaseRepository):
     def get_medicamento_by_id(self, id):
@@ -97,10 +122,7 @@ class DjangoRepository(BaseRepository):
         return False
 
     def get_recordatorios_by_tratamiento(self, tratamiento_id):
-        tratamiento = self.get_tratamiento_by_id(tratamiento_id)
-        if tratamiento:
-            return tratamiento.recordatorios.all()
-        return []
+        return Recordatorio.objects.filter(tratamiento_id=tratamiento_id)
 
     def get_recordatorio_by_id(self, id):
         try:
@@ -119,33 +141,89 @@ class DjangoRepository(BaseRepository):
             return None
 
     def get_alertas_by_tratamiento(self, tratamiento_id):
-        tratamiento = self.get_tratamiento_by_id(tratamiento_id)
-        if tratamiento:
-            return tratamiento.alertas.all()
-        return []
+        return Alerta.objects.filter(tratamiento_id=tratamiento_id)
 
     def save_alerta(self, alerta):
         alerta.save()
         return alerta
 
+    def save_notificaciones(self, notificaciones):
+        """Inserta en lote las notificaciones que aún no están guardadas."""
+        for modelo in (Recordatorio, Alerta):
+            nuevas = [n for n in notificaciones if isinstance(n, modelo) and n.pk is None]
+            modelo.objects.bulk_create(nuevas, batch_size=TAMANO_LOTE_NOTIFICACIONES)
+        return notificaciones
+
+    # Columnas comunes del UNION; las propias de Alerta van como NULL en los recordatorios
+    CAMPOS_NOTIFICACION = ['id', 'mensaje', 'fecha_hora', 'estado', 'tratamiento_id']
+    CAMPOS_ALERTA = ['numero_alerta', 'duracion', 'tiempo_espera']
+
+    def _vencidas_ordenadas(self, alertas, recordatorios, fecha_hora, limite=None):
+        """
+        Une en una sola consulta (UNION ALL) las alertas y recordatorios activos
+        vencidos, ordenados por fecha_hora en la base de datos, y los devuelve
+        como instancias de su modelo. Usa los índices (estado, fecha_hora).
+        """
+        vencidas = {'estado': EstadoNotificacion.ACTIVO, 'fecha_hora__lte': fecha_hora}
+        columnas_alerta = {f'_{campo}': F(campo) for campo in self.CAMPOS_ALERTA}
+        columnas_nulas = {f'_{campo}': Value(None, output_field=IntegerField()) for campo in self.CAMPOS_ALERTA}
+        columnas = self.CAMPOS_NOTIFICACION + ['_tipo'] + list(columnas_alerta)
+
+        consulta_alertas = (alertas.filter(**vencidas).order_by()
+                            .annotate(_tipo=Value('alerta'), **columnas_alerta)
+                            .values_list(*columnas))
+        consulta_recordatorios = (recordatorios.filter(**vencidas).order_by()
+                                  .annotate(_tipo=Value('recordatorio'), **columnas_nulas)
+                                  .values_list(*columnas))
+        union = consulta_alertas.union(consulta_recordatorios, all=True).order_by('fecha_hora', '_tipo', 'id')
+        if limite:
+            union = union[:limite]
+
+        campos_alerta = self.CAMPOS_NOTIFICACION + self.CAMPOS_ALERTA
+        notificaciones = []
+        for fila in union:
+            n = len(self.CAMPOS_NOTIFICACION)
+            comunes, tipo, propios = fila[:n], fila[n], fila[n + 1:]
+            if tipo == 'alerta':
+                notificaciones.append(Alerta.from_db(union.db, campos_alerta, comunes + propios))
+            else:
+                notificaciones.append(Recordatorio.from_db(union.db, self.CAMPOS_NOTIFICACION, comunes))
+        return notificaciones
+
     def get_notificaciones_pendientes(self, tratamiento_id, fecha_hora=None):
         if fecha_hora is None:
             fecha_hora = timezone.now()
 
-        tratamiento = self.get_tratamiento_by_id(tratamiento_id)
-        if tratamiento:
-            alertas = list(tratamiento.alertas.filter(
-                estado=EstadoNotificacion.ACTIVO,
-                fecha_hora__lte=fecha_hora
-            ))
+        # Rango del índice (tratamiento, fecha_hora) de cada tabla
+        return self._vencidas_ordenadas(Alerta.objects.filter(tratamiento_id=tratamiento_id),
+                                        Recordatorio.objects.filter(tratamiento_id=tratamiento_id),
+                                        fecha_hora)
+
+    def get_notificaciones_vencidas(self, fecha_hora=None, limite=None):
+        if fecha_hora is None:
+            fecha_hora = timezone.now()
+
+        # Las notificaciones sin tratamiento (datos heredados) o de tratamientos inactivos no se envían.
+        # El JOIN al tratamiento se resuelve por su clave primaria; el rango sigue en (estado, fecha_hora)
+        de_tratamiento_activo = {'tratamiento__activo': True}
+        return self._vencidas_ordenadas(Alerta.objects.filter(**de_tratamiento_activo),
+                                        Recordatorio.objects.filter(**de_tratamiento_activo),
+                                        fecha_hora, limite)
 
-            recordatorios = list(tratamiento.recordatorios.filter(
-                estado=EstadoNotificacion.ACTIVO,
-                fecha_hora__lte=fecha_hora
-            ))
+    def get_alertas_por_escalar(self, fecha_hora=None, limite=None):
+        if fecha_hora is None:
+            fecha_hora = timezone.now()
 
-            return sorted(alertas + recordatorios, key=lambda x: x.fecha_hora)
-        return []
+        # Fin del plazo de confirmación (fecha_hora + duracion minutos), calculado en la base de datos
+        plazo = ExpressionWrapper(F('duracion') * Value(timedelta(minutes=1)), output_field=DurationField())
+        vence = ExpressionWrapper(F('fecha_hora') + plazo, output_field=DateTimeField())
+        alertas = (Alerta.objects
+                   .filter(estado=EstadoNotificacion.SIN_CONFIRMAR, fecha_hora__lte=fecha_hora,
+                           tratamiento__activo=True)
+                   .annotate(vence=vence)
+                   .filter(vence__lt=fecha_hora)
+                   .order_by('fecha_hora', 'id'))
+        return list(alertas[:limite] if limite else alertas)
 
 
 class FakeRepository(BaseRepository):
@@ -246,4 +324,33 @@ class FakeRepository(BaseRepository):
             and r.fecha_hora <= fecha_hora
         ]
 
-        return sorted(alertas + recordatorios, key=lambda x: x.fecha_hora)
\ No newline at end of file
+        return sorted(alertas + recordatorios, key=lambda x: x.fecha_hora)
+
+    def _de_tratamiento_activo(self, notificacion):
+        tratamiento = self.tratamientos.get(notificacion.tratamiento_id)
+        return tratamiento is not None and tratamiento.activo
+
+    def get_notificaciones_vencidas(self, fecha_hora=None, limite=None):
+        if fecha_hora is None:
+            fecha_hora = timezone.now()
+
+        vencidas = sorted(
+            (n for n in list(self.alertas.values()) + list(self.recordatorios.values())
+             if n.estado == EstadoNotificacion.ACTIVO and n.fecha_hora <= fecha_hora
+             and self._de_tratamiento_activo(n)),
+            key=lambda x: x.fecha_hora
+        )
+        return vencidas[:limite] if limite else vencidas
+
+    def get_alertas_por_escalar(self, fecha_hora=None, limite=None):
+        if fecha_hora is None:
+            fecha_hora = timezone.now()
+
+        por_escalar = sorted(
+            (a for a in self.alertas.values()
+             if a.estado == EstadoNotificacion.SIN_CONFIRMAR
+             and (fecha_hora - a.fecha_hora) > timedelta(minutes=a.duracion)
+             and self._de_tratamiento_activo(a)),
+            key=lambda a: a.fecha_hora
+        )
+        return por_escalar[:limite] if limite else por_escalar
@@ -113,4 +113,4 @@ class TratamientoSerializer(serializers.ModelSerializer):
         ]
     @extend_schema_field(serializers.CharField())
     def get_recomendaciones(self, obj):
-        return [str(r) for r in obj.recomendaciones.all()]
+        return [str(r) for r in obj.recomendaciones]
@@ -59,14 +59,15 @@ class TratamientoService:
             return []
 
         notificaciones = tratamiento.generarNotificaciones(fecha_actual)
-        for notificacion in notificaciones:
-            if isinstance(notificacion, Recordatorio):
-                self.repository.save_recordatorio(notificacion)
-            elif isinstance(notificacion, Alerta):
-                self.repository.save_alerta(notificacion)
+        self.repository.save_notificaciones(notificaciones)
 
         return notificaciones
 
+    @staticmethod
+    def cancelar_notificaciones(tratamiento):
+        """Cancelar las notificaciones aún no enviadas de un tratamiento cancelado o modificado"""
+        return tratamiento.cancelarNotificacionesPendientes()
+
     def procesar_notificaciones_pendientes(self, tratamiento_id, ahora=None):
         """Procesar notificaciones pendientes"""
         if ahora is None:
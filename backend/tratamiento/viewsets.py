@@ -44,6 +44,21 @@ class TratamientoViewSet(viewsets.ModelViewSet):
         else:  # list, retrieve, seguimiento, historial
             return [EsPropietarioDelTratamientoOPersonalMedico()]
 
+    def get_queryset(self):
+        """
+        Carga de una vez las relaciones que usa el serializer de cada acción,
+        para que el número de consultas no dependa del tamaño de la página.
+        """
+        queryset = super().get_queryset()
+        if self.action == 'historial':
+            # TratamientoResumenSerializer: str(episodio) usa episodio.paciente
+            return queryset.select_related('episodio__paciente')
+        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+            return queryset
+        # TratamientoSerializer / TratamientoCancelarSerializer: paciente_nombre usa paciente.usuario
+        # y se listan los medicamentos (el permiso de objeto solo compara paciente_id)
+        return queryset.select_related('paciente__usuario').prefetch_related('medicamentos')
+
     def perform_create(self, serializer):
         serializer.save()
 
@@ -71,7 +86,7 @@ class TratamientoViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], url_path='historial/(?P<paciente_id>[^/.]+)')
     def historial(self, request, paciente_id=None):
-        tratamientos = Tratamiento.objects.filter(paciente_id=paciente_id).order_by('-fecha_inicio')
+        tratamientos = self.get_queryset().filter(paciente_id=paciente_id)
         serializer = self.get_serializer(tratamientos, many=True)
         return Response(serializer.data)
 
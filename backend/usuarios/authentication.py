@@ -0,0 +1,130 @@
+# usuarios/authentication.py
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import Usuario
+
+# Perfiles (relaciones uno a uno inversas) que consultan los permisos
+PERFILES = ('perfil_medico', 'perfil_paciente', 'perfil_enfermera')
+
+PERFIL_POR_TIPO = {
+    Usuario.TipoUsuario.MEDICO: 'perfil_medico',
+    Usuario.TipoUsuario.PACIENTE: 'perfil_paciente',
+    Usuario.TipoUsuario.ENFERMERA: 'perfil_enfermera',
+}
+
+
+class JWTAuthenticationConPerfil(JWTAuthentication):
+    """
+    Igual que JWTAuthentication, pero carga el usuario con sus perfiles en
+    la misma consulta (select_related). Así los permisos que revisan
+    perfil_medico / perfil_paciente no hacen una consulta por cada perfil.
+    DRF guarda el usuario en la petición, por lo que se carga una sola vez.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        try:
+            user = (self.user_model.objects
+                    .select_related(*PERFILES)
+                    .get(**{api_settings.USER_ID_FIELD: user_id}))
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+
+class UsuarioToken(TokenUser):
+    """
+    Usuario ligero construido con los claims del token (ver
+    usuarios.tokens.RefreshTokenConPerfil), sin consultar la base de datos.
+    Expone el rol y el ID del perfil; cualquier otro atributo carga el
+    Usuario completo la primera vez que se pide.
+    """
+
+    @cached_property
+    def id(self):
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def pk(self):
+        return self.id
+
+    @cached_property
+    def tipo_usuario(self):
+        return self.token.get('tipo_usuario')
+
+    @cached_property
+    def genero(self):
+        return self.token.get('genero')
+
+    @property
+    def es_medico(self):
+        return self.tipo_usuario == Usuario.TipoUsuario.MEDICO
+
+    @property
+    def es_paciente(self):
+        return self.tipo_usuario == Usuario.TipoUsuario.PACIENTE
+
+    @property
+    def es_enfermera(self):
+        return self.tipo_usuario == Usuario.TipoUsuario.ENFERMERA
+
+    def perfil_id(self, nombre):
+        """ID del perfil indicado ('perfil_paciente', ...) o None si el usuario no es de ese tipo."""
+        if PERFIL_POR_TIPO.get(self.tipo_usuario) == nombre:
+            return self.token.get('perfil_id')
+        return None
+
+    @cached_property
+    def usuario(self):
+        """Usuario completo, cargado solo si la vista lo necesita."""
+        return Usuario.objects.select_related(*PERFILES).get(pk=self.pk)
+
+    def __getattr__(self, nombre):
+        if nombre.startswith('_'):
+            raise AttributeError(nombre)
+        return getattr(self.usuario, nombre)
+
+    def __eq__(self, other):
+        if isinstance(other, Usuario):
+            return self.pk == other.pk
+        return super().__eq__(other)
+
+    def __hash__(self):
+        return hash(self.pk)
+
+
+class JWTAuthenticationSinEstado(JWTAuthenticationConPerfil):
+    """
+    Autenticación sin consultas para las vistas de solo lectura que solo
+    necesitan el ID y el rol del usuario. Los tokens emitidos antes de incluir
+    los claims del perfil se resuelven con la base de datos.
+
+    Como JWTStatelessUserAuthentication, no comprueba is_active en cada
+    petición: un usuario desactivado conserva el acceso hasta que caduque su
+    token de acceso.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        if 'tipo_usuario' not in validated_token:
+            return super().get_user(validated_token)
+        return UsuarioToken(validated_token)
@@ -1,6 +1,30 @@
 # usuarios/permissions.py
 from rest_framework import permissions
 
+
+def obtener_perfil(user, nombre):
+    """
+    Devuelve el perfil del usuario ('perfil_medico', 'perfil_paciente' o
+    'perfil_enfermera') o None si no lo tiene. El resultado se memoriza en el
+    usuario: Django no guarda en caché una relación inversa inexistente, así
+    que cada hasattr() sobre ella repetiría la consulta.
+    """
+    perfiles = user.__dict__.setdefault('_perfiles', {})
+    if nombre not in perfiles:
+        perfiles[nombre] = getattr(user, nombre, None)
+    return perfiles[nombre]
+
+
+def obtener_perfil_id(user, nombre):
+    """ID del perfil del usuario, o None. Con un UsuarioToken sale del token, sin consultas."""
+    from .authentication import UsuarioToken
+
+    if isinstance(user, UsuarioToken):
+        return user.perfil_id(nombre)
+    perfil = obtener_perfil(user, nombre)
+    return perfil.pk if perfil is not None else None
+
+
 class EsMedico(permissions.BasePermission):
     """Solo médicos pueden acceder"""
     def has_permission(self, request, view):
@@ -0,0 +1,27 @@
+# usuarios/tokens.py
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+class RefreshTokenConPerfil(RefreshToken):
+    """
+    Token de refresco que incluye el rol del usuario como claims. El token
+    de acceso derivado (y los que se obtienen al refrescar) los copia, lo que
+    permite a JWTAuthenticationSinEstado resolver al usuario sin consultas.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        perfil = user.perfil_especifico
+        token['tipo_usuario'] = user.tipo_usuario
+        token['genero'] = user.genero
+        token['perfil_id'] = perfil.pk if perfil is not None else None
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        return token
+
+
+class TokenObtainPairConPerfilSerializer(TokenObtainPairSerializer):
+    """Login (/api/auth/jwt/create/) que emite tokens con los claims del perfil."""
+    token_class = RefreshTokenConPerfil
@@ -0,0 +1,34 @@
+"""
+Utilidades compartidas por los steps de Behave de todas las apps.
+
+El host 'testserver' del cliente de pruebas se habilita una sola vez en
+before_all (ver `habilitar_cliente_de_pruebas`). Las importaciones de DRF
+son locales porque los steps se cargan antes de configurar Django.
+"""
+
+
+def habilitar_cliente_de_pruebas():
+    """Permite las peticiones del cliente de pruebas de DRF (host 'testserver')."""
+    from django.conf import settings
+
+    if 'testserver' not in settings.ALLOWED_HOSTS:
+        settings.ALLOWED_HOSTS.append('testserver')
+
+
+def cliente_autenticado(usuario):
+    """Cliente de la API autenticado directamente como `usuario`."""
+    from rest_framework.test import APIClient
+
+    cliente = APIClient()
+    cliente.force_authenticate(user=usuario)
+    return cliente
+
+
+def cliente_con_token(usuario):
+    """Cliente de la API que envía un token de acceso JWT de `usuario`."""
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    cliente = APIClient()
+    cliente.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(usuario).access_token}")
+    return cliente